@@ -0,0 +1,253 @@
+# alerts.py
+# Inventory alert engine: reorder, minimum stock and turnover alerts kept in
+# the `alerts` table instead of being recomputed from the whole catalog (and
+# rewritten to alert_cache.json) on every poll.
+#
+# The write paths in database.py call mark_materials() on the same cursor as
+# the write; that appends to alert_material_changes, which is insert-only so
+# concurrent writers never conflict on it. evaluate() then re-runs the
+# material rules for just the materials logged since the last run, plus one
+# full sweep per day, after reorder.ensure_plan() has moved the reorder
+# points to the new day. Turnover is re-evaluated when the stock rollup
+# version changes.
+#
+# Each alert has a stable key ('reorder:<material id>', 'turnover:2024-05'),
+# so first_seen survives message changes (the stock level in the text) and
+# resolved_at records when the condition cleared. /api/all-alerts reads the
+# open rows: its cost depends on the number of alerts, not on the catalog.
+import threading
+from datetime import date, datetime
+
+from .connection import cursor as db_cursor
+from . import periods, reorder, rollups
+
+# Categories in the order /api/all-alerts lists them
+CATEGORIES = ("Turnover", "Reorder", "Minimum Stock")
+MATERIAL_CATEGORIES = ("Reorder", "Minimum Stock")
+
+MINIMUM_STOCK_BUFFER = 1.2   # warn within 20% above the minimum
+
+# One evaluation at a time; polls arriving meanwhile serve the table as is
+_lock = threading.Lock()
+
+
+def mark_materials(cur, material_ids):
+    """Queue the given materials for re-evaluation. Call on the write's cursor, before COMMIT."""
+    ids = [material_ids] if isinstance(material_ids, str) else list(dict.fromkeys(material_ids))
+    if not ids:
+        return
+    cur.execute(
+        "INSERT INTO alert_material_changes (material_id) SELECT UNNEST(?)",
+        (ids,)
+    )
+
+
+# --- Rules -------------------------------------------------------------------
+
+# Reorder points come from the daily reorder plan (reorder.py)
+_MATERIAL_RULES = """
+    SELECT
+        m.id,
+        i.item_name,
+        m.current_stock,
+        m.minimum_stock,
+        rp.avg_daily_usage,
+        rp.reorder_point
+    FROM materials m
+    JOIN items i ON m.item_id = i.id
+    LEFT JOIN reorder_plan rp ON rp.material_id = m.id
+    WHERE m.id IN ({scope})
+"""
+
+_TURNOVER_RULE = """
+    WITH monthly_data AS (
+        SELECT
+            r.month AS period,
+            SUM(CASE WHEN stt.type_code = 'stock-in' THEN r.total_quantity * m.material_cost ELSE 0 END) AS stock_in_value,
+            SUM(CASE WHEN stt.type_code = 'stock-out' THEN r.total_quantity * m.material_cost ELSE 0 END) AS cogs,
+            SUM(r.line_count * m.current_stock * m.material_cost) AS ending_inventory_value
+        FROM stock_movement_monthly_rollup r
+        JOIN stock_transaction_types stt ON stt.id = r.stock_type_id
+        JOIN materials m ON m.id = r.material_id
+        WHERE {since}
+        GROUP BY period
+    )
+    SELECT
+        STRFTIME(period, '%Y-%m') AS label,
+        ROUND(
+            CASE
+                WHEN ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0) > 0
+                THEN cogs / ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0)
+                ELSE 0
+            END, 2
+        ) AS turnover_rate
+    FROM monthly_data
+    ORDER BY label
+"""
+
+
+def _material_alerts(rows):
+    """(alert_key, category, subject_id, message) for each material row that trips a rule."""
+    found = []
+    for material_id, item, stock, minimum, avg_daily_usage, reorder_point in rows:
+        # Materials without usage in the planning window get no reorder alert
+        if avg_daily_usage and stock <= reorder_point:
+            found.append((
+                f"reorder:{material_id}", "Reorder", material_id,
+                f"⚠️ {item}: Stock is low ({stock}) – Reorder point is {round(reorder_point, 2)}"
+            ))
+
+        if stock < minimum:
+            message = f"⚡️ {item}: Stock is {stock}, below minimum of {minimum} – Stocking is needed."
+        elif stock < minimum * MINIMUM_STOCK_BUFFER:
+            message = f"🔶 {item}: Stock is {stock}, nearing minimum ({minimum}) – Monitor."
+        else:
+            continue
+        found.append((f"minimum_stock:{material_id}", "Minimum Stock", material_id, message))
+    return found
+
+
+def _turnover_alerts(rows):
+    found = []
+    for label, rate in rows:
+        if rate < 1:
+            message = f"⚠️ {label}: Low turnover rate ({rate}) – Review excess stock."
+        elif rate > 5:
+            message = f"⚠️ {label}: High turnover rate ({rate}) – Stock might run out fast."
+        else:
+            message = f"✅ {label}: Turnover rate is normal ({rate})."
+        found.append((f"turnover:{label}", "Turnover", label, message))
+    return found
+
+
+# --- State -------------------------------------------------------------------
+
+def _store(cur, found, now, categories, subjects_sql="TRUE", subject_params=()):
+    """
+    Upsert the alerts in `found` and resolve the open alerts of `categories`
+    (limited to `subjects_sql`) that are no longer in it. An alert that
+    comes back after being resolved starts a new first_seen.
+    """
+    if found:
+        cur.executemany("""
+            INSERT INTO alerts (alert_key, category, subject_id, message, first_seen, last_seen)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (alert_key) DO UPDATE SET
+                message = EXCLUDED.message,
+                first_seen = CASE WHEN resolved_at IS NULL THEN first_seen ELSE EXCLUDED.first_seen END,
+                last_seen = EXCLUDED.last_seen,
+                resolved_at = NULL
+        """, [(*alert, now, now) for alert in found])
+
+    cur.execute(f"""
+        UPDATE alerts SET resolved_at = ?
+        WHERE resolved_at IS NULL
+          AND list_contains(?, category)
+          AND NOT list_contains(?, alert_key)
+          AND {subjects_sql}
+    """, (now, list(categories), [alert[0] for alert in found], *subject_params))
+
+
+def _evaluate_materials(cur, now, full: bool, through_seq):
+    if full:
+        scope, params = "SELECT id FROM materials", []
+        subjects_sql = "TRUE"
+    else:
+        scope, params = "SELECT material_id FROM alert_material_changes WHERE seq <= ?", [through_seq]
+        subjects_sql = f"subject_id IN ({scope})"
+
+    rows = cur.execute(_MATERIAL_RULES.format(scope=scope), params).fetchall()
+    _store(cur, _material_alerts(rows), now, MATERIAL_CATEGORIES, subjects_sql, params)
+
+
+def _evaluate_turnover(cur, now):
+    # The alert window is the months starting within the last month
+    since, params = periods.range_sql("r.month", periods.trailing(months=1, now=now))
+    rows = cur.execute(_TURNOVER_RULE.format(since=since), params).fetchall()
+    _store(cur, _turnover_alerts(rows), now, ("Turnover",))
+
+
+def evaluate(cur=None, full: bool = False):
+    """
+    Bring the alerts table up to date: re-run the material rules for the
+    materials changed since the last run (all of them on the first run of a
+    day, or with `full`), and the turnover rule when stock moved.
+    Returns True if anything was evaluated.
+    """
+    if cur is None:
+        with db_cursor() as cur:
+            return evaluate(cur, full)
+
+    with _lock:
+        now = datetime.now()
+        last_full_run, stock_version = cur.execute(
+            "SELECT last_full_run, stock_version FROM alert_engine_state WHERE id = 1"
+        ).fetchone()
+        through_seq = cur.execute("SELECT MAX(seq) FROM alert_material_changes").fetchone()[0]
+        current_stock_version = rollups.data_version("stock", cur)[0]
+
+        full = full or last_full_run != date.today()
+        if not full and through_seq is None and stock_version == current_stock_version:
+            return False
+        if full:
+            reorder.ensure_plan(cur)
+
+        cur.execute("BEGIN")
+        try:
+            if full or through_seq is not None:
+                _evaluate_materials(cur, now, full, through_seq)
+            _evaluate_turnover(cur, now)
+
+            # Rows from writes that commit after this transaction started are
+            # invisible here, so they stay queued for the next run
+            if through_seq is not None:
+                cur.execute("DELETE FROM alert_material_changes WHERE seq <= ?", (through_seq,))
+            cur.execute("""
+                UPDATE alert_engine_state
+                SET last_run = ?, stock_version = ?,
+                    last_full_run = CASE WHEN ? THEN CAST(? AS DATE) ELSE last_full_run END
+                WHERE id = 1
+            """, (now, current_stock_version, full, now))
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        return True
+
+
+def current_alerts(cur=None):
+    """
+    Open alerts grouped by category, in the /api/all-alerts shape:
+    {"Turnover": [{id, message, timestamp}], "Reorder": [{id, message, timestamp, display_time}], ...}
+    """
+    if cur is None:
+        with db_cursor() as cur:
+            return current_alerts(cur)
+
+    rows = cur.execute("""
+        SELECT alert_key, category, subject_id, message, first_seen
+        FROM alerts
+        WHERE resolved_at IS NULL
+        ORDER BY category, first_seen, alert_key
+    """).fetchall()
+
+    grouped = {category: [] for category in CATEGORIES}
+    for alert_key, category, subject_id, message, first_seen in rows:
+        if category == "Turnover":
+            # Turnover alerts describe a month, so they show the month
+            month = datetime.strptime(subject_id, "%Y-%m")
+            grouped[category].append({"id": alert_key, "message": message, "timestamp": month.strftime("%b %Y")})
+        else:
+            grouped.setdefault(category, []).append({
+                "id": alert_key,
+                "message": message,
+                "timestamp": first_seen.strftime("%Y-%m-%d %H:%M:%S"),
+                "display_time": first_seen.strftime("%b %d %Y %H:%M")
+            })
+    return grouped
+
+
+if __name__ == "__main__":
+    evaluate(full=True)
+    for category, items in current_alerts().items():
+        print(f"{category}: {len(items)} open")
@@ -1,35 +1,11 @@
-import duckdb
-from datetime import datetime
+import copy
 import os
-import shutil
-
-# con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-# con = duckdb.connect('backend/db_timestock')
-
-REPO_DB_PATH = "backend/db_timestock1"
-
-# If running locally, use a local file
-if os.environ.get("RAILWAY") == "1":
-    # Production (Railway) path: the mounted volume
-    DB_PATH = "/data/db_timestock1"
-else:
-    # Local path
-    DB_PATH = "backend/db_timestock1"
-
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-# Copy starter DB if it doesn't exist yet
-if not os.path.exists(DB_PATH):
-    if os.path.exists(REPO_DB_PATH):
-        shutil.copy(REPO_DB_PATH, DB_PATH)
-        print(f"Copied starter DB to {DB_PATH}")
-    else:
-        print(f"No starter DB found at {REPO_DB_PATH}. A new DB will be created.")
-
+import threading
+import time
+from datetime import datetime
 
-# Connect to DuckDB
-con = duckdb.connect(DB_PATH)
-print(f"Connected to DB at {DB_PATH}")
+from .connection import cursor
+from . import periods
 
 # Alerts
 def get_minimum_stock_alerts():
@@ -42,8 +18,7 @@ def get_minimum_stock_alerts():
         JOIN items i ON m.item_id = i.id
     """
 
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
+    with cursor() as conn:
         df = conn.execute(query).fetchdf()
 
     alerts = []
@@ -61,134 +36,24 @@ def get_minimum_stock_alerts():
 
 
 def get_low_stock_alerts():
-    return con.execute("""
-        SELECT 
-            i.id AS item_id,
-            i.item_name,
-            i.item_decription,
-            m.current_stock,
-            m.minimum_stock,
-            m.unit_measurement,
-            m.supplier_id
-        FROM materials m
-        JOIN items i ON m.item_id = i.id
-        WHERE m.current_stock <= m.minimum_stock
-    """).fetchdf().to_dict(orient="records")
-
-# Total number of materials
-def get_total_materials():
-    return con.execute("SELECT COUNT(*) AS total_materials FROM materials").fetchone()[0]
-
-# Total number of products
-def get_total_products():
-    return con.execute("SELECT COUNT(*) AS total_products FROM products").fetchone()[0]
-
-# Materials below minimum stock
-def get_low_stock_materials():
-    return con.execute("""
-        SELECT COUNT(*) AS low_stock_materials 
-        FROM materials 
-        WHERE current_stock < minimum_stock
-    """).fetchone()[0]
-
-# Materials out of stock
-def get_out_of_stock_materials():
-    return con.execute("""
-        SELECT COUNT(*) AS out_of_stock 
-        FROM materials 
-        WHERE current_stock <= 0
-    """).fetchone()[0]
-
-# Total inventory value
-def get_total_inventory_value():
-    return con.execute("""
-        SELECT SUM(current_stock * material_cost) AS total_inventory_value
-        FROM materials
-    """).fetchone()[0]
-
-# Top 5 used materials in the last 30 days
-def get_top_used_materials():
-    return con.execute("""
-        SELECT 
-            i.item_name,
-            SUM(oi.quantity * pm.used_quantity) AS total_used
-        FROM order_items oi
-        JOIN product_materials pm ON oi.product_id = pm.product_id
-        JOIN materials m ON pm.material_id = m.id
-        JOIN items i ON m.item_id = i.id
-        JOIN order_transactions ot ON ot.id = oi.order_id
-        WHERE ot.date_created >= NOW() - INTERVAL 30 DAY
-        GROUP BY i.item_name
-        ORDER BY total_used DESC
-        LIMIT 5
-    """).fetchdf()
-
-# Material category distribution
-def get_material_category_distribution():
-    return con.execute("""
-        SELECT 
-            c.category_name,
-            COUNT(m.id) AS material_count
-        FROM materials m
-        JOIN items i ON m.item_id = i.id
-        JOIN material_categories c ON i.category_id = c.id
-        GROUP BY c.category_name
-    """).fetchdf()
-
-def get_total_orders() -> int:
-    return con.execute("SELECT COUNT(*) FROM order_transactions").fetchone()[0]
-
-def get_total_sales() -> int:
-    return con.execute("SELECT SUM(quantity) FROM order_items").fetchone()[0] or 0
-
-def get_total_revenue() -> float:
-    return con.execute("SELECT SUM(total_amount) FROM order_transactions").fetchone()[0] or 0.0
-
-def get_all_time_metrics(): 
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    query = """
-    SELECT 
-        COUNT(DISTINCT ot.id) AS total_orders,
-        SUM(oi.quantity) AS total_sales,
-        SUM(ot.total_amount) AS total_revenue
-    FROM order_transactions ot
-    LEFT JOIN order_items oi ON ot.id = oi.order_id
-    WHERE ot.status_id = 'OS005'
-    """
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={'motherduck_token': MOTHERDUCK_TOKEN}) as conn:
-        result = con.execute(query).fetchone()
-
-    return {
-        "total_orders": result[0],
-        "total_sales": result[1],
-        "total_revenue": result[2]
-    }
-
-
-#SUMMARIES
-def get_sales_summary():
-    return {
-        "total_orders": get_total_orders(),
-        "total_sales": get_total_sales(),
-        "total_revenue": get_total_revenue()
-    }
-
-def get_inventory_summary():
-    return {
-        "total_materials": get_total_materials(),
-        "total_products": get_total_products(),
-        "low_stock_materials": get_low_stock_materials(),
-        "out_of_stock_materials": get_out_of_stock_materials(),
-        "total_inventory_value": get_total_inventory_value(),
-        "top_used_materials": get_top_used_materials().to_dict(orient="records"),
-        "material_category_distribution": get_material_category_distribution().to_dict(orient="records")
-    }
+    with cursor() as cur:
+        return cur.execute("""
+            SELECT 
+                i.id AS item_id,
+                i.item_name,
+                i.item_decription,
+                m.current_stock,
+                m.minimum_stock,
+                m.unit_measurement,
+                m.supplier_id
+            FROM materials m
+            JOIN items i ON m.item_id = i.id
+            WHERE m.current_stock <= m.minimum_stock
+        """).fetchdf().to_dict(orient="records")
 
 def get_fast_moving_ratings_map():
-    query = """
+    since, params = periods.range_sql("ot.date_created", periods.trailing(months=3, month_start=True))
+    query = f"""
     SELECT 
         i.item_name,
         ROUND(
@@ -201,180 +66,313 @@ def get_fast_moving_ratings_map():
     JOIN materials m ON m.id = pm.material_id
     JOIN items i ON i.id = m.item_id
     JOIN order_transactions ot ON ot.id = oi.order_id
-    WHERE ot.date_created >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL 3 MONTH)
+    WHERE {since}
     GROUP BY i.item_name
     """
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
-        df = conn.execute(query).fetchdf()
+    with cursor() as conn:
+        df = conn.execute(query, params).fetchdf()
     
     return {row["item_name"]: row["fast_moving_rating"] for _, row in df.iterrows()}
 
 
-def get_total_products():
-    return con.execute("SELECT COUNT(*) FROM products").fetchone()[0] or 0
+# Dashboard snapshot: every KPI card in one document, one scan per base table.
+# Computed at most once per SNAPSHOT_TTL_SECONDS; the summary endpoints below
+# all read slices of it.
+SNAPSHOT_TTL_SECONDS = float(os.environ.get("DASHBOARD_SNAPSHOT_TTL", 30))
 
-def get_most_used_product():
-    row = con.execute("""
-        SELECT
-            i.item_name,
-            SUM(oi.quantity) AS total_used
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        JOIN items AS i ON p.item_id = i.id
-        JOIN order_transactions ot ON ot.id = oi.order_id
-        WHERE ot.date_created >= NOW() - INTERVAL 30 DAY
-        GROUP BY i.item_name
-        ORDER BY total_used DESC
-        LIMIT 1
-    """).fetchone()
-    return {"item_name": row[0], "total_sold": row[1]} if row else {"item_name": None, "total_sold": 0}
-
-def get_highest_revenue_product():
-    row = con.execute("""
-        SELECT
-            i.item_name,
-            SUM(oi.quantity * oi.unit_price) AS revenue
-        FROM order_items AS oi
-        JOIN products p ON oi.product_id = p.id
-        JOIN items i ON p.item_id = i.id
-        JOIN order_transactions ot ON oi.order_id= ot.id
-        JOIN order_statuses os ON ot.status_id = os.id
-        WHERE ot.date_created >= NOW() - INTERVAL 30 DAY AND os.status_code = 'completed'
-        GROUP BY p.id, i.item_name
-        ORDER BY revenue DESC
-        LIMIT 1;
-    """).fetchone()
-    return {"item_name": row[0], "revenue": row[1]} if row else {"item_name": None, "revenue": 0}
-
-def get_total_in_production():
-    return con.execute("""
-        SELECT COUNT(*) 
-        FROM order_transactions ot
-        JOIN order_statuses os ON os.id = ot.status_id
-        WHERE os.status_code = 'in_production'
-    """).fetchone()[0] or 0
+_snapshot = None
+_snapshot_at = 0.0
+_snapshot_lock = threading.Lock()
 
+SUMMARY_PERIODS = ("week", "month", "year")
 
-def get_product_usage_summary():
+
+def _materials_snapshot(cur):
+    # One pass over materials; the ROLLUP row carries the totals
+    rows = cur.execute("""
+        SELECT
+            GROUPING(c.category_name) AS is_total,
+            c.category_name,
+            COUNT(*) AS material_count,
+            COUNT(*) FILTER (WHERE m.current_stock < m.minimum_stock) AS low_stock_materials,
+            COUNT(*) FILTER (WHERE m.current_stock <= 0) AS out_of_stock_materials,
+            SUM(m.current_stock * m.material_cost) AS total_inventory_value,
+            COALESCE(SUM(m.current_stock), 0) AS total_material_quantity
+        FROM materials m
+        LEFT JOIN items i ON m.item_id = i.id
+        LEFT JOIN material_categories c ON i.category_id = c.id
+        GROUP BY ROLLUP (c.category_name)
+    """).fetchall()
+    total = next(row for row in rows if row[0] == 1)
     return {
-        "total_product_quantity": get_total_products(),
-        "most_used_product": get_most_used_product(),
-        "highest_revenue_product": get_highest_revenue_product(),
-        "in_production_count": get_total_in_production()
+        "total_materials": total[2],
+        "low_stock_materials": total[3],
+        "out_of_stock_materials": total[4],
+        "total_inventory_value": total[5],
+        "total_material_quantity": total[6],
+        "material_category_distribution": [
+            {"category_name": row[1], "material_count": row[2]}
+            for row in rows if row[0] == 0 and row[1] is not None
+        ],
+    }
 
+
+def _orders_snapshot(cur):
+    # One pass over orders (items pre-summed per order, so revenue is counted
+    # once per order); completed = OS005
+    period_columns = ",\n".join(
+        f"""
+            COUNT(*) FILTER (WHERE {p}_done) AS {p}_orders,
+            COALESCE(SUM(quantity) FILTER (WHERE {p}_done), 0) AS {p}_sales,
+            COALESCE(SUM(total_amount) FILTER (WHERE {p}_done), 0) AS {p}_revenue"""
+        for p in SUMMARY_PERIODS
+    )
+    period_flags, params = [], []
+    for p in SUMMARY_PERIODS:
+        in_period, bounds = periods.range_sql("ot.date_created", periods.period_range(p))
+        period_flags.append(f"""
+                ot.status_id = 'OS005' AND oi.order_id IS NOT NULL AND {in_period} AS {p}_done""")
+        params += bounds
+    period_flags = ",".join(period_flags)
+    row = cur.execute(f"""
+        WITH orders AS (
+            SELECT
+                ot.status_id,
+                os.status_code,
+                ot.total_amount,
+                oi.quantity,
+                {period_flags}
+            FROM order_transactions ot
+            LEFT JOIN order_statuses os ON ot.status_id = os.id
+            LEFT JOIN (
+                SELECT order_id, SUM(quantity) AS quantity
+                FROM order_items
+                GROUP BY order_id
+            ) oi ON ot.id = oi.order_id
+        )
+        SELECT
+            COUNT(*) AS total_orders,
+            COALESCE(SUM(quantity), 0) AS total_sales,
+            COALESCE(SUM(total_amount), 0) AS total_revenue,
+            COUNT(*) FILTER (WHERE status_id = 'OS005') AS completed_orders,
+            SUM(quantity) FILTER (WHERE status_id = 'OS005') AS completed_sales,
+            SUM(total_amount) FILTER (WHERE status_id = 'OS005') AS completed_revenue,
+            COUNT(*) FILTER (WHERE status_code = 'in_production') AS in_production_count,
+            {period_columns}
+        FROM orders
+    """, params).fetchone()
+    cards = {}
+    for i, period in enumerate(SUMMARY_PERIODS):
+        orders, sales, revenue = row[7 + 3 * i: 10 + 3 * i]
+        cards[period] = {
+            "total_orders": int(orders or 0),
+            "total_sales": int(sales or 0),
+            "total_revenue": float(revenue or 0.0),
+        }
+    return {
+        "sales": {"total_orders": row[0], "total_sales": row[1], "total_revenue": row[2]},
+        "completed": {"total_orders": row[3], "total_sales": row[4], "total_revenue": row[5]},
+        "in_production_count": row[6],
+        "period_cards": cards,
     }
 
 
-def get_stock_summary():
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+def _product_sales_snapshot(cur):
+    # One pass over the last 30 days of order lines
+    since, params = periods.range_sql("ot.date_created", periods.trailing(days=30, now=datetime.now()))
+    row = cur.execute(f"""
+        WITH recent AS MATERIALIZED (
+            SELECT
+                oi.product_id,
+                i.item_name,
+                oi.quantity,
+                oi.quantity * oi.unit_price AS revenue,
+                os.status_code
+            FROM order_items oi
+            JOIN order_transactions ot ON ot.id = oi.order_id
+            JOIN products p ON oi.product_id = p.id
+            JOIN items i ON p.item_id = i.id
+            LEFT JOIN order_statuses os ON ot.status_id = os.id
+            WHERE {since}
+        )
+        SELECT
+            (
+                SELECT STRUCT_PACK(item_name := item_name, total_sold := SUM(quantity))
+                FROM recent
+                GROUP BY item_name
+                ORDER BY SUM(quantity) DESC
+                LIMIT 1
+            ) AS most_used_product,
+            (
+                SELECT STRUCT_PACK(item_name := item_name, revenue := SUM(revenue))
+                FROM recent
+                WHERE status_code = 'completed'
+                GROUP BY product_id, item_name
+                ORDER BY SUM(revenue) DESC
+                LIMIT 1
+            ) AS highest_revenue_product,
+            (
+                SELECT LIST(STRUCT_PACK(item_name := item_name, total_used := total_used) ORDER BY total_used DESC)
+                FROM (
+                    SELECT mi.item_name, SUM(r.quantity * pm.used_quantity) AS total_used
+                    FROM recent r
+                    JOIN product_materials pm ON r.product_id = pm.product_id
+                    JOIN materials m ON pm.material_id = m.id
+                    JOIN items mi ON m.item_id = mi.id
+                    GROUP BY mi.item_name
+                    ORDER BY total_used DESC
+                    LIMIT 5
+                )
+            ) AS top_used_materials
+    """, params).fetchone()
+    return {
+        "most_used_product": row[0] or {"item_name": None, "total_sold": 0},
+        "highest_revenue_product": row[1] or {"item_name": None, "revenue": 0},
+        "top_used_materials": row[2] or [],
+    }
 
-    query = """
-        WITH stock_totals AS (
-            SELECT 
+
+def _stock_snapshot(cur):
+    # One pass over the last 3 months of stock lines: last month's flow and
+    # top supplier, and the most used (stock-out) material over 3 months
+    last_month, month_params = periods.range_sql(
+        "st.date_created", (periods.trailing(months=1)[0], periods.period_range("day")[1])
+    )
+    since, since_params = periods.range_sql("st.date_created", periods.trailing(months=3))
+    row = cur.execute(f"""
+        WITH recent AS MATERIALIZED (
+            SELECT
+                {last_month} AS last_month,
+                st.stock_type_id,
                 stt.type_code,
-                SUM(sti.quantity) AS total_qty
-            FROM stock_transaction_items sti
-            JOIN stock_transactions st ON st.id = sti.stock_transaction_id
-            JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
-		        WHERE st.date_created >= CURRENT_DATE - INTERVAL '1 month'
-		        AND st.date_created < CURRENT_DATE + INTERVAL '1 day'
-            GROUP BY stt.type_code
-        ),
-        supplier_totals AS (
-            SELECT 
                 s.contact_name,
-                SUM(sti.quantity) AS total_supplied
+                sti.material_id,
+                sti.quantity
             FROM stock_transaction_items sti
             JOIN stock_transactions st ON st.id = sti.stock_transaction_id
-            JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
-            JOIN suppliers s ON s.id = st.supplier_id
-            WHERE stt.type_code = 'stock-in'
-                AND st.date_created >= CURRENT_DATE - INTERVAL '1 month'
-                AND st.date_created < CURRENT_DATE + INTERVAL '1 day'
-            GROUP BY s.contact_name
-            ORDER BY total_supplied DESC
-            LIMIT 1
+            LEFT JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
+            LEFT JOIN suppliers s ON s.id = st.supplier_id
+            WHERE {since}
         )
-        SELECT 
-            COALESCE((SELECT total_qty FROM stock_totals WHERE type_code = 'stock-in'), 0) AS stock_in,
-            COALESCE((SELECT total_qty FROM stock_totals WHERE type_code = 'stock-out'), 0) AS stock_out,
-            COALESCE((SELECT total_qty FROM stock_totals WHERE type_code = 'stock-in'), 0) 
-              - COALESCE((SELECT total_qty FROM stock_totals WHERE type_code = 'stock-out'), 0) AS net_flow,
-            (SELECT contact_name FROM supplier_totals) AS top_supplier,
-            (SELECT total_supplied FROM supplier_totals) AS top_supplier_total
-    """
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={'motherduck_token': MOTHERDUCK_TOKEN}) as conn:
-        result = con.execute(query).fetchone()
-
+        SELECT
+            COALESCE(SUM(quantity) FILTER (WHERE last_month AND type_code = 'stock-in'), 0) AS stock_in,
+            COALESCE(SUM(quantity) FILTER (WHERE last_month AND type_code = 'stock-out'), 0) AS stock_out,
+            (
+                SELECT STRUCT_PACK(contact_name := contact_name, total_supplied := SUM(quantity))
+                FROM recent
+                WHERE last_month AND type_code = 'stock-in' AND contact_name IS NOT NULL
+                GROUP BY contact_name
+                ORDER BY SUM(quantity) DESC
+                LIMIT 1
+            ) AS top_supplier,
+            (
+                SELECT STRUCT_PACK(item_name := i.item_name, total_used := SUM(r.quantity))
+                FROM recent r
+                JOIN materials m ON r.material_id = m.id
+                JOIN items i ON m.item_id = i.id
+                WHERE r.stock_type_id = 'STT002'
+                GROUP BY m.id, i.item_name
+                ORDER BY SUM(r.quantity) DESC
+                LIMIT 1
+            ) AS most_used_material
+        FROM recent
+    """, month_params + since_params).fetchone()
+    top_supplier = row[2] or {"contact_name": None, "total_supplied": None}
     return {
-        "stock_in": result[0],
-        "stock_out": result[1],
-        "net_flow": result[2],
-        "top_supplier": result[3],
-        "top_supplier_total": result[4],
+        "stock_flow": {
+            "stock_in": row[0],
+            "stock_out": row[1],
+            "net_flow": row[0] - row[1],
+            "top_supplier": top_supplier["contact_name"],
+            "top_supplier_total": top_supplier["total_supplied"],
+        },
+        "most_used_material": row[3] or {"item_name": None, "total_used": 0},
     }
 
-# Orders
-def get_summary_cards(period: str):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
 
-    if period not in ('week', 'month', 'year'):
-        period = 'week'
+def _build_dashboard_snapshot():
+    with cursor() as cur:
+        materials = _materials_snapshot(cur)
+        orders = _orders_snapshot(cur)
+        product_sales = _product_sales_snapshot(cur)
+        stock = _stock_snapshot(cur)
+        total_products = cur.execute("SELECT COUNT(*) FROM products").fetchone()[0] or 0
 
-    query = f"""
-        SELECT 
-            COUNT(DISTINCT ot.id) AS total_orders,
-            SUM(oi.quantity) AS total_sales,
-            SUM(ot.total_amount) AS total_revenue
-        FROM order_transactions ot
-        JOIN order_items oi ON ot.id = oi.order_id
-        WHERE DATE_TRUNC('{period}', ot.date_created) = DATE_TRUNC('{period}', CURRENT_DATE)
-          AND ot.status_id = 'OS005'
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "inventory": {
+            "total_materials": materials["total_materials"],
+            "total_products": total_products,
+            "low_stock_materials": materials["low_stock_materials"],
+            "out_of_stock_materials": materials["out_of_stock_materials"],
+            "total_inventory_value": materials["total_inventory_value"],
+            "top_used_materials": product_sales["top_used_materials"],
+            "material_category_distribution": materials["material_category_distribution"],
+        },
+        "sales": orders["sales"],
+        "completed": orders["completed"],
+        "period_cards": orders["period_cards"],
+        "products": {
+            "total_product_quantity": total_products,
+            "most_used_product": product_sales["most_used_product"],
+            "highest_revenue_product": product_sales["highest_revenue_product"],
+            "in_production_count": orders["in_production_count"],
+        },
+        "materials": {
+            "total_materials": materials["total_materials"],
+            "most_used_material": stock["most_used_material"],
+            "total_material_quantity": materials["total_material_quantity"],
+        },
+        "stock_flow": stock["stock_flow"],
+        "recent_transactions": get_recent_order_transactions(),
+    }
+
+
+def get_dashboard_snapshot():
+    """
+    All dashboard KPI cards as one JSON-ready dict, cached for
+    SNAPSHOT_TTL_SECONDS. Callers get their own copy.
     """
+    global _snapshot, _snapshot_at
+    with _snapshot_lock:
+        if _snapshot is None or time.monotonic() - _snapshot_at > SNAPSHOT_TTL_SECONDS:
+            _snapshot = _build_dashboard_snapshot()
+            _snapshot_at = time.monotonic()
+        return copy.deepcopy(_snapshot)
 
-    result = con.execute(query).fetchone()
 
-    return {
-        "total_orders": int(result[0] or 0),
-        "total_sales": int(result[1] or 0),
-        "total_revenue": float(result[2] or 0.0),
-    }
+def invalidate_dashboard_snapshot():
+    """Drop the cached snapshot so the next read rebuilds it."""
+    global _snapshot
+    with _snapshot_lock:
+        _snapshot = None
 
 
-def get_total_materials():
-    return con.execute ("SELECT COUNT(*) FROM materials").fetchone()[0] or 0
+#SUMMARIES
+def get_all_time_metrics():
+    return get_dashboard_snapshot()["completed"]
 
-def get_most_used_material():
-    row = con.execute("""
-       SELECT
-            i.item_name,
-            SUM(sti.quantity) AS total_used
-        FROM stock_transaction_items sti
-        JOIN stock_transactions st ON sti.stock_transaction_id = st.id
-        JOIN materials m ON sti.material_id = m.id
-        JOIN items i ON m.item_id = i.id
-        WHERE st.date_created >= CURRENT_DATE - INTERVAL '3 months'
-        AND st.stock_type_id = 'STT002'  
-        GROUP BY m.id, i.item_name
-        ORDER BY total_used DESC
-        LIMIT 1;
+def get_sales_summary():
+    return get_dashboard_snapshot()["sales"]
 
-    """).fetchone()
-    return {"item_name": row[0],"total_used": row[1]} if row else {"item_name": None, "total_used": 0}
+def get_inventory_summary():
+    return get_dashboard_snapshot()["inventory"]
 
-def get_total_material_quantity():
-    return con.execute ("SELECT SUM(current_stock) FROM materials").fetchone()[0] or 0
+def get_product_usage_summary():
+    return get_dashboard_snapshot()["products"]
 
 def get_material_usage_summary():
-    return {
-        "total_materials": get_total_materials(),
-        "most_used_material": get_most_used_material(),
-        "total_material_quantity": get_total_material_quantity()
-    }
+    return get_dashboard_snapshot()["materials"]
+
+def get_stock_summary():
+    return get_dashboard_snapshot()["stock_flow"]
+
+# Orders
+def get_summary_cards(period: str):
+    if period not in SUMMARY_PERIODS:
+        period = 'week'
+    return get_dashboard_snapshot()["period_cards"][period]
+
 
 def get_recent_order_transactions(limit=5):
     query = f"""
@@ -384,7 +382,15 @@ def get_recent_order_transactions(limit=5):
             ot.total_amount,
             GROUP_CONCAT(DISTINCT i.item_name, ', ') AS product_names,
             os.status_code
-        FROM order_transactions ot
+        FROM (
+            -- Pick the newest orders first so only their items are aggregated
+            SELECT ot.*
+            FROM order_transactions ot
+            JOIN customers c ON ot.customer_id = c.id
+            JOIN order_statuses os ON ot.status_id = os.id
+            ORDER BY ot.date_created DESC
+            LIMIT {limit}
+        ) ot
         JOIN customers c ON ot.customer_id = c.id
         JOIN order_statuses os ON ot.status_id = os.id
         LEFT JOIN order_items oi ON ot.id = oi.order_id
@@ -392,10 +398,10 @@ def get_recent_order_transactions(limit=5):
         LEFT JOIN items i ON p.item_id = i.id
         GROUP BY ot.id, c.firstname, c.lastname, ot.total_amount, os.status_code, ot.date_created
         ORDER BY ot.date_created DESC
-        LIMIT {limit}
     """
 
-    df = con.execute(query).fetchdf()
+    with cursor() as cur:
+        df = cur.execute(query).fetchdf()
 
     # Convert timestamps to string
     df['date_created'] = df['date_created'].astype(str)
@@ -1,12 +1,13 @@
 from typing import List, Any, Optional
-from argon2 import PasswordHasher
-from fastapi import APIRouter, Depends, HTTPException, Header,Request,Form
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi import APIRouter, Depends, HTTPException, Header,Request,Form, UploadFile, File, Query
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse, Response
+from starlette.concurrency import run_in_threadpool
 from tempfile import NamedTemporaryFile
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 import pandas as pd
-import uuid
 import os, json
+import shutil
+import duckdb
 
 from backend.auth import get_current_user, verify_token
 from .app_schemas import (
@@ -15,13 +16,13 @@ from .app_schemas import (
     MaterialCreate, MaterialUpdate, OrderStatusUpdate, EmployeeCreate,
     CustomerCreate, CustomerUpdate, ReceiptRequest, QuotationRequest,
     ProductCreate, ProductUpdate,StockTransactionCreate,ProductMaterialBulkCreate,
-    SupplierCreate, SupplierUpdate, ProductMaterialCreate, OrderTransactionCreate,
+    SupplierCreate, SupplierUpdate, SupplierLeadTimeUpdate, ProductMaterialCreate, OrderTransactionCreate, OrderBulkCreate,
     AdminCreate, AdminRead
 )
 
-from backend import database, receipt, graphs, analytics
+from backend import database, receipt, graphs, analytics, auth_service, alerts, events, stl_batch, report_store, reports, report_batch, logo_store
+from backend.responses import records_response
 router = APIRouter()
-ph = PasswordHasher()
 
 
 @router.put("/products/update") 
@@ -75,99 +76,25 @@ def update_material_api(request: Request, material: MaterialUpdate) -> Any:
         raise HTTPException(status_code=500, detail="Internal server error: " + str(e))
     
 # ---- Alerts ---
-CACHE_FILE = "alert_cache.json"
-
-# Load cache from file
-if os.path.exists(CACHE_FILE):
-    with open(CACHE_FILE, "r") as f:
-        alert_cache = json.load(f)
-        # Only convert to pd.Timestamp for Reorder/Minimum Stock, NOT Turnover
-        for cat in ["Reorder", "Minimum Stock"]:
-            for key, ts in alert_cache.get(cat, {}).items():
-                try:
-                    alert_cache[cat][key] = pd.Timestamp(ts)
-                except:
-                    alert_cache[cat][key] = pd.Timestamp.now()
-else:
-    alert_cache = {"Turnover": {}, "Reorder": {}, "Minimum Stock": {}}
-
 @router.get("/all-alerts")
 def get_all_alerts():
-    now = pd.Timestamp.now()
-    alerts = {"Turnover": [], "Reorder": [], "Minimum Stock": []}
-
-    # --- Turnover Alerts ---
-    _, turnover_df, _ = graphs.get_turnover_combined_graph()
-    turnover_msgs = set()
-    if "label" in turnover_df.columns:
-        turnover_df['label_date'] = pd.to_datetime(turnover_df['label'], format='%Y-%m')
-        recent_df = turnover_df[turnover_df['label_date'] >= (now - pd.DateOffset(months=1))]
-
-        for _, row in recent_df.iterrows():
-            label = row['label']
-            rate = row['turnover_rate']
-
-            if rate < 1:
-                msg = f"⚠️ {label}: Low turnover rate ({rate}) – Review excess stock."
-            elif rate > 5:
-                msg = f"⚠️ {label}: High turnover rate ({rate}) – Stock might run out fast."
-            else:
-                msg = f"✅ {label}: Turnover rate is normal ({rate})."
-
-            formatted_timestamp = row['label_date'].strftime("%b %Y")
-            timestamp = alert_cache["Turnover"].get(msg, formatted_timestamp)
-            alert_cache["Turnover"][msg] = timestamp
-
-            alerts["Turnover"].append({
-                "message": msg,
-                "timestamp": timestamp,
-            })
-            turnover_msgs.add(msg)
-
-    # Invalidate old Turnover cache entries not present now
-    alert_cache["Turnover"] = {k: v for k, v in alert_cache["Turnover"].items() if k in turnover_msgs}
-
-    # --- Reorder Alerts ---
-    reorder_msgs = set()
-    reorder_df = graphs.get_reorder_point_chart(return_df=True)
-    if reorder_df is not None:
-        for _, row in reorder_df.iterrows():
-            if row['reorder_status'] == '⚠️ Reorder Needed':
-                msg = f"⚠️ {row['item_name']}: Stock is low ({row['current_stock']}) – Reorder point is {row['reorder_point']}"
-                timestamp = alert_cache["Reorder"].get(msg, now)
-                alert_cache["Reorder"][msg] = timestamp
-
-                alerts["Reorder"].append({
-                    "message": msg,
-                    "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "display_time": timestamp.strftime("%b %d %Y %H:%M")
-                })
-                reorder_msgs.add(msg)
-
-    alert_cache["Reorder"] = {k: v for k, v in alert_cache["Reorder"].items() if k in reorder_msgs}
-
-    # --- Minimum Stock Alerts ---
-    minstock_msgs = set()
-    min_stock_alerts = analytics.get_minimum_stock_alerts()
-    for item in min_stock_alerts:
-        msg = str(item[1]) if isinstance(item, tuple) and len(item) == 2 else str(item)
-        timestamp = alert_cache["Minimum Stock"].get(msg, now)
-        alert_cache["Minimum Stock"][msg] = timestamp
-
-        alerts["Minimum Stock"].append({
-            "message": msg,
-            "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            "display_time": timestamp.strftime("%b %d %Y %H:%M")
-        })
-        minstock_msgs.add(msg)
-
-    alert_cache["Minimum Stock"] = {k: v for k, v in alert_cache["Minimum Stock"].items() if k in minstock_msgs}
-
-    # --- Persist cache ---
-    with open(CACHE_FILE, "w") as f:
-        json.dump({cat: {k: str(v) for k,v in alert_cache[cat].items()} for cat in alert_cache}, f)
-
-    return {"alerts": alerts}
+    # Re-evaluates only the materials changed since the last poll, then
+    # serves the open alerts from the alerts table
+    try:
+        alerts.evaluate()
+    except duckdb.Error as e:
+        # e.g. a write conflict; the table still holds the last evaluation
+        print(f"Alert evaluation failed: {e}")
+    return {"alerts": alerts.current_alerts()}
+
+@router.get("/events")
+def event_stream(request: Request, last_event_id: Optional[str] = Header(None)):
+    # Server-sent alert and KPI updates; see events.py for the event types
+    return StreamingResponse(
+        events.stream(last_event_id, request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 @router.get("/low-stock-alerts")
 def low_stock_alerts():
@@ -348,25 +275,86 @@ def stock_materials_endpoint(
     return database.stock_materials(data_dict)
 
 
+# Supplier delivery manifests: extension -> import format
+STOCK_MANIFEST_FORMATS = {
+    ".csv": "csv",
+    ".jsonl": "jsonl",
+    ".ndjson": "jsonl",
+    ".json": "json",
+    ".parquet": "parquet",
+}
+
+@router.post("/stock-materials/bulk")
+def import_stock_manifest(
+    request: Request,
+    file: UploadFile = File(...),
+    authorization: Optional[str] = Header(default=None)
+):
+    user = None
+    if authorization and authorization.startswith("Bearer "):
+        token = authorization.split(" ")[1]
+        user = verify_token(token)
+    if not user:
+        user = request.session.get("user")
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    if user['role'] not in ('admin', 'employee'):
+        raise HTTPException(status_code=403, detail="Invalid user role")
+
+    suffix = os.path.splitext(file.filename or "")[1].lower()
+    file_format = STOCK_MANIFEST_FORMATS.get(suffix)
+    if not file_format:
+        raise HTTPException(status_code=400, detail="Manifest must be a .csv, .json, .jsonl or .parquet file")
+
+    # Spool the upload to disk so DuckDB can stream it instead of holding it in memory
+    with NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        shutil.copyfileobj(file.file, tmp)
+        tmp_path = tmp.name
+
+    try:
+        result = database.import_stock_manifest(
+            tmp_path,
+            file_format,
+            admin_id=user['id'] if user['role'] == 'admin' else None,
+            employee_id=user['id'] if user['role'] == 'employee' else None,
+        )
+    except (ValueError, duckdb.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid stock manifest: {e}")
+    finally:
+        os.remove(tmp_path)
+
+    if not result["success"]:
+        return JSONResponse(status_code=400, content=result)
+    return result
+
+
 @router.get("/stock-transactions")
-def read_stock_transactions():
-    return database.get_stock_transactions_detailed().to_dict(orient="records")
+def read_stock_transactions(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    stock_type: Optional[str] = None,
+    supplier_id: Optional[str] = None,
+    material_id: Optional[str] = None,
+    q: Optional[str] = None
+):
+    df, next_cursor = database.get_stock_transactions_detailed(
+        cursor=cursor, limit=limit, date_from=date_from, date_to=date_to,
+        stock_type=stock_type, supplier_id=supplier_id, material_id=material_id, q=q
+    )
+    return records_response(request, df, "items", next_cursor=next_cursor)
 
 @router.get("/materials")
-def get_materials():
-    # Get materials as a list of dicts
+def get_materials(request: Request):
     materials_df = database.get_material()
-    materials = materials_df.to_dict(orient="records")
-
-    # Get the fast moving ratings by item_name
-    ratings_map = analytics.get_fast_moving_ratings_map()  # function defined below
 
-    # Add the rating to each material
-    for mat in materials:
-        item_name = mat.get("item_name")
-        mat["fast_moving_rating"] = ratings_map.get(item_name, 0.0)
+    # Add the fast moving rating of each material, by item_name
+    ratings_map = analytics.get_fast_moving_ratings_map()
+    materials_df["fast_moving_rating"] = materials_df["item_name"].map(ratings_map).fillna(0.0)
 
-    return materials
+    return records_response(request, materials_df)
  
 
 
@@ -396,8 +384,8 @@ def delete_material(id: str, request: Request):
 
 # --- Customers ---
 @router.get("/customers")
-def get_customers():
-    return database.get_customers().to_dict(orient="records")
+def get_customers(request: Request):
+    return records_response(request, database.get_customers())
 
 @router.post("/customers") #  
 def create_customer(request: Request, data: CustomerCreate):
@@ -441,8 +429,8 @@ def get_product_quote(product_id: str):
         raise HTTPException(status_code=500, detail=str(e))
         
 @router.get("/products")
-def get_products():
-    return database.get_products().to_dict(orient="records")
+def get_products(request: Request):
+    return records_response(request, database.get_products())
 
 @router.post("/products") #  
 def create_product(request: Request, data: ProductCreate):
@@ -479,8 +467,8 @@ def delete_product(request: Request, id: str):
 
 # --- Suppliers ---
 @router.get("/suppliers")
-def get_suppliers():
-    return database.get_suppliers().to_dict(orient="records")
+def get_suppliers(request: Request):
+    return records_response(request, database.get_suppliers())
 
 @router.post("/suppliers") #  
 def create_supplier(request: Request, data: SupplierCreate):
@@ -515,6 +503,17 @@ def update_supplier(request: Request, id: str, data: SupplierUpdate):
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
+@router.put("/suppliers/{id}/lead-time")
+def update_supplier_lead_time(request: Request, id: str, data: SupplierLeadTimeUpdate):
+    user = request.session.get("user")
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        return database.update_supplier_lead_time(id, data.lead_time_days, admin_id=user["id"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.delete("/suppliers/{id}") #  
 def delete_supplier(request: Request, id: str):
     user = request.session.get("user")
@@ -572,6 +571,65 @@ def place_order(request: Request, order: OrderTransactionCreate):
             }
         )
 
+# Bulk order import: many orders per request, validated as one batch
+ORDER_CSV_COLUMNS = ["order_ref", "customer_id", "status_id", "product_id", "quantity", "unit_price"]
+
+def orders_from_csv(df: pd.DataFrame) -> list:
+    """
+    One CSV row per order line; rows sharing an order_ref form one order.
+    Columns: order_ref, customer_id, status_id, product_id, quantity, unit_price[, misc_fee].
+    Materials are taken from each product's BOM.
+    """
+    missing = [c for c in ORDER_CSV_COLUMNS if c not in df.columns]
+    if missing:
+        raise ValueError(f"Missing CSV column(s): {', '.join(missing)}")
+
+    df = df.dropna(how="all")
+    orders = []
+    for order_ref, rows in df.groupby("order_ref", sort=False):
+        first = rows.iloc[0]
+        orders.append({
+            "order_ref": str(order_ref),
+            "customer_id": str(first["customer_id"]).strip() if pd.notna(first["customer_id"]) else None,
+            "status_id": str(first["status_id"]).strip(),
+            "items": [
+                {
+                    "product_id": str(row["product_id"]).strip(),
+                    "quantity": int(float(row["quantity"])),
+                    "unit_price": float(row["unit_price"]) if pd.notna(row["unit_price"]) else None,
+                    "misc_fee": float(row["misc_fee"]) if "misc_fee" in rows.columns and pd.notna(row["misc_fee"]) else None,
+                    "materials": None,
+                }
+                for _, row in rows.iterrows()
+            ],
+        })
+    return orders
+
+@router.post("/orders/bulk")
+def import_orders(request: Request, payload: OrderBulkCreate):
+    user = request.session.get("user")
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    orders = [order.dict() for order in payload.orders]
+    return database.import_orders(orders, admin_id=user["id"], chunk_size=payload.chunk_size)
+
+@router.post("/orders/bulk/csv")
+def import_orders_csv(request: Request, file: UploadFile = File(...), chunk_size: int = 100):
+    user = request.session.get("user")
+    if not user or user.get("role") != "admin":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    try:
+        orders = orders_from_csv(pd.read_csv(file.file, dtype=str))
+    except (ValueError, pd.errors.ParserError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid order CSV: {e}")
+
+    result = database.import_orders(orders, admin_id=user["id"], chunk_size=max(1, min(chunk_size, 1000)))
+    for res, order in zip(result["results"], orders):
+        res["order_ref"] = order["order_ref"]
+    return result
+
 @router.get("/order-statuses")
 def order_statuses():
     result = database.get_order_statuses()
@@ -593,8 +651,25 @@ def update_order_transaction_status(request: Request, data: OrderStatusUpdate):
     return {"message": "Order status updated successfully."}
 
 @router.get("/order-transactions")
-def read_order_transactions():
-    return database.get_order_transactions_detailed().to_dict(orient="records")
+def read_order_transactions(
+    request: Request,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=500),
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    status: Optional[List[str]] = Query(None),
+    exclude_status: Optional[List[str]] = Query(None),
+    customer_id: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    q: Optional[str] = None
+):
+    df, next_cursor = database.get_order_transactions_detailed(
+        cursor=cursor, limit=limit, date_from=date_from, date_to=date_to,
+        status=status, exclude_status=exclude_status, customer_id=customer_id,
+        min_total=min_total, max_total=max_total, q=q
+    )
+    return records_response(request, df, "items", next_cursor=next_cursor)
 
 
 @router.delete("/orders/{transaction_id}")
@@ -637,6 +712,60 @@ def get_inventory_dashboard_summary(request: Request, period: str = "week"):
     summary = analytics.get_summary_cards(period)
     return JSONResponse(content=summary)
 
+# Plotly figure JSON of each chart, drawn client-side by charts.js
+CHARTS = {
+    "sales": lambda: graphs.get_graph_html()[0],
+    "turnover": lambda: graphs.get_turnover_combined_graph()[0],
+    "stl": lambda: graphs.get_stl_decomposition_graph()[0],
+    "moving-average": lambda: graphs.get_sales_moving_average_chart()[0],
+    "fastest-moving": graphs.get_fastest_moving_materials_chart,
+    "reorder-point": graphs.get_reorder_point_chart,
+}
+
+@router.get("/charts/{name}")
+def get_chart(name: str):
+    if name not in CHARTS:
+        raise HTTPException(status_code=404, detail=f"Unknown chart '{name}'")
+
+    chart = CHARTS[name]()
+    if not graphs.is_figure(chart):
+        raise HTTPException(status_code=404, detail="No data to plot")
+    # Already serialized by graphs.figure_json (and cached as such)
+    return Response(content=chart, media_type="application/json")
+
+# Per-product / per-material STL components, precomputed by stl_batch.py
+@router.get("/analytics/stl/{kind}")
+def stl_series_list(kind: str):
+    if kind not in stl_batch.KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown series kind '{kind}'")
+
+    # Serve what is stored; a refit (if orders changed) runs in the background
+    refreshing = stl_batch.refresh_in_background() or stl_batch.is_stale(kind)
+    run = stl_batch.last_run(kind)
+    series = stl_batch.list_series(kind)
+    series["first_month"] = series["first_month"].dt.strftime("%Y-%m")
+    return {
+        "kind": kind,
+        "fitted_at": run[0].isoformat(timespec="seconds") if run else None,
+        "refreshing": refreshing,
+        "min_months": stl_batch.MIN_MONTHS,
+        "series": series.to_dict(orient="records"),
+    }
+
+@router.get("/analytics/stl/{kind}/{series_id}")
+def stl_series_components(kind: str, series_id: str):
+    if kind not in stl_batch.KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown series kind '{kind}'")
+
+    df = stl_batch.get_series(kind, series_id)
+    if df.empty:
+        raise HTTPException(status_code=404, detail="No decomposition stored for this series")
+    return {
+        "series_id": series_id,
+        "months": df["month"].dt.strftime("%Y-%m").tolist(),
+        **{column: df[column].round(3).tolist() for column in ("observed", "trend", "seasonal", "resid")},
+    }
+
 @router.get("/summary/products")
 def product_summary():
     return analytics.get_product_usage_summary()
@@ -655,6 +784,11 @@ def recent_transactions_api():
         traceback.print_exc()
         return JSONResponse(content={"error": str(e)}, status_code=500)
     
+@router.get("/dashboard/snapshot")
+def dashboard_snapshot():
+    # Every dashboard card in one document (short TTL cache in analytics)
+    return analytics.get_dashboard_snapshot()
+
 @router.get("/dashboard/metrics")
 def dashboard_metrics():
     return analytics.get_all_time_metrics()
@@ -671,15 +805,45 @@ def stock_flow_summary():
 
 # ------------ reciept and Quote ----------
 
+def _attachment(content: bytes, media_type: str, filename: str) -> Response:
+    """A download rendered in memory, sent as-is (no file on disk)."""
+    return Response(content, media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+
+@router.post("/logos")
+def upload_logo(file: UploadFile = File(...), user: dict = Depends(get_current_user)):
+    """Register a company logo once; receipts and quotations then reference it by logo_id."""
+    if not user:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+    data = file.file.read(logo_store.MAX_UPLOAD_BYTES + 1)
+    if len(data) > logo_store.MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Logo exceeds {logo_store.MAX_UPLOAD_BYTES} bytes")
+    try:
+        logo_id = logo_store.register(data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid logo: {e}")
+    return {"logo_id": logo_id}
+
+
+def _request_logo(logo_id: Optional[str], logo_data: Optional[str]):
+    """PNG bytes of a receipt/quotation logo: registered (logo_id) or inline (logo_data, older clients)."""
+    if logo_id:
+        logo = logo_store.get(logo_id)
+        if logo is None:
+            raise HTTPException(status_code=404, detail="Unknown logo_id")
+        return logo
+    if logo_data:
+        try:
+            return logo_store.get(logo_store.register_data_url(logo_data))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=f"Invalid logo: {e}")
+    return None
+
+
 @router.post("/generate-receipt")
 def generate_receipt(req: ReceiptRequest):
     print("Received company name:", req.company_name) 
-    print("Received logo_data:", "Yes" if req.logo_data else "No")  # Debug check
-
-    output_dir = os.path.join(os.path.dirname(__file__), "..", "pdf_container")
-    os.makedirs(output_dir, exist_ok=True)
-
-    receipt.cleanup_old_pdfs(output_dir, max_age_minutes=10)
 
     grand_total = sum(item.quantity * item.unit_price for item in req.items)
     if req.down_payment > grand_total:
@@ -687,33 +851,22 @@ def generate_receipt(req: ReceiptRequest):
 
     company_name = req.company_name.strip() if req.company_name and req.company_name.strip() else "Times Stock Aluminum & Glass"
 
-    filename = os.path.join(output_dir, f"receipt_{uuid.uuid4().hex}.pdf")
-
-    # Pass logo_data here
-    receipt.generate_unofficial_receipt(
-        filename=filename,
+    pdf = receipt.generate_unofficial_receipt(
         company_name=company_name,
         customer_name=req.customer_name,
         address=req.address,
         phone=req.phone,
         items=[item.dict() for item in req.items],
         down_payment=req.down_payment,
-        logo_data=req.logo_data 
+        logo=_request_logo(req.logo_id, req.logo_data)
     )
 
-    return FileResponse(filename, media_type="application/pdf", filename="receipt.pdf")
+    return _attachment(pdf, "application/pdf", "receipt.pdf")
 
 
 @router.post("/generate-quotation")
 def generate_quotation(data: QuotationRequest):
-    temp_file = NamedTemporaryFile(delete=False, suffix=".pdf")
-    filename = temp_file.name
-
-    print("Received logo_data:", "Yes" if data.logo_data else "No")  # Debug check
-
-    # Pass logo_data here
-    receipt.generate_modern_quotation_pdf(
-        filename=filename,
+    pdf = receipt.generate_modern_quotation_pdf(
         client_name=data.client_name,
         client_address=data.client_address,
         items_quote=[item.dict() for item in data.items_quote],
@@ -726,10 +879,10 @@ def generate_quotation(data: QuotationRequest):
         company_name=data.company_name,
         company_address=data.company_address,
         company_contact=data.company_contact,
-        logo_data=data.logo_data 
+        logo=_request_logo(data.logo_id, data.logo_data)
     )
 
-    return FileResponse(filename, media_type="application/pdf", filename="quotation.pdf")
+    return _attachment(pdf, "application/pdf", "quotation.pdf")
 
 
 @router.get("/reports/pdf")
@@ -737,18 +890,45 @@ def generate_report_pdf_endpoint(year: int, month: int = None, user: dict = Depe
     if not user:
         return {"error": "Unauthorized"}
 
-    # Gather reports
-    report_text = graphs.get_text_report_for_month(year, month)
-    turnover_report = graphs.get_turnover_text_report_for_month(year, month)
-    stl_report = graphs.get_stl_text_report_for_month(year, month)
-    moving_avg_report = graphs.get_sales_moving_average_text_report(month=month, year=year)
-    stock_movement_report = graphs.get_stock_movement_report_for_month(year, month)  
-    products_sold_report = graphs.get_products_sold_for_month(year, month)
+    if month is None:
+        # Yearly summary
+        report = reports.build_year_report(year)
+        return _attachment(receipt.generate_report_pdf(report), "application/pdf", reports.pdf_filename(report))
 
-    # Generate PDF
-    filepath = receipt.generate_report_pdf(report_text, turnover_report, stl_report, moving_avg_report,stock_movement_report,products_sold_report, year, month)
-        
-    return FileResponse(filepath, media_type="application/pdf", filename=filepath.split("/")[-1])
+    if not 1 <= month <= 12:
+        raise HTTPException(status_code=400, detail="month must be between 1 and 12")
+
+    # Closed months come straight from the report store
+    filename = reports.pdf_filename(reports.month_period(year, month))
+    stored = report_store.stored_pdf(year, month)
+    if stored is not None:
+        return FileResponse(stored, media_type="application/pdf", filename=filename)
+    return _attachment(receipt.generate_report_pdf(reports.build_month_report(year, month)), "application/pdf", filename)
+
+
+@router.get("/reports/archive")
+def report_archive_endpoint(
+    year: Optional[int] = None,
+    start: Optional[str] = Query(None, description="First month, YYYY-MM"),
+    end: Optional[str] = Query(None, description="Last month, YYYY-MM"),
+    user: dict = Depends(get_current_user)
+):
+    """Zip of the monthly PDF reports of a year (or of start..end) plus a summary of the whole period."""
+    if not user:
+        return {"error": "Unauthorized"}
+
+    try:
+        if start and end:
+            period = reports.span_period(*report_batch.parse_month(start), *report_batch.parse_month(end))
+        elif year is not None:
+            period = reports.year_period(year)
+        else:
+            raise ValueError("Give a year, or a start and end month")
+        archive = report_batch.build_archive(period)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return _attachment(archive, "application/zip", report_batch.archive_name(period))
 
 
 # ------------ SETTINGS -------------
@@ -919,49 +1099,25 @@ async def change_password(
 
     user_id = session_user["id"]
 
-    # Fetch current password hash from DB
-    user_record = database.con.execute("SELECT password FROM admin WHERE id = ?", [user_id]).fetchone()
-
-    if not user_record:
-        return JSONResponse({"success": False, "message": "User not found"}, status_code=404)
-
-    stored_hash = user_record[0]
-
-    # Verify current password
-    try:
-        ph.verify(stored_hash, current_password)
-    except Exception:
-        return JSONResponse({"success": False, "message": "Incorrect current password"}, status_code=400)
-
-    # Hash the new password
-    new_hashed = ph.hash(new_password)
-
-    # Update DB
-    database.con.execute("UPDATE admin SET password = ? WHERE id = ?", [new_hashed, user_id])
+    # Lookup, verify and re-hash run on the auth pool, off the event loop
+    status_code, message = await auth_service.change_admin_password(user_id, current_password, new_password)
 
-    return JSONResponse({"success": True, "message": "Password updated successfully"})
+    return JSONResponse({"success": status_code == 200, "message": message}, status_code=status_code)
 
 @router.post("/forgot-password")
 async def forgot_password(request: Request):
     form = await request.form()
     email = form.get("email")
 
-    # Check if email exists
-    user = database.con.execute("SELECT id FROM admin WHERE email = ?", [email]).fetchone()
+    # Check the email and store a new hashed password (on the auth pool)
+    new_password = await auth_service.reset_admin_password(email)
 
-    if not user:
+    if not new_password:
         return JSONResponse({"success": False, "message": "Email not found"}, status_code=404)
 
-    # Generate and hash new password
-    new_password = database.generate_new_password()
-    hashed_password = ph.hash(new_password)
-
-    # Update the password in the database
-    database.con.execute("UPDATE admin SET password = ? WHERE email = ?", [hashed_password, email])
-
     # Send the email
     try:
-        database.send_email(email, new_password)
+        await run_in_threadpool(database.send_email, email, new_password)
     except Exception as e:
         return JSONResponse({"success": False, "message": f"Failed to send email: {e}"}, status_code=500)
 
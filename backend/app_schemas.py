@@ -99,6 +99,9 @@ class SupplierCreate(SupplierBase):
 class SupplierUpdate(SupplierBase):
     pass
 
+class SupplierLeadTimeUpdate(BaseModel):
+    lead_time_days: float
+
 # ------- Product Materials-----
 class ProductMaterialBase(BaseModel):
     material_id: str
@@ -140,6 +143,10 @@ class OrderTransactionCreate(BaseModel):
     class Config:
         extra = "allow"
 
+class OrderBulkCreate(BaseModel):
+    orders: List[OrderTransactionCreate]
+    chunk_size: int = Field(100, ge=1, le=1000)
+
 class StockItem(BaseModel):
     material_id: str
     quantity: float
@@ -169,7 +176,8 @@ class ReceiptRequest(BaseModel):
     items: list[ReceiptItem]
     down_payment: float
     company_name: str | None = None
-    logo_data: Optional[str] = None
+    logo_id: Optional[str] = None     # from POST /api/logos
+    logo_data: Optional[str] = None   # inline data URL (older clients)
     
 class QuotationItem(BaseModel):
     description: str
@@ -191,7 +199,8 @@ class QuotationRequest(BaseModel):
     company_name: str
     company_address: Optional[str] = None
     company_contact: Optional[str] = None
-    logo_data: Optional[str] = None
+    logo_id: Optional[str] = None     # from POST /api/logos
+    logo_data: Optional[str] = None   # inline data URL (older clients)
 
 
 # SETTINGS
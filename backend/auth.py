@@ -7,7 +7,7 @@ from starlette.status import HTTP_302_FOUND
 from jose import jwt, JWTError
 from datetime import datetime, timedelta
 
-from . import database
+from . import database, auth_service, http_cache
 import os
 
 # This is new
@@ -17,6 +17,7 @@ router = APIRouter()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "../templates/html"))
+templates.env.globals["static_url"] = http_cache.static_url
 
 @router.get("/login", response_class=HTMLResponse)
 def login_page(request: Request):
@@ -29,7 +30,7 @@ async def login_user(
     password: str = Form(...),
     accept: Optional[str] = Header(default="application/json")
 ):
-    user = database.authenticate_user(email, password)
+    user = await auth_service.authenticate(email, password)
     if not user:
         if "text/html" in accept:
             return templates.TemplateResponse("Login.html", {
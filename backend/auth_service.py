@@ -0,0 +1,63 @@
+# auth_service.py
+# Credential checks and password changes for the async auth endpoints.
+#
+# Argon2 hashing is deliberately slow (and uses ~64 MB per hash), and the user
+# lookups hit DuckDB; neither may run on the event loop thread. Everything here
+# runs on a dedicated, bounded pool so a burst of logins queues behind
+# AUTH_WORKERS threads instead of stalling every other request or competing
+# with the chart/report workers.
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from . import database
+from .connection import cursor as db_cursor
+
+AUTH_WORKERS = int(os.environ.get("AUTH_WORKERS", 2))
+
+_pool = ThreadPoolExecutor(max_workers=AUTH_WORKERS, thread_name_prefix="auth")
+
+
+async def run(fn, *args, **kwargs):
+    """Run a blocking auth call on the auth pool and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_pool, partial(fn, *args, **kwargs))
+
+
+async def authenticate(email: str, password: str):
+    """Async wrapper for database.authenticate_user (user dict or None)."""
+    return await run(database.authenticate_user, email, password)
+
+
+def _change_admin_password(admin_id: str, current_password: str, new_password: str):
+    with db_cursor() as cur:
+        row = cur.execute("SELECT password FROM admin WHERE id = ?", [admin_id]).fetchone()
+        if not row:
+            return 404, "User not found"
+
+        if not database.verify_password(row[0], current_password):
+            return 400, "Incorrect current password"
+
+        cur.execute("UPDATE admin SET password = ? WHERE id = ?", [database.ph.hash(new_password), admin_id])
+    return 200, "Password updated successfully"
+
+
+async def change_admin_password(admin_id: str, current_password: str, new_password: str):
+    """Verify the current password and store the new one. Returns (status_code, message)."""
+    return await run(_change_admin_password, admin_id, current_password, new_password)
+
+
+def _reset_admin_password(email: str):
+    with db_cursor() as cur:
+        if not cur.execute("SELECT id FROM admin WHERE email = ?", [email]).fetchone():
+            return None
+
+        new_password = database.generate_new_password()
+        cur.execute("UPDATE admin SET password = ? WHERE email = ?", [database.ph.hash(new_password), email])
+    return new_password
+
+
+async def reset_admin_password(email: str):
+    """Give the admin with this email a new random password; returns it, or None if unknown."""
+    return await run(_reset_admin_password, email)
@@ -0,0 +1,118 @@
+# chart_cache.py
+# In-process cache for rendered charts (the figure JSON of graphs.py and
+# whatever frames/reports those functions return alongside it).
+#
+# Entries are keyed by chart name + call arguments and evicted least recently
+# used first once their estimated size exceeds MAX_BYTES. The write paths in
+# database.py call invalidate() after committing anything that feeds a chart
+# (orders, stock, materials, products).
+import os
+import sys
+import threading
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+
+import pandas as pd
+
+MAX_BYTES = int(os.environ.get("CHART_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+
+_entries = OrderedDict()   # key -> (value, size in bytes)
+_total_bytes = 0
+_generation = 0            # bumped by invalidate(); stale builds are not stored
+_lock = threading.Lock()
+MISS = object()            # get() result for a key not in the cache; None is a value
+
+
+def _sizeof(value) -> int:
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, pd.Series):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (tuple, list)):
+        return sum(_sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sum(_sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    # Callers are free to add columns to returned frames, so hand out copies
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return value.copy()
+    if isinstance(value, tuple):
+        return tuple(_copy(v) for v in value)
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+def get(key):
+    """Return the cached value for `key` (marking it recently used), or MISS."""
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            return MISS
+        _entries.move_to_end(key)
+        return entry[0]
+
+
+def put(key, value, generation: int):
+    """
+    Store `value` unless the cache was invalidated since `generation` was read
+    (the value may then predate the write) or it alone exceeds the budget.
+    """
+    global _total_bytes
+    size = _sizeof(value)
+    with _lock:
+        if generation != _generation or size > MAX_BYTES:
+            return
+        old = _entries.pop(key, None)
+        if old is not None:
+            _total_bytes -= old[1]
+        _entries[key] = (value, size)
+        _total_bytes += size
+        while _total_bytes > MAX_BYTES and _entries:
+            _, (_, evicted_size) = _entries.popitem(last=False)
+            _total_bytes -= evicted_size
+
+
+def invalidate():
+    """Drop every cached chart. Call after committing a write that feeds charts."""
+    global _total_bytes, _generation
+    with _lock:
+        _entries.clear()
+        _total_bytes = 0
+        _generation += 1
+
+
+def stats():
+    with _lock:
+        return {"entries": len(_entries), "bytes": _total_bytes, "max_bytes": MAX_BYTES}
+
+
+def cached(name: str, daily: bool = False):
+    """
+    Decorator caching a chart function's return value per argument set.
+    `daily=True` adds today's date to the key, for charts over a rolling
+    window (e.g. "last 30 days") that change without any write.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            if daily:
+                key += (date.today(),)
+
+            value = get(key)
+            if value is MISS:
+                generation = _generation
+                value = fn(*args, **kwargs)
+                put(key, value, generation)
+            return _copy(value)
+        return wrapper
+    return decorator
@@ -0,0 +1,158 @@
+import duckdb
+import threading
+import shutil
+import os
+import random
+import time
+import inspect
+from contextlib import contextmanager
+from functools import wraps
+
+# con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+REPO_DB_PATH = "backend/db_timestock1"
+
+# If running locally, use a local file
+if os.environ.get("RAILWAY") == "1":
+    # Production (Railway) path: the mounted volume
+    DB_PATH = "/data/db_timestock1"
+else:
+    # Local path
+    DB_PATH = "backend/db_timestock1"
+
+# Attempts of a write whose transaction loses a write-write conflict (write_transaction)
+WRITE_ATTEMPTS = int(os.environ.get("DB_WRITE_ATTEMPTS", 8))
+
+_instance = None
+_instance_lock = threading.Lock()
+_local = threading.local()
+_generation = 0
+_write_lock = threading.RLock()   # held by write_transaction functions
+
+
+def _prepare_db_file():
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+
+    # Copy starter DB if it doesn't exist yet
+    if not os.path.exists(DB_PATH):
+        if os.path.exists(REPO_DB_PATH):
+            shutil.copy(REPO_DB_PATH, DB_PATH)
+            print(f"Copied starter DB to {DB_PATH}")
+        else:
+            print(f"No starter DB found at {REPO_DB_PATH}. A new DB will be created.")
+
+
+def get_connection():
+    """
+    Return the single DuckDB connection owned by this process.
+    The database file is opened once, on first use; everything else
+    should talk to it through cursors derived from this connection.
+    """
+    global _instance
+    if _instance is None:
+        with _instance_lock:
+            if _instance is None:
+                _prepare_db_file()
+                _instance = duckdb.connect(DB_PATH)
+                print(f"Connected to DB at {DB_PATH}")
+    return _instance
+
+
+def get_cursor():
+    """
+    Return the cursor bound to the calling thread, creating it on first use.
+    DuckDB cursors share the parent database instance, so this never
+    re-opens the file.
+    """
+    cur = getattr(_local, "cursor", None)
+    if cur is None or getattr(_local, "generation", None) != _generation:
+        cur = get_connection().cursor()
+        _local.cursor = cur
+        _local.generation = _generation
+    return cur
+
+
+def new_cursor():
+    """
+    Return a fresh cursor the caller owns (and may close).
+    Use this when the caller needs its own transaction scope.
+    """
+    return get_connection().cursor()
+
+
+@contextmanager
+def cursor():
+    """
+    Context manager around the thread-local cursor:
+
+        with connection.cursor() as cur:
+            cur.execute(...).fetchdf()
+
+    If the block raises while a transaction is open, it is rolled back so
+    the next caller on this thread starts from a clean cursor.
+    """
+    cur = get_cursor()
+    try:
+        yield cur
+    except Exception:
+        try:
+            cur.rollback()
+        except duckdb.Error:
+            pass  # no transaction active, ignore
+        raise
+
+
+def rollback(cur):
+    """ROLLBACK the transaction opened on `cur`; a failed COMMIT has already ended it."""
+    try:
+        cur.execute("ROLLBACK")
+    except duckdb.TransactionException:
+        pass
+
+
+def is_conflict(e) -> bool:
+    """True for DuckDB's write-write conflict ("Conflict on update!"), which succeeds when run again."""
+    return isinstance(e, duckdb.TransactionException) and "Conflict" in str(e)
+
+
+def write_transaction(func):
+    """
+    Decorator for write functions that begin and commit their own transaction.
+
+    DuckDB detects write-write conflicts optimistically: of two concurrent
+    transactions updating the same row, the later one fails with "Conflict
+    on update!". Every order and stock write updates the same rows (the
+    current month's rollups, rollup_versions, shared stock levels), so these
+    functions run one at a time within the process. A transaction that still
+    loses a conflict, to a writer outside them, is run again after a short
+    random backoff, up to WRITE_ATTEMPTS times. A call passing `cur` runs
+    once, as is, inside the caller's transaction.
+    """
+    signature = inspect.signature(func)
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if signature.bind_partial(*args, **kwargs).arguments.get("cur") is not None:
+            return func(*args, **kwargs)
+        for attempt in range(1, WRITE_ATTEMPTS + 1):
+            try:
+                with _write_lock:
+                    return func(*args, **kwargs)
+            except duckdb.TransactionException as e:
+                if attempt == WRITE_ATTEMPTS or not is_conflict(e):
+                    raise
+            time.sleep(random.uniform(0, min(0.005 * 2 ** attempt, 0.2)))
+
+    return wrapper
+
+
+def close():
+    """
+    Close the shared connection. Thread-local cursors handed out before
+    this call are discarded the next time their thread asks for one.
+    """
+    global _instance, _generation
+    with _instance_lock:
+        if _instance is not None:
+            _instance.close()
+            _instance = None
+        _generation += 1
@@ -10,49 +10,33 @@ from email.mime.text import MIMEText
 import secrets
 import string
 import smtplib
-import shutil
 from email.mime.text import MIMEText
 import os
+import json
+import base64
+
+from .connection import (
+    DB_PATH, REPO_DB_PATH, get_connection, new_cursor, cursor as db_cursor,
+    write_transaction, is_conflict, rollback,
+)
+from . import rollups, chart_cache, migrations, periods, alerts, events, reorder, table_versions
 
 # MOTHERDUCK_TOKEN = os.getenv("MOTHERDUCK_TOKEN")
 # if not MOTHERDUCK_TOKEN:
 #     raise RuntimeError("MOTHERDUCK_TOKEN not set")
 
-# con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-REPO_DB_PATH = "backend/db_timestock1"
-
-# If running locally, use a local file
-if os.environ.get("RAILWAY") == "1":
-    # Production (Railway) path: the mounted volume
-    DB_PATH = "/data/db_timestock1"
-else:
-    # Local path
-    DB_PATH = "backend/db_timestock1"
-
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-# Copy starter DB if it doesn't exist yet
-if not os.path.exists(DB_PATH):
-    if os.path.exists(REPO_DB_PATH):
-        shutil.copy(REPO_DB_PATH, DB_PATH)
-        print(f"Copied starter DB to {DB_PATH}")
-    else:
-        print(f"No starter DB found at {REPO_DB_PATH}. A new DB will be created.")
-
-
-# Connect to DuckDB
-con = duckdb.connect(DB_PATH)
-print(f"Connected to DB at {DB_PATH}")
+# Shared DuckDB connection (opened once per process by backend.connection)
+con = get_connection()
 
-# con = duckdb.connect('backend/db_timestock')
+# Bring the schema up to date (rollup tables, indexes); see migrations.py
+migrations.run_migrations()
 
 
 ph = PasswordHasher()
 
 def get_db_connection():
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-    return con
+    # Owned cursor on the shared database; callers may close it.
+    return new_cursor()
 
 # Forgot Password
 
@@ -120,19 +104,12 @@ def log_audit(
     executor = cur_or_conn if cur_or_conn is not None else cur
 
     if executor is None:
-        # No executor passed: try module-level 'con' first (preserve older behavior)
-        try:
-            conn = con  # if defined in module
-            exec_obj = conn
-            created_own_conn = True  # preserve older behavior where log would commit module-level con
-        except NameError:
-            # Try to create short-lived connection via helper if available
-            try:
-                conn = get_db_connection()
-                exec_obj = conn
-                created_own_conn = True
-            except Exception:
-                raise RuntimeError("No DB connection available: pass cur or cur_or_conn or define module-level `con` or provide get_db_connection().")
+        # No executor passed: use a short-lived cursor on the shared database
+        conn = get_db_connection()
+        exec_obj = conn
+        created_own_conn = True
+        # The audit row and its table change commit together
+        conn.execute("BEGIN")
     else:
         # An executor was provided by caller
         # If it supports .execute, use it directly (works for connection or cursor)
@@ -183,6 +160,8 @@ def log_audit(
             """,
             (admin_id, employee_id, entity, entity_id, action, details)
         )
+        # Audited writes also move the entity's version (HTTP ETags)
+        table_versions.bump(exec_obj, entity)
 
         # If we opened the connection in this function, commit & close it
         if created_own_conn and conn is not None:
@@ -217,21 +196,22 @@ def log_audit(
 
 # Product_materials
 def get_product_materials_grouped():
-    df = con.execute("""
-        SELECT 
-            p.id AS product_id,
-            i.item_name AS product_name,
-            pm.material_id,
-            mi.item_name AS material_name,
-            pm.used_quantity,
-            pm.unit_cost,
-            pm.line_cost
-        FROM product_materials pm
-        JOIN products p ON pm.product_id = p.id
-        JOIN items i ON p.item_id = i.id
-        JOIN materials m ON pm.material_id = m.id
-        JOIN items mi ON m.item_id = mi.id
-    """).fetchdf()
+    with db_cursor() as cur:
+        df = cur.execute("""
+            SELECT 
+                p.id AS product_id,
+                i.item_name AS product_name,
+                pm.material_id,
+                mi.item_name AS material_name,
+                pm.used_quantity,
+                pm.unit_cost,
+                pm.line_cost
+            FROM product_materials pm
+            JOIN products p ON pm.product_id = p.id
+            JOIN items i ON p.item_id = i.id
+            JOIN materials m ON pm.material_id = m.id
+            JOIN items mi ON m.item_id = mi.id
+        """).fetchdf()
 
     grouped = defaultdict(lambda: {"product_id": None, "product_name": None, "materials": []})
 
@@ -251,6 +231,7 @@ def get_product_materials_grouped():
 
 
   
+@write_transaction
 def add_product_materials(
     data: dict,
     admin_id: Optional[str] = None,
@@ -275,6 +256,9 @@ def add_product_materials(
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         product_id = data['product_id']
         materials = data.get('materials', [])
         if not isinstance(materials, list) or not materials:
@@ -343,16 +327,24 @@ def add_product_materials(
                 admin_id=admin_id,
                 cur=cur
             )
+        elif inserted:
+            # Batch adds are not audited per row; still a change for the ETags
+            table_versions.bump(cur, "product_materials")
         # commit if we opened the connection/cursor here
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
         return {"success": True, "inserted": inserted, "skipped": skipped}
 
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 
@@ -364,7 +356,8 @@ def get_product_materials_by_product_id(product_id: str):
         JOIN items i ON m.item_id = i.id
         WHERE pm.product_id = ?
     """
-    result = con.execute(query, (product_id,)).fetchall()
+    with db_cursor() as cur:
+        result = cur.execute(query, (product_id,)).fetchall()
 
     return [
         {
@@ -379,6 +372,7 @@ def get_product_materials_by_product_id(product_id: str):
 
 
   
+@write_transaction
 def update_product_material(
     product_id: str, 
     material_id: str | None = None, 
@@ -406,6 +400,9 @@ def update_product_material(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute(
             "SELECT used_quantity, unit_cost FROM product_materials WHERE product_id = ? AND material_id = ?",
             (product_id, material_id)
@@ -438,14 +435,20 @@ def update_product_material(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
         return {"success": True, "updated": 1}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def delete_product_material(
     product_id: str, 
     material_id: str,
@@ -471,6 +474,9 @@ def delete_product_material(
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute(
             "SELECT used_quantity, unit_cost FROM product_materials WHERE product_id = ? AND material_id = ?",
             (product_id, material_id)
@@ -481,7 +487,7 @@ def delete_product_material(
         
         used_quantity, unit_cost = old_row[0], old_row[1]
 
-        result = con.execute("""
+        result = cur.execute("""
             DELETE FROM product_materials
             WHERE product_id = ? AND material_id = ?
         """, (product_id, material_id))
@@ -504,31 +510,37 @@ def delete_product_material(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
         return {"success": True, "deleted": affected}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 # Product Calculation
 def calculate_quote(product_id: str):
-    rows = con.execute("""
-        SELECT 
-            pm.material_id,
-            m.material_cost,
-            pm.line_cost,
-            i.item_name,
-            i.item_decription,
-            pm.unit_cost,
-            pm.used_quantity,
-            m.unit_measurement
-        FROM product_materials pm
-        JOIN materials m ON pm.material_id = m.id
-        JOIN items i ON m.item_id = i.id 
-        WHERE pm.product_id = ?
-    """, (product_id,)).fetchdf()
+    with db_cursor() as cur:
+        rows = cur.execute("""
+            SELECT 
+                pm.material_id,
+                m.material_cost,
+                pm.line_cost,
+                i.item_name,
+                i.item_decription,
+                pm.unit_cost,
+                pm.used_quantity,
+                m.unit_measurement
+            FROM product_materials pm
+            JOIN materials m ON pm.material_id = m.id
+            JOIN items i ON m.item_id = i.id 
+            WHERE pm.product_id = ?
+        """, (product_id,)).fetchdf()
 
     total = rows['line_cost'].sum()
     return {
@@ -540,9 +552,11 @@ def calculate_quote(product_id: str):
 
 # Product_categories CRUDS
 def get_product_categories():
-    return con.execute("SELECT * FROM product_categories").fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("SELECT * FROM product_categories").fetchdf()
 
   
+@write_transaction
 def add_product_category(
     data: dict,
     admin_id: Optional[str] = None,
@@ -568,6 +582,9 @@ def add_product_category(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         category_name = data['category_name'].strip().title()
         description = data['description'].strip()
 
@@ -604,16 +621,20 @@ def add_product_category(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return new_id
     
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
   
+@write_transaction
 def update_product_category(
     id: str, 
     data: dict,
@@ -639,6 +660,9 @@ def update_product_category(
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         category_name = data['category_name'].strip().title()
         description = data['description'].strip()
 
@@ -667,15 +691,19 @@ def update_product_category(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "updated": 1}
     
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def delete_product_categories(
     id: str,
     admin_id: Optional[str] = None,
@@ -700,6 +728,9 @@ def delete_product_categories(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute(
             "SELECT category_name, description FROM product_categories WHERE id = ?", (id,)
         ).fetchone()
@@ -729,22 +760,25 @@ def delete_product_categories(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "deleted": 1}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 # Material_categories CRUD
 def get_material_categories():
-      with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
+    with db_cursor() as conn:
         return conn.execute("SELECT * FROM material_categories").fetchdf()
 
 
   
+@write_transaction
 def add_material_category(
     data: dict,
     admin_id: Optional[str] = None,
@@ -769,6 +803,9 @@ def add_material_category(
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         raw_name = data['category_name'].strip()
         if not raw_name:
             raise ValueError("category_name cannot be empty")
@@ -807,15 +844,19 @@ def add_material_category(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return new_id
     
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def update_material_category(
     id: str, 
     data: dict,
@@ -841,6 +882,9 @@ def update_material_category(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         category_name = data['category_name'].strip().title()
         description = data['description'].strip()
 
@@ -869,15 +913,19 @@ def update_material_category(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "updated": 1}
     
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def delete_material_category(
     id: str,
     admin_id: Optional[str] = None,
@@ -902,6 +950,9 @@ def delete_material_category(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute(
             "SELECT category_name, description FROM material_categories WHERE id = ?", (id,)
         ).fetchone()
@@ -931,58 +982,72 @@ def delete_material_category(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "deleted": affected}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 #Materials CRUDS
 def get_material():
-    return con.execute("""
-       SELECT 
-            i.id AS item_id,
-            i.item_name,
-            i.item_decription,
-            i.category_id,  -- <-- include this
-            mc.category_name AS item_category_name,
-            m.id AS material_id,
-            m.unit_measurement,
-            m.material_cost,
-            m.current_stock,
-            m.minimum_stock,
-            m.maximum_stock,
-            m.supplier_id,  -- <-- include this
-            s.contact_name AS supplier_name
-        FROM items i
-        JOIN materials m ON i.id = m.item_id
-        JOIN material_categories mc ON i.category_id = mc.id
-        JOIN suppliers s ON m.supplier_id = s.id
-    """).fetchdf()
+    with db_cursor() as cur:
+        reorder.ensure_plan(cur)
+        # Materials added since today's plan was built have no usage in its window yet
+        return cur.execute("""
+           SELECT 
+                i.id AS item_id,
+                i.item_name,
+                i.item_decription,
+                i.category_id,  -- <-- include this
+                mc.category_name AS item_category_name,
+                m.id AS material_id,
+                m.unit_measurement,
+                m.material_cost,
+                m.current_stock,
+                m.minimum_stock,
+                m.maximum_stock,
+                m.supplier_id,  -- <-- include this
+                s.contact_name AS supplier_name,
+                COALESCE(rp.avg_daily_usage, 0) AS avg_daily_usage,
+                COALESCE(rp.safety_stock, 0) AS safety_stock,
+                COALESCE(rp.reorder_point, 0) AS reorder_point,
+                COALESCE(rp.lead_time_days, lt.lead_time_days, ?) AS lead_time_days
+            FROM items i
+            JOIN materials m ON i.id = m.item_id
+            JOIN material_categories mc ON i.category_id = mc.id
+            JOIN suppliers s ON m.supplier_id = s.id
+            LEFT JOIN reorder_plan rp ON rp.material_id = m.id
+            LEFT JOIN supplier_lead_times lt ON lt.supplier_id = m.supplier_id
+        """, (reorder.DEFAULT_LEAD_TIME_DAYS,)).fetchdf()
 
 def get_stock_type():
-    return con.execute("""
-        SELECT 
-            i.id AS item_id,
-            i.item_name,
-            i.item_decription,
-            mc.category_name AS item_category_name,
-            m.id AS material_id,
-            m.unit_measurement,
-            m.material_cost,
-            m.current_stock,
-            m.minimum_stock,
-            m.maximum_stock,
-            s.contact_name AS supplier_name
-        FROM items i
-        JOIN materials m ON i.id = m.item_id
-        JOIN material_categories mc ON i.category_id = mc.id
-        JOIN suppliers s ON m.supplier_id = s.id
-    """).fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("""
+            SELECT 
+                i.id AS item_id,
+                i.item_name,
+                i.item_decription,
+                mc.category_name AS item_category_name,
+                m.id AS material_id,
+                m.unit_measurement,
+                m.material_cost,
+                m.current_stock,
+                m.minimum_stock,
+                m.maximum_stock,
+                s.contact_name AS supplier_name
+            FROM items i
+            JOIN materials m ON i.id = m.item_id
+            JOIN material_categories mc ON i.category_id = mc.id
+            JOIN suppliers s ON m.supplier_id = s.id
+        """).fetchdf()
 
   
+@write_transaction
 def update_materials(
     con,
     material_id: str,
@@ -1044,6 +1109,9 @@ def update_materials(
             own_cursor = False
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # read current values for audit details (before update) using cur
         old_mat = cur.execute(
             "SELECT unit_measurement, material_cost, current_stock, minimum_stock, maximum_stock, supplier_id "
@@ -1116,17 +1184,25 @@ def update_materials(
                 cur=cur
             )
 
+        alerts.mark_materials(cur, material_id)
+
         # commit only if we opened/owned the cursor/connection here
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
     except Exception as e:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise e
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
   
+@write_transaction
 def update_order_status(
     transaction_id: str, 
     new_status_code: str, 
@@ -1157,6 +1233,10 @@ def update_order_status(
             own_cursor = False
 
     try:
+        # The status change and its rollup moves commit together or not at all
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # Validate status_code exists
         status_row = cur.execute("""
             SELECT id FROM order_statuses WHERE status_code = ?
@@ -1175,12 +1255,14 @@ def update_order_status(
         old_status_code_row = cur.execute("SELECT status_code FROM order_statuses WHERE id = ?", (old_status_id,)).fetchone()
         old_status_code = old_status_code_row[0] if old_status_code_row else str(old_status_id)
 
-        # Update order transaction using cur
+        # Update order transaction using cur, moving its rollup contribution to the new status
+        rollups.record_orders(cur, transaction_id, sign=-1)
         cur.execute("""
             UPDATE order_transactions
             SET status_id = ?
             WHERE id = ?
         """, (status_row[0], transaction_id))
+        rollups.record_orders(cur, transaction_id)
 
         # write audit row if admin_id provided
         if admin_id is not None:
@@ -1193,16 +1275,23 @@ def update_order_status(
                 admin_id=admin_id,
                 cur=cur
             )
+        else:
+            table_versions.bump(cur, "order_transactions")
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
         return {"success": True}
 
     except Exception as e:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise e
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 def add_material(data: dict, admin_id: Optional[str] = None, cur=None):
@@ -1288,6 +1377,7 @@ def add_material(data: dict, admin_id: Optional[str] = None, cur=None):
             datetime.utcnow(),
             datetime.utcnow()
         )).fetchone()[0]
+        alerts.mark_materials(cur, material_id)
 
         # Audit log
         if admin_id is not None:
@@ -1299,9 +1389,13 @@ def add_material(data: dict, admin_id: Optional[str] = None, cur=None):
                 admin_id=admin_id,
                 cur=cur
             )
+        else:
+            table_versions.bump(cur, "materials")
 
    
         cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
         return item_id
 
     except HTTPException as e:
@@ -1321,12 +1415,13 @@ def add_material(data: dict, admin_id: Optional[str] = None, cur=None):
         raise HTTPException(status_code=500, detail=str(e))
 
   
+@write_transaction
 def stock_materials(
     data: dict,
     cur=None
 ):
     # items is required by existing callers
-    items = data.pop("items")
+    items = data["items"]
 
     conn_used = None
     own_cursor = False
@@ -1345,6 +1440,9 @@ def stock_materials(
 
     try:
         # Use cur for all DB operations so the audit can be in the same transaction
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # --- Step 0: Create or identify supplier
         supplier_id = data.get("supplier_id")
         if not supplier_id and "supplier" in data:
@@ -1373,6 +1471,7 @@ def stock_materials(
                 """, (
                     firstname, lastname, contact_name, contact_number, email, address, datetime.utcnow()
                 )).fetchone()[0]
+                table_versions.bump(cur, "suppliers")
 
         elif not supplier_id:
             raise ValueError("Either supplier_id or supplier details must be provided.")
@@ -1426,6 +1525,9 @@ def stock_materials(
                 WHERE id = ?
             """, (quantity, material_id))
 
+        rollups.record_stock_transactions(cur, stock_transaction_id)
+        alerts.mark_materials(cur, [item["material_id"] for item in items])
+
         # Audit the stock transaction (log admin_id or employee_id)
         actor_kwargs = {}
         if admin_id:
@@ -1447,7 +1549,9 @@ def stock_materials(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
         return {
             "transaction_id": stock_transaction_id,
@@ -1456,18 +1560,317 @@ def stock_materials(
 
     except Exception as e:
         if own_cursor and conn_used is not None:
+            rollback(cur)  # <-- undo all changes
+        raise e
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
+
+
+
+# Bulk stock-in: file readers DuckDB can stream from, by manifest format
+STOCK_MANIFEST_READERS = {
+    "csv": "read_csv('{path}', header = true, all_varchar = true)",
+    "jsonl": "read_json_auto('{path}', format = 'newline_delimited')",
+    # A .json manifest is usually one array of objects; 'auto' also takes JSON lines
+    "json": "read_json_auto('{path}', format = 'auto')",
+    "parquet": "read_parquet('{path}')",
+}
+# Accepted column names for each manifest field, in order of preference
+STOCK_MANIFEST_COLUMNS = {
+    "material": ("material_id", "material", "material_name"),
+    "supplier": ("supplier_id", "supplier", "supplier_name"),
+    "quantity": ("quantity", "qty"),
+}
+
+
+@write_transaction
+def import_stock_manifest(
+    path: str,
+    file_format: str,
+    admin_id: Optional[str] = None,
+    employee_id: Optional[str] = None,
+    stock_type_id: Optional[str] = None,
+    max_errors: int = 50
+):
+    """
+    Bulk stock-in from a delivery manifest (CSV, JSON, JSON lines or Parquet).
+
+    DuckDB streams the file into a temp table, materials (by id or item name)
+    and suppliers (by id or contact name) are resolved in one join, and the
+    whole manifest is applied with set-based statements in one transaction:
+    one stock transaction per supplier, one item row per manifest line.
+    Nothing is written if any line fails to resolve.
+    """
+    if file_format not in STOCK_MANIFEST_READERS:
+        raise ValueError(f"Unsupported manifest format '{file_format}'. Use csv, json, jsonl or parquet.")
+    if not admin_id and not employee_id:
+        raise ValueError("Either admin_id or employee_id must be provided.")
+
+    reader = STOCK_MANIFEST_READERS[file_format].format(path=path.replace("'", "''"))
+    cur = get_db_connection()
+    try:
+        # --- Step 1: Stream the manifest into a temp table ---
+        columns = {row[0].lower(): row[0] for row in cur.execute(f"DESCRIBE SELECT * FROM {reader}").fetchall()}
+
+        def pick(field):
+            names = [columns[c] for c in STOCK_MANIFEST_COLUMNS[field] if c in columns]
+            if not names:
+                raise ValueError(
+                    f"Manifest needs a {field} column ({' / '.join(STOCK_MANIFEST_COLUMNS[field])})."
+                )
+            return "COALESCE(" + ", ".join(f'NULLIF(TRIM(CAST("{n}" AS VARCHAR)), \'\')' for n in names) + ")"
+
+        cur.execute(f"""
+            CREATE OR REPLACE TEMP TABLE stock_import AS
+            SELECT
+                ROW_NUMBER() OVER () AS line_no,
+                {pick("material")} AS material_ref,
+                {pick("supplier")} AS supplier_ref,
+                TRY_CAST({pick("quantity")} AS DOUBLE) AS quantity
+            FROM {reader}
+        """)
+
+        # --- Step 2: Resolve material and supplier ids in one join ---
+        # Ids and names share one lookup; names that are not unique never resolve.
+        cur.execute("""
+            CREATE OR REPLACE TEMP TABLE stock_import_resolved AS
+            WITH material_keys AS (
+                SELECT key, id FROM (
+                    SELECT LOWER(m.id) AS key, m.id FROM materials m
+                    UNION ALL
+                    SELECT LOWER(i.item_name), m.id FROM materials m JOIN items i ON i.id = m.item_id
+                )
+                QUALIFY COUNT(*) OVER (PARTITION BY key) = 1
+            ),
+            supplier_keys AS (
+                SELECT key, id FROM (
+                    SELECT LOWER(s.id) AS key, s.id FROM suppliers s
+                    UNION ALL
+                    SELECT LOWER(s.contact_name), s.id FROM suppliers s
+                )
+                QUALIFY COUNT(*) OVER (PARTITION BY key) = 1
+            )
+            SELECT si.line_no, si.material_ref, si.supplier_ref, si.quantity,
+                   mk.id AS material_id, sk.id AS supplier_id
+            FROM stock_import si
+            LEFT JOIN material_keys mk ON mk.key = LOWER(si.material_ref)
+            LEFT JOIN supplier_keys sk ON sk.key = LOWER(si.supplier_ref)
+        """)
+
+        errors = cur.execute("""
+            SELECT line_no,
+                   CASE
+                       WHEN material_id IS NULL THEN 'Unknown material: ' || COALESCE(material_ref, '(blank)')
+                       WHEN supplier_id IS NULL THEN 'Unknown supplier: ' || COALESCE(supplier_ref, '(blank)')
+                       ELSE 'Invalid quantity'
+                   END AS message
+            FROM stock_import_resolved
+            WHERE material_id IS NULL OR supplier_id IS NULL OR quantity IS NULL OR quantity <= 0
+            ORDER BY line_no
+            LIMIT ?
+        """, (max_errors,)).fetchall()
+        line_count = cur.execute("SELECT COUNT(*) FROM stock_import_resolved").fetchone()[0]
+
+        if errors or line_count == 0:
+            return {
+                "success": False,
+                "lines": line_count,
+                "message": "Manifest rejected; nothing was stocked." if errors else "Manifest is empty.",
+                "errors": [{"line": line_no, "message": message} for line_no, message in errors],
+            }
+
+        # --- Step 3: Determine stock_type_id (same default as stock_materials) ---
+        if not stock_type_id:
+            result = cur.execute("""
+                SELECT id FROM stock_types WHERE type_code = 'STT001'
+            """).fetchone()
+            if not result:
+                raise ValueError("Stock type 'STT001' not found in stock_types table.")
+            stock_type_id = result[0]
+
+        cur.execute("BEGIN")
+        try:
+            # --- Step 4: One stock transaction per supplier ---
+            headers = cur.execute("""
+                INSERT INTO stock_transactions (
+                    stock_type_id, supplier_id, admin_id, employee_id, date_created
+                )
+                SELECT ?, supplier_id, ?, ?, ?
+                FROM (SELECT DISTINCT supplier_id FROM stock_import_resolved)
+                RETURNING id, supplier_id
+            """, (stock_type_id, admin_id, employee_id, datetime.utcnow())).fetchall()
+
+            cur.execute("CREATE OR REPLACE TEMP TABLE stock_import_headers (id VARCHAR, supplier_id VARCHAR)")
+            cur.execute(f"""
+                INSERT INTO stock_import_headers
+                VALUES {", ".join(["(?, ?)"] * len(headers))}
+            """, [v for row in headers for v in row])
+
+            # --- Step 5: Ledger items and stock increments, set-based ---
+            cur.execute("""
+                INSERT INTO stock_transaction_items (stock_transaction_id, material_id, quantity)
+                SELECT h.id, r.material_id, r.quantity
+                FROM stock_import_resolved r
+                JOIN stock_import_headers h ON h.supplier_id = r.supplier_id
+                ORDER BY r.line_no
+            """)
+            cur.execute("""
+                UPDATE materials
+                SET current_stock = current_stock + d.qty
+                FROM (
+                    SELECT material_id, SUM(quantity) AS qty
+                    FROM stock_import_resolved
+                    GROUP BY material_id
+                ) d
+                WHERE materials.id = d.material_id
+            """)
+
+            stock_transaction_ids = [row[0] for row in headers]
+            rollups.record_stock_transactions(cur, stock_transaction_ids)
+            alerts.mark_materials(cur, [row[0] for row in cur.execute(
+                "SELECT DISTINCT material_id FROM stock_import_resolved"
+            ).fetchall()])
+
+            # Audit each stock transaction (log admin_id or employee_id)
+            actor_kwargs = {"admin_id": admin_id} if admin_id else {"employee_id": employee_id}
+            per_supplier = dict(cur.execute("""
+                SELECT supplier_id, COUNT(*) FROM stock_import_resolved GROUP BY supplier_id
+            """).fetchall())
+            for stock_transaction_id, supplier_id in headers:
+                log_audit(
+                    entity="stock_transactions",
+                    entity_id=str(stock_transaction_id),
+                    action="create",
+                    details=f"Bulk stock-in import: stock transaction id={stock_transaction_id}, "
+                            f"supplier={supplier_id}, items={per_supplier.get(supplier_id, 0)}",
+                    cur=cur,
+                    **actor_kwargs
+                )
+
+            cur.execute("COMMIT")
+        except Exception:
+            rollback(cur)
+            raise
+        chart_cache.invalidate()
+        events.changed()
+
+        return {
+            "success": True,
+            "lines": line_count,
+            "transaction_ids": stock_transaction_ids,
+            "message": f"{line_count} line(s) stocked in {len(headers)} transaction(s)."
+        }
+    finally:
+        for table in ("stock_import", "stock_import_resolved", "stock_import_headers"):
             try:
-                conn_used.rollback()  # <-- undo all changes
+                cur.execute(f"DROP TABLE IF EXISTS {table}")
             except Exception:
-                pass  # no transaction active, ignore
-        raise e
+                pass
+        cur.close()
 
 
+# Transaction listings are paged newest first by keyset on (date_created, id):
+# the cursor token carries the last row's key, so every page is one index-range
+# read no matter how deep into the history it is.
+def _encode_cursor(date_created, row_id) -> str:
+    raw = json.dumps([date_created.isoformat(), row_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
 
-def get_stock_transactions_detailed():
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
-        return conn.execute("""
+
+def _decode_cursor(token: str):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        date_created, row_id = json.loads(raw)
+        return datetime.fromisoformat(date_created), str(row_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid pagination cursor")
+
+
+def _page_filters(alias, cursor_token, date_from, date_to):
+    """WHERE clauses/params shared by the listing queries (cursor + date range)."""
+    where, params = [], []
+    if cursor_token:
+        last_date, last_id = _decode_cursor(cursor_token)
+        # The first conjunct keeps the date column prunable
+        where.append(
+            f"{alias}.date_created <= ? AND ({alias}.date_created < ? OR {alias}.id < ?)"
+        )
+        params += [last_date, last_date, last_id]
+    if date_from or date_to:
+        # date_to is inclusive of the whole day
+        in_range, range_params = periods.range_sql(f"{alias}.date_created", periods.date_range(date_from, date_to))
+        where.append(in_range)
+        params += range_params
+    return where, params
+
+
+def _next_page(rows, limit):
+    """Split limit+1 (date_created, id) rows into the page ids and next cursor."""
+    next_cursor = _encode_cursor(*rows[limit - 1]) if len(rows) > limit else None
+    return [row[1] for row in rows[:limit]], next_cursor
+
+
+def get_stock_transactions_detailed(
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    date_from=None,
+    date_to=None,
+    stock_type: Optional[str] = None,
+    supplier_id: Optional[str] = None,
+    material_id: Optional[str] = None,
+    q: Optional[str] = None
+):
+    """
+    One page of stock transactions (newest first), one row per line item.
+    `limit` counts transactions; returns (DataFrame, next_cursor or None).
+    """
+    where, params = _page_filters("st", cursor, date_from, date_to)
+    if stock_type:
+        where.append("(stt.type_code = ? OR stt.id = ?)")
+        params += [stock_type, stock_type]
+    if supplier_id:
+        where.append("st.supplier_id = ?")
+        params.append(supplier_id)
+    if material_id:
+        where.append("""EXISTS (
+            SELECT 1 FROM stock_transaction_items x
+            WHERE x.stock_transaction_id = st.id AND x.material_id = ?
+        )""")
+        params.append(material_id)
+    if q:
+        pattern = f"%{q.strip()}%"
+        where.append("""(
+            st.id ILIKE ? OR CONCAT(s.firstname, ' ', s.lastname) ILIKE ? OR s.contact_name ILIKE ?
+            OR s.contact_number ILIKE ?
+            OR EXISTS (
+                SELECT 1 FROM stock_transaction_items x
+                JOIN materials xm ON x.material_id = xm.id
+                JOIN items xi ON xm.item_id = xi.id
+                WHERE x.stock_transaction_id = st.id AND xi.item_name ILIKE ?
+            )
+        )""")
+        params += [pattern] * 5
+
+    with db_cursor() as conn:
+        keys = conn.execute(f"""
+            SELECT st.date_created, st.id
+            FROM stock_transactions st
+            JOIN stock_transaction_types stt ON st.stock_type_id = stt.id
+            JOIN suppliers s ON st.supplier_id = s.id
+            WHERE {" AND ".join(where) or "TRUE"}
+            ORDER BY st.date_created DESC, st.id DESC
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
+        ids, next_cursor = _next_page(keys, limit)
+        if not ids:
+            ids = [None]
+
+        item_filter, item_params = "", []
+        if material_id:
+            item_filter, item_params = "AND sti.material_id = ?", [material_id]
+
+        df = conn.execute(f"""
             SELECT 
                 st.id AS transaction_id,
                 st.date_created,
@@ -1511,11 +1914,13 @@ def get_stock_transactions_detailed():
             JOIN items i ON m.item_id = i.id
             JOIN unit_measurements um ON m.unit_measurement = um.measurement_code
 
-            ORDER BY st.date_created DESC
-        """).fetchdf()
-
+            WHERE st.id IN ({",".join(["?"] * len(ids))}) {item_filter}
+            ORDER BY st.date_created DESC, st.id DESC, sti.id
+        """, ids + item_params).fetchdf()
+    return df, next_cursor
 
   
+@write_transaction
 def delete_material(
     material_id: str,
     admin_id: Optional[str] = None,
@@ -1537,6 +1942,9 @@ def delete_material(
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # Get the item_id from the material first
         row = cur.execute("SELECT item_id FROM materials WHERE id = ?", (material_id,)).fetchone()
         if not row:
@@ -1547,6 +1955,8 @@ def delete_material(
         # Delete from referencing tables first to avoid FK constraint issues
         cur.execute("DELETE FROM product_materials WHERE material_id = ?", (material_id,))
         cur.execute("DELETE FROM stock_transaction_items WHERE material_id = ?", (material_id,))
+        rollups.remove_material(cur, material_id)
+        alerts.mark_materials(cur, material_id)
 
         # Then delete the material and its item
         cur.execute("DELETE FROM materials WHERE id = ?", (material_id,))
@@ -1563,24 +1973,33 @@ def delete_material(
                 admin_id=admin_id,
                 cur=cur
             )
+        else:
+            table_versions.bump(cur, "materials")
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
         return {"success": True, "message": "Material and corresponding item deleted successfully."}
     except Exception as e:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         # keep original behavior of returning failure dict for caller handling
         # but re-raise so callers that expect exceptions still get them
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 
 #Customer CRUD
 def get_customers():
-    return con.execute("SELECT * FROM customers").fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("SELECT * FROM customers").fetchdf()
 
   
+@write_transaction
 def add_customer(data: dict, admin_id: Optional[str] = None, cur=None):
     if admin_id is None:
         raise ValueError("admin_id is required for audit logging (admin only)")
@@ -1617,6 +2036,9 @@ def add_customer(data: dict, admin_id: Optional[str] = None, cur=None):
         return {"success": False, "message": "Customer already exists."}
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         new_id = cur.execute("""
             INSERT INTO customers (
                 firstname, lastname, contact_number, email, address, date_created
@@ -1635,15 +2057,19 @@ def add_customer(data: dict, admin_id: Optional[str] = None, cur=None):
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
 
         return {"success": True, "message": "Customer added successfully."}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def update_customer(id: str, data: dict, admin_id: Optional[str] = None, cur=None):
     if admin_id is None:
         raise ValueError("admin_id is required for audit logging (admin only)")
@@ -1670,6 +2096,9 @@ def update_customer(id: str, data: dict, admin_id: Optional[str] = None, cur=Non
     contact_number = data['contact_number'].strip()
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute(
             "SELECT firstname, lastname, contact_number, email, address FROM customers WHERE id = ?", (id,)
         ).fetchone()
@@ -1705,17 +2134,21 @@ def update_customer(id: str, data: dict, admin_id: Optional[str] = None, cur=Non
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 # def delete_customer(id: str):
 #     con.execute("DELETE FROM customers WHERE id = ?", (id,))
 
   
+@write_transaction
 def delete_customer(id: str, admin_id: Optional[str] = None, cur=None):
     if admin_id is None:
         raise ValueError("admin_id is required for audit logging (admin only)")
@@ -1736,6 +2169,9 @@ def delete_customer(id: str, admin_id: Optional[str] = None, cur=None):
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute("SELECT firstname, lastname, contact_number, email, address FROM customers WHERE id = ?", (id,)).fetchone()
         if not old_row:
             raise ValueError("Customer not found.")
@@ -1756,18 +2192,19 @@ def delete_customer(id: str, admin_id: Optional[str] = None, cur=None):
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 #Products CRUD
 def get_products():
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
-
+    with db_cursor() as conn:
         return conn.execute("""
             SELECT 
                 i.id AS item_id,
@@ -1787,6 +2224,7 @@ def get_products():
 
 
   
+@write_transaction
 def add_product(data: dict, admin_id: Optional[str] = None, cur=None):
     if admin_id is None:
         raise ValueError("admin_id is required for audit logging (admin only)")
@@ -1820,6 +2258,9 @@ def add_product(data: dict, admin_id: Optional[str] = None, cur=None):
         return {"success": False, "message": f"Item already exists with name: {item_name}"}
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # Step 1: Insert into items first and get item_id
         item_id = cur.execute("""
             INSERT INTO items (
@@ -1855,15 +2296,21 @@ def add_product(data: dict, admin_id: Optional[str] = None, cur=None):
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
         return {"success": True, "product_id": item_id, "message": "Product added successfully."}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
   
+@write_transaction
 def update_product(
     con,
     product_id: str,
@@ -1913,6 +2360,9 @@ def update_product(
         raise ValueError(f"Item name '{item_name}' already exists.")
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # Update products table
         cur.execute("""
             UPDATE products 
@@ -1954,23 +2404,27 @@ def update_product(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def delete_product(product_id: str, admin_id: Optional[str] = None, cur=None):
     if admin_id is None:
         raise ValueError("admin_id is required for audit logging (admin only)")
 
     conn_used = None
     own_cursor = False
-    # prefer using provided cursor/conn; else create a local connection like before
     if cur is None:
-        conn_used = duckdb.connect(DB_PATH)
-        # conn_used = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+        conn_used = con
         cur = conn_used.cursor()
         own_cursor = True
     else:
@@ -1980,11 +2434,12 @@ def delete_product(product_id: str, admin_id: Optional[str] = None, cur=None):
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # Get the corresponding item_id from the product
         item_result = cur.execute("SELECT item_id FROM products WHERE id = ?", (product_id,)).fetchone()
         if not item_result:
-            if own_cursor and conn_used is not None:
-                conn_used.close() if hasattr(conn_used, "close") else None
             return {"success": False, "message": "Product not found."}
         
         item_id = item_result[0]
@@ -1995,6 +2450,7 @@ def delete_product(product_id: str, admin_id: Optional[str] = None, cur=None):
 
         # Delete from referencing tables first to avoid FK constraint issues
         cur.execute("DELETE FROM product_materials WHERE product_id = ?", (product_id,))
+        rollups.remove_product(cur, product_id)
         cur.execute("DELETE FROM order_items WHERE product_id = ?", (product_id,))
         
         # Then delete from main product and item tables
@@ -2015,27 +2471,31 @@ def delete_product(product_id: str, admin_id: Optional[str] = None, cur=None):
         )
 
         if own_cursor and conn_used is not None:
-            # commit and close local conn
-            conn_used.commit()
-            if hasattr(conn_used, "close"):
-                conn_used.close()
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
         return {"success": True, "message": "Product, item, and all references deleted."}
     except Exception as e:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
-            if hasattr(conn_used, "close"):
-                conn_used.close()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 
 #Suppliers CRUD
 def get_suppliers():
-        with duckdb.connect(DB_PATH) as conn:
-        # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
-            return conn.execute("SELECT * FROM suppliers").fetchdf()
+    with db_cursor() as conn:
+        return conn.execute("""
+            SELECT s.*, COALESCE(lt.lead_time_days, ?) AS lead_time_days
+            FROM suppliers s
+            LEFT JOIN supplier_lead_times lt ON lt.supplier_id = s.id
+        """, (reorder.DEFAULT_LEAD_TIME_DAYS,)).fetchdf()
 
   
+@write_transaction
 def add_supplier(
     data: dict,
     admin_id: Optional[str] = None,
@@ -2048,8 +2508,7 @@ def add_supplier(
     own_cursor = False
 
     if cur is None:
-        conn_used = duckdb.connect(DB_PATH)
-        # conn_used = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+        conn_used = con
         cur = conn_used.cursor()
         own_cursor = True
     else:
@@ -2059,6 +2518,9 @@ def add_supplier(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # Normalize input
         firstname = data['firstname'].strip().title()
         lastname = data['lastname'].strip().title()
@@ -2097,14 +2559,18 @@ def add_supplier(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "message": "Supplier added successfully."}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
   
+@write_transaction
 def update_supplier(
     id: str, 
     data: dict,
@@ -2118,8 +2584,7 @@ def update_supplier(
     own_cursor = False
 
     if cur is None:
-        conn_used = duckdb.connect(DB_PATH)
-        # conn_used = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+        conn_used = con
         cur = conn_used.cursor()
         own_cursor = True
     else:
@@ -2129,6 +2594,9 @@ def update_supplier(
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         firstname = data['firstname'].strip().title()
         lastname = data['lastname'].strip().title()
         contact_name = data['contact_name'].strip().title()
@@ -2182,14 +2650,83 @@ def update_supplier(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "updated": 1}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
+
+
+@write_transaction
+def update_supplier_lead_time(
+    id: str,
+    lead_time_days: float,
+    admin_id: Optional[str] = None,
+    cur = None
+):
+    """Set a supplier's replenishment lead time and replan reorder points with it."""
+    if admin_id is None:
+        raise ValueError("admin_id is required for audit logging (admin only)")
+    if lead_time_days <= 0:
+        raise ValueError("Lead time must be a positive number of days.")
+
+    own_cursor = cur is None
+    if own_cursor:
+        cur = con.cursor()
+
+    try:
+        if own_cursor:
+            cur.execute("BEGIN")
+
+        if not cur.execute("SELECT 1 FROM suppliers WHERE id = ?", (id,)).fetchone():
+            raise ValueError("Supplier information not found.")
+
+        old_row = cur.execute(
+            "SELECT lead_time_days FROM supplier_lead_times WHERE supplier_id = ?", (id,)
+        ).fetchone()
+        old_days = old_row[0] if old_row else reorder.DEFAULT_LEAD_TIME_DAYS
+
+        cur.execute("""
+            INSERT INTO supplier_lead_times VALUES (?, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (supplier_id) DO UPDATE SET
+                lead_time_days = EXCLUDED.lead_time_days,
+                date_updated = EXCLUDED.date_updated
+        """, (id, lead_time_days))
+
+        # Reorder points of this supplier's materials move with the lead time
+        reorder.rebuild_plan(cur)
+        alerts.mark_materials(cur, [row[0] for row in cur.execute(
+            "SELECT id FROM materials WHERE supplier_id = ?", (id,)
+        ).fetchall()])
+
+        log_audit(
+            entity="suppliers",
+            entity_id=str(id),
+            action="update",
+            details=f"Updated {id} lead time: {old_days} -> {lead_time_days} days",
+            admin_id=admin_id,
+            cur=cur
+        )
+
+        if own_cursor:
+            cur.execute("COMMIT")
+            chart_cache.invalidate()
+            events.changed()
+        return {"success": True, "lead_time_days": lead_time_days}
+    except Exception:
+        if own_cursor:
+            rollback(cur)
+        raise
+    finally:
+        if own_cursor:
+            cur.close()
 
   
+@write_transaction
 def delete_supplier(
     id: str,
     admin_id: Optional[str] =  None,
@@ -2202,8 +2739,7 @@ def delete_supplier(
     own_cursor = False
 
     if cur is None:
-        conn_used = duckdb.connect(DB_PATH)
-        # conn_used = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+        conn_used = con
         cur = conn_used.cursor()
         own_cursor = True
     else:
@@ -2213,6 +2749,9 @@ def delete_supplier(
             own_cursor = True
     
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         old_row = cur.execute(
             """
             SELECT
@@ -2251,251 +2790,324 @@ def delete_supplier(
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "deleted": 1}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
-
-def create_order_transaction(data: dict, admin_id: Optional[str] = None, cur=None):
-    items = data.pop('items')
-    total_amount = 0.0
-
-    customer_id = data.get('customer_id')
-    customer_data = data.get('customer')
-
-    conn_used = None
-    own_cursor = False
-    started_txn = False
-
-    if cur is None:
-        try:
-            conn_used = con
-        except NameError:
-            raise RuntimeError("Database connection `con` is not defined.")
-        cur = conn_used.cursor()
-        own_cursor = True
-    else:
-        if hasattr(cur, "cursor") and not hasattr(cur, "execute"):
-            conn_used = cur
-            cur = conn_used.cursor()
-            own_cursor = True
-
-    # Step 0: Create customer if needed
-    if not customer_id and customer_data:
-        customer_id = cur.execute("""
-            INSERT INTO customers (
-                firstname, lastname, contact_number, email, address, date_created
-            )
-            VALUES (?, ?, ?, ?, ?, ?)
-            RETURNING id
-        """, (
-            customer_data['firstname'].strip().title(),
-            customer_data['lastname'].strip().title(),
-            customer_data['contact_number'].strip(),
-            customer_data['email'].strip(),
-            customer_data['address'].strip().title(),
-            datetime.utcnow()
-        )).fetchone()[0]
-    elif not customer_id:
-        raise ValueError("Either customer_id or customer data must be provided.")
-
-    actor_admin = admin_id or data.get('admin_id')
-    actor_employee = None if actor_admin else data.get('employee_id')
-
-    try:
+    finally:
         if own_cursor and conn_used is not None:
-            conn_used.execute("BEGIN")
-            started_txn = True
+            cur.close()
 
-        # --- Step 1: Preload all product + material requirements ---
-        product_ids = [item['product_id'] for item in items]
-        product_placeholders = ",".join(["?"] * len(product_ids))
+def _load_order_catalog(cur, orders: list):
+    """
+    Load, with one query each, the BOM rows of every product and the stock
+    info of every material referenced by `orders`.
+    Returns (bom, materials): product_id -> [{material_id, used_qty, supplier_id}]
+    and material_id -> {available, item_name, unit, supplier_id}.
+    """
+    product_ids = list({item['product_id'] for data in orders for item in data['items']})
+    bom = {}
+    materials = {}
 
+    if product_ids:
         product_materials = cur.execute(f"""
             SELECT pm.product_id, pm.material_id, pm.used_quantity,
                    m.current_stock, i.item_name, m.unit_measurement, m.supplier_id
             FROM product_materials pm
             JOIN materials m ON pm.material_id = m.id
             JOIN items i ON m.item_id = i.id
-            WHERE pm.product_id IN ({product_placeholders})
+            WHERE pm.product_id IN ({",".join(["?"] * len(product_ids))})
         """, product_ids).fetchall()
 
-        # --- Step 2: Build material requirements ---
-        material_requirements = {}
-        material_map = {}
-
-        # Add normal product materials
-        for pm in product_materials:
-            (product_id, material_id, used_qty, current_stock,
-             item_name, unit, supplier_id) = pm
-
-            material_map.setdefault(product_id, []).append({
+        for (product_id, material_id, used_qty, current_stock,
+             item_name, unit, supplier_id) in product_materials:
+            bom.setdefault(product_id, []).append({
                 "material_id": material_id,
                 "used_qty": used_qty,
                 "supplier_id": supplier_id
             })
+            materials.setdefault(material_id, {
+                "available": current_stock,
+                "item_name": item_name,
+                "unit": unit,
+                "supplier_id": supplier_id
+            })
 
-            if material_id not in material_requirements:
-                material_requirements[material_id] = {
-                    "needed": 0,
-                    "available": current_stock,
-                    "item_name": item_name,
-                    "unit": unit,
-                    "supplier_id": supplier_id
-                }
+    # Selected glass/materials that are not part of any BOM above
+    extra_material_ids = list({
+        m.get("selected_glass_id") or m.get("original_material_id")
+        for data in orders for item in data['items'] for m in (item.get("materials") or [])
+        if (m.get("selected_glass_id") or m.get("original_material_id")) not in materials
+    } - {None, ""})
+
+    if extra_material_ids:
+        rows = cur.execute(f"""
+            SELECT m.id, m.supplier_id, m.current_stock, i.item_name, m.unit_measurement
+            FROM materials m
+            JOIN items i ON m.item_id = i.id
+            WHERE m.id IN ({",".join(["?"] * len(extra_material_ids))})
+        """, extra_material_ids).fetchall()
+        for row in rows:
+            materials[row[0]] = {
+                "available": row[2],
+                "item_name": row[3],
+                "unit": row[4],
+                "supplier_id": row[1]
+            }
 
-        # --- Step 2a: Include selected glass/materials in requirements ---
-        for item in items:
-            for m in item.get("materials", []):
-                material_id_to_use = m.get("selected_glass_id") or m.get("original_material_id")
-                if not material_id_to_use:
-                    # Skip if no glass/material is selected, this is fine for non-glass products
-                    continue
-
-                if material_id_to_use not in material_requirements:
-                    row = cur.execute("""
-                        SELECT m.supplier_id, m.current_stock, i.item_name, m.unit_measurement
-                        FROM materials m
-                        JOIN items i ON m.item_id = i.id
-                        WHERE m.id = ?
-                    """, (material_id_to_use,)).fetchone()
-                    if row:
-                        material_requirements[material_id_to_use] = {
-                            "needed": 0,
-                            "available": row[1],
-                            "item_name": row[2],
-                            "unit": row[3],
-                            "supplier_id": row[0]
-                        }
-                    else:
-                        raise HTTPException(status_code=400, detail=f"Material {material_id_to_use} not found")
-
-        # --- Step 2b: Calculate total needed quantities ---
-        for item in items:
-            # standard product materials
-            for m in material_map.get(item['product_id'], []):
-                total_needed = m['used_qty'] * item['quantity']
-                material_requirements[m['material_id']]["needed"] += total_needed
-
-            # custom/selected materials
-            for m in item.get("materials", []):
-                material_id_to_use = m.get("selected_glass_id") or m.get("original_material_id")
-                total_needed = m['used_quantity'] * item['quantity']
-                material_requirements[material_id_to_use]["needed"] += total_needed
-
-        # --- Step 2c: Check insufficient stock ---
-        lacking_materials = [
-            f"{v['item_name']} (Need: {v['needed']} {v['unit']}, Available: {v['available']} {v['unit']})"
-            for v in material_requirements.values() if v["needed"] > v["available"]
-        ]
-        if lacking_materials:
-            formatted = "Insufficient material stock for:\n" + "\n".join(f"• {x}" for x in lacking_materials)
-            raise HTTPException(status_code=400, detail=formatted)
-
-        # --- Step 3: Fetch product prices ---
-        price_rows = cur.execute(f"""
-            SELECT id, unit_price FROM products
-            WHERE id IN ({product_placeholders})
-        """, product_ids).fetchall()
-        price_map = {r[0]: r[1] for r in price_rows}
+    return bom, materials
+
+
+def _plan_order(items: list, bom: dict, materials: dict, available: dict):
+    """
+    Check one order against the running stock in `available` and work out
+    its order lines, stock-out lines and per-material deductions.
+    `available` is only reduced when the order fits. Raises HTTPException(400).
+    """
+    # --- Material requirements: standard product materials + custom/selected materials ---
+    needed = defaultdict(float)
+    for item in items:
+        for m in bom.get(item['product_id'], []):
+            needed[m['material_id']] += m['used_qty'] * item['quantity']
+
+        for m in item.get("materials") or []:
+            material_id_to_use = m.get("selected_glass_id") or m.get("original_material_id")
+            if not material_id_to_use:
+                raise HTTPException(status_code=400, detail=f"Material ID missing for {m.get('item_name')}")
+            if material_id_to_use not in materials:
+                raise HTTPException(status_code=400, detail=f"Material {material_id_to_use} not found")
+            needed[material_id_to_use] += m['used_quantity'] * item['quantity']
+
+    # --- Check insufficient stock ---
+    lacking_materials = [
+        f"{materials[mid]['item_name']} (Need: {qty} {materials[mid]['unit']}, "
+        f"Available: {available[mid]} {materials[mid]['unit']})"
+        for mid, qty in needed.items() if qty > available[mid]
+    ]
+    if lacking_materials:
+        formatted = "Insufficient material stock for:\n" + "\n".join(f"• {x}" for x in lacking_materials)
+        raise HTTPException(status_code=400, detail=formatted)
 
-        # --- Step 4: Insert order transaction ---
-        transaction_id = cur.execute("""
+    # --- Order lines and material deductions ---
+    total_amount = 0.0
+    order_lines = []
+    stock_lines = []                       # one (material_id, qty_used) per selected material, in order
+    deductions = defaultdict(float)        # material_id -> total to take off current_stock
+
+    for item in items:
+        qty = item['quantity']
+        if item.get("unit_price") is None:
+            raise HTTPException(status_code=400, detail=f"unit_price missing for product {item['product_id']}")
+        unit_price = float(item["unit_price"])
+        misc_fee = float(item.get("misc_fee") or 0)
+
+        total_amount += qty * unit_price * (1 + misc_fee / 100)
+        order_lines.append((item['product_id'], qty, unit_price))
+
+        for m in item.get("materials") or []:
+            material_id_to_use = m.get("selected_glass_id") or m.get("original_material_id")
+            total_used = float(m.get('used_quantity') or 0) * qty
+            if total_used > 0:
+                deductions[material_id_to_use] += total_used
+            stock_lines.append((material_id_to_use, total_used))
+
+    for mid, qty in deductions.items():
+        available[mid] -= qty
+
+    return {
+        "total_amount": total_amount,
+        "order_lines": order_lines,
+        "stock_lines": stock_lines,
+        "deductions": deductions,
+    }
+
+
+def _write_orders(cur, orders: list, plans: list, materials: dict, actor_admin=None, actor_employee=None):
+    """
+    Insert planned orders (already validated by _plan_order) with set-based
+    statements: one header insert and audit row per order, and a single
+    statement each for all order items, stock deductions, stock-out headers
+    and stock-out items. Runs inside the caller's transaction.
+    Returns the new order_transactions ids, in order.
+    """
+    now = datetime.utcnow()
+
+    # --- Order headers ---
+    transaction_ids = []
+    for data, plan in zip(orders, plans):
+        transaction_ids.append(cur.execute("""
             INSERT INTO order_transactions (
                 customer_id, status_id, admin_id, date_created, total_amount
             ) VALUES (?, ?, ?, ?, ?)
             RETURNING id
         """, (
-            customer_id,
+            data['customer_id'],
             data['status_id'],
             actor_admin,
-            datetime.utcnow(),
-            0.0
-        )).fetchone()[0]
-
-        # --- Step 5: Batch inserts ---
-        order_items_data = []
-        stock_transactions_data = []
-        stock_items_data = []
-
-        for item in items:
-            pid = item['product_id']
-            qty = item['quantity']
-            unit_price = float(item.get("unit_price"))
-            misc_fee = float(item.get("misc_fee", 0))
-            
-            line_total = qty * unit_price * (1 + misc_fee / 100)
-            total_amount += line_total
-            order_items_data.append((transaction_id, pid, qty, unit_price))
-
-            order_items_data.append((transaction_id, pid, qty, unit_price))
-            
-            for m in item.get("materials", []):
-                material_id_to_use = m.get("selected_glass_id") or m.get("original_material_id")
-                if not material_id_to_use:
-                    raise HTTPException(status_code=400, detail=f"Material ID missing for {m.get('item_name')}")
-
-                used_qty = float(m.get('used_quantity') or 0)
-                total_used = used_qty * qty
-
-                if total_used > 0:
-                    cur.execute("""
-                        UPDATE materials
-                        SET current_stock = current_stock - ?
-                        WHERE id = ?
-                    """, (total_used, material_id_to_use))
-
-                stock_transactions_data.append((
-                    'STT002',
-                    material_requirements[material_id_to_use]['supplier_id'],
-                    actor_admin,
-                    datetime.utcnow()
-                ))
-                stock_items_data.append((material_id_to_use, total_used))
-
-
-        cur.executemany("""
+            now,
+            plan['total_amount']
+        )).fetchone()[0])
+
+    # --- Order items ---
+    order_items_params = [
+        v
+        for transaction_id, plan in zip(transaction_ids, plans)
+        for line in plan['order_lines']
+        for v in (transaction_id, *line)
+    ]
+    if order_items_params:
+        cur.execute(f"""
             INSERT INTO order_items (order_id, product_id, quantity, unit_price)
-            VALUES (?, ?, ?, ?)
-        """, order_items_data)
-
-        # --- Step 6: Stock transactions ---
-        for idx, tx in enumerate(stock_transactions_data):
-            stock_txn_id = cur.execute("""
-                INSERT INTO stock_transactions (
-                    stock_type_id, supplier_id, admin_id, employee_id, date_created
-                ) VALUES (?, ?, ?, NULL, ?)
-                RETURNING id
-            """, tx).fetchone()[0]
-
-            material_id, qty_used = stock_items_data[idx]
-            cur.execute("""
-                INSERT INTO stock_transaction_items (
-                    stock_transaction_id, material_id, quantity
-                ) VALUES (?, ?, ?)
-            """, (stock_txn_id, material_id, qty_used))
-
-        # --- Step 7: Update total ---
-        cur.execute("""
-            UPDATE order_transactions
-            SET total_amount = ?
-            WHERE id = ?
-        """, (total_amount, transaction_id))
+            VALUES {", ".join(["(?, ?, ?, ?)"] * (len(order_items_params) // 4))}
+        """, order_items_params)
+
+    # --- Material deductions, summed across the orders ---
+    deductions = defaultdict(float)
+    for plan in plans:
+        for mid, qty in plan['deductions'].items():
+            deductions[mid] += qty
+    if deductions:
+        # The plans were checked against stock read before this transaction
+        # (import_orders validates its whole batch up front), so only take
+        # stock that is still there
+        updated = cur.execute(f"""
+            UPDATE materials
+            SET current_stock = current_stock - d.qty
+            FROM (VALUES {", ".join(["(CAST(? AS VARCHAR), CAST(? AS DOUBLE))"] * len(deductions))}) AS d(material_id, qty)
+            WHERE materials.id = d.material_id AND materials.current_stock >= d.qty
+            RETURNING materials.id
+        """, [v for row in deductions.items() for v in row]).fetchall()
+        short = set(deductions) - {row[0] for row in updated}
+        if short:
+            raise HTTPException(
+                status_code=400,
+                detail="Insufficient material stock for: " + ", ".join(sorted(materials[mid]['item_name'] for mid in short))
+            )
 
+    # --- Stock-out ledger: one header + item per selected material line ---
+    stock_lines = [line for plan in plans for line in plan['stock_lines']]
+    stock_txn_ids = []
+    if stock_lines:
+        header_params = []
+        for material_id, _ in stock_lines:
+            header_params += ['STT002', materials[material_id]['supplier_id'], actor_admin, now]
+        headers = cur.execute(f"""
+            INSERT INTO stock_transactions (
+                stock_type_id, supplier_id, admin_id, employee_id, date_created
+            ) VALUES {", ".join(["(?, ?, ?, NULL, ?)"] * len(stock_lines))}
+            RETURNING id, supplier_id
+        """, header_params).fetchall()
+
+        # Headers only differ by supplier, so pair each line with a header of its material's supplier
+        header_ids_by_supplier = defaultdict(list)
+        for stock_txn_id, supplier_id in headers:
+            header_ids_by_supplier[supplier_id].append(stock_txn_id)
+
+        stock_items_params = []
+        for material_id, qty_used in stock_lines:
+            stock_txn_id = header_ids_by_supplier[materials[material_id]['supplier_id']].pop(0)
+            stock_txn_ids.append(stock_txn_id)
+            stock_items_params += [stock_txn_id, material_id, qty_used]
+
+        cur.execute(f"""
+            INSERT INTO stock_transaction_items (
+                stock_transaction_id, material_id, quantity
+            ) VALUES {", ".join(["(?, ?, ?)"] * len(stock_lines))}
+        """, stock_items_params)
+
+    # --- Monthly rollups ---
+    rollups.record_orders(cur, transaction_ids)
+    rollups.record_stock_transactions(cur, stock_txn_ids)
+    alerts.mark_materials(cur, deductions)
+
+    for transaction_id, plan in zip(transaction_ids, plans):
         log_audit(
             entity="order_transactions",
             entity_id=str(transaction_id),
             action="create",
-            details=f"Order created: {len(items)} items, total={total_amount:.2f}",
+            details=f"Order created: {len(plan['order_lines'])} items, total={plan['total_amount']:.2f}",
             admin_id=actor_admin,
             employee_id=actor_employee,
             cur=cur
         )
 
+    return transaction_ids
+
+
+def _create_customer(cur, customer_data: dict):
+    table_versions.bump(cur, "customers")
+    return cur.execute("""
+        INSERT INTO customers (
+            firstname, lastname, contact_number, email, address, date_created
+        )
+        VALUES (?, ?, ?, ?, ?, ?)
+        RETURNING id
+    """, (
+        customer_data['firstname'].strip().title(),
+        customer_data['lastname'].strip().title(),
+        customer_data['contact_number'].strip(),
+        customer_data['email'].strip(),
+        customer_data['address'].strip().title(),
+        datetime.utcnow()
+    )).fetchone()[0]
+
+
+@write_transaction
+def create_order_transaction(data: dict, admin_id: Optional[str] = None, cur=None):
+    items = data['items']
+
+    customer_id = data.get('customer_id')
+    customer_data = data.get('customer')
+
+    conn_used = None
+    own_cursor = False
+    started_txn = False
+
+    if cur is None:
+        try:
+            conn_used = con
+        except NameError:
+            raise RuntimeError("Database connection `con` is not defined.")
+        cur = conn_used.cursor()
+        own_cursor = True
+    else:
+        if hasattr(cur, "cursor") and not hasattr(cur, "execute"):
+            conn_used = cur
+            cur = conn_used.cursor()
+            own_cursor = True
+
+    if not customer_id and not customer_data:
+        raise ValueError("Either customer_id or customer data must be provided.")
+
+    actor_admin = admin_id or data.get('admin_id')
+    actor_employee = None if actor_admin else data.get('employee_id')
+
+    try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+            started_txn = True
+
+        # Step 0: Create customer if needed (with the order, so a failed order leaves none behind)
+        if not customer_id:
+            customer_id = _create_customer(cur, customer_data)
+
+        # --- Step 1: Preload product BOMs + material stock ---
+        order = {**data, "customer_id": customer_id, "items": items}
+        bom, materials = _load_order_catalog(cur, [order])
+        available = {mid: m["available"] for mid, m in materials.items()}
+
+        # --- Step 2: Validate stock and plan lines/deductions ---
+        plan = _plan_order(items, bom, materials, available)
+
+        # --- Step 3: Set-based writes (constant number of statements per order) ---
+        transaction_id = _write_orders(cur, [order], [plan], materials, actor_admin, actor_employee)[0]
+
         if own_cursor and conn_used is not None and started_txn:
-            conn_used.execute("COMMIT")
+            cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
         return {
             "transaction_id": transaction_id,
@@ -2504,75 +3116,215 @@ def create_order_transaction(data: dict, admin_id: Optional[str] = None, cur=Non
 
     except Exception as e:
         if own_cursor and conn_used is not None and started_txn:
-            try:
-                conn_used.execute("ROLLBACK")
-            except Exception:
-                pass
+            rollback(cur)
+        if is_conflict(e):
+            raise  # retried by write_transaction
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
-        if own_cursor and conn_used is not None and started_txn:
-            conn_used.execute("COMMIT")
 
-        return {
-            "transaction_id": transaction_id,
-            "message": "Order successfully placed."
-        }
+@write_transaction
+def _import_order_chunk(chunk: list, materials: dict, admin_id: str):
+    """Write one chunk of planned (index, order, plan) entries in its own transaction. Returns their ids."""
+    cur = get_db_connection()
+    try:
+        cur.execute("BEGIN")
+        orders = [
+            {**data, "customer_id": data.get('customer_id') or _create_customer(cur, data['customer'])}
+            for _, data, _ in chunk
+        ]
+        transaction_ids = _write_orders(cur, orders, [plan for _, _, plan in chunk], materials, admin_id)
+        cur.execute("COMMIT")
+        return transaction_ids
+    except Exception:
+        rollback(cur)
+        raise
+    finally:
+        cur.close()
 
-    except Exception as e:
-        if own_cursor and conn_used is not None and started_txn:
+
+def import_orders(orders: list, admin_id: Optional[str] = None, chunk_size: int = 100):
+    """
+    Bulk version of create_order_transaction for many orders at once.
+
+    Product BOMs and material stock are loaded once for the whole batch and
+    every order is validated against the stock left by the orders before it.
+    Orders that fail validation are reported and skipped; the rest are
+    written `chunk_size` orders per transaction. Items without `materials`
+    use their product's BOM. Returns a per-order result list.
+    """
+    if admin_id is None:
+        raise ValueError("admin_id is required for bulk order import (admin only)")
+
+    results = [None] * len(orders)
+    imported = 0
+    cur = get_db_connection()
+    try:
+        bom, materials = _load_order_catalog(cur, orders)
+        available = {mid: m["available"] for mid, m in materials.items()}
+
+        # --- Validate the whole batch in memory ---
+        planned = []   # (index, order, plan)
+        for idx, data in enumerate(orders):
             try:
-                conn_used.execute("ROLLBACK")
-            except Exception:
-                pass
-        raise HTTPException(status_code=500, detail=str(e))
+                if not data.get('customer_id') and not data.get('customer'):
+                    raise ValueError("Either customer_id or customer data must be provided.")
+                if not data.get('items'):
+                    raise ValueError("Order has no items.")
+                for item in data['items']:
+                    if item.get("materials") is None:
+                        item["materials"] = [
+                            {"original_material_id": m["material_id"], "used_quantity": m["used_qty"]}
+                            for m in bom.get(item['product_id'], [])
+                        ]
+                planned.append((idx, data, _plan_order(data['items'], bom, materials, available)))
+            except HTTPException as e:
+                results[idx] = {"index": idx, "success": False, "message": e.detail}
+            except (KeyError, TypeError, ValueError) as e:
+                results[idx] = {"index": idx, "success": False, "message": str(e)}
+
+        # --- Write valid orders in chunked transactions ---
+        for start in range(0, len(planned), chunk_size):
+            chunk = planned[start:start + chunk_size]
+            try:
+                transaction_ids = _import_order_chunk(chunk, materials, admin_id)
+            except Exception as e:
+                for idx, _, _ in chunk:
+                    message = e.detail if isinstance(e, HTTPException) else e
+                    results[idx] = {"index": idx, "success": False, "message": f"Chunk rolled back: {message}"}
+                continue
+
+            imported += len(chunk)
+            for (idx, _, _), transaction_id in zip(chunk, transaction_ids):
+                results[idx] = {"index": idx, "success": True, "transaction_id": transaction_id}
+
+        if imported:
+            chart_cache.invalidate()
+            events.changed()
+    finally:
+        cur.close()
+
+    return {
+        "total": len(orders),
+        "imported": imported,
+        "failed": len(orders) - imported,
+        "results": results,
+    }
 
-def get_order_transactions_detailed():
-    return con.execute("""
-        SELECT 
-            ot.id AS transaction_id,
-            CONCAT(c.firstname, ' ', c.lastname) AS customer_name,
-            c.contact_number,
-            c.email AS customer_email,
-            c.address,
+def get_order_transactions_detailed(
+    cursor: Optional[str] = None,
+    limit: int = 50,
+    date_from=None,
+    date_to=None,
+    status: Optional[List[str]] = None,
+    exclude_status: Optional[List[str]] = None,
+    customer_id: Optional[str] = None,
+    min_total: Optional[float] = None,
+    max_total: Optional[float] = None,
+    q: Optional[str] = None
+):
+    """
+    One page of order transactions (newest first), one row per order.
+    Statuses match on status code or id. Returns (DataFrame, next_cursor or None).
+    """
+    where, params = _page_filters("ot", cursor, date_from, date_to)
+    if status:
+        marks = ",".join(["?"] * len(status))
+        where.append(f"(os.status_code IN ({marks}) OR os.id IN ({marks}))")
+        params += list(status) * 2
+    if exclude_status:
+        marks = ",".join(["?"] * len(exclude_status))
+        where.append(f"NOT (os.status_code IN ({marks}) OR os.id IN ({marks}))")
+        params += list(exclude_status) * 2
+    if customer_id:
+        where.append("ot.customer_id = ?")
+        params.append(customer_id)
+    if min_total is not None:
+        where.append("ot.total_amount >= ?")
+        params.append(min_total)
+    if max_total is not None:
+        where.append("ot.total_amount <= ?")
+        params.append(max_total)
+    if q:
+        pattern = f"%{q.strip()}%"
+        where.append("""(
+            ot.id ILIKE ? OR CONCAT(c.firstname, ' ', c.lastname) ILIKE ? OR c.contact_number ILIKE ?
+            OR c.email ILIKE ? OR c.address ILIKE ? OR os.status_code ILIKE ?
+            OR EXISTS (
+                SELECT 1 FROM order_items x
+                JOIN products xp ON x.product_id = xp.id
+                JOIN items xi ON xp.item_id = xi.id
+                WHERE x.order_id = ot.id AND xi.item_name ILIKE ?
+            )
+        )""")
+        params += [pattern] * 7
+
+    with db_cursor() as cur:
+        keys = cur.execute(f"""
+            SELECT ot.date_created, ot.id
+            FROM order_transactions ot
+            JOIN customers c ON ot.customer_id = c.id
+            JOIN order_statuses os ON ot.status_id = os.id
+            JOIN admin a ON ot.admin_id = a.id
+            WHERE {" AND ".join(where) or "TRUE"}
+            ORDER BY ot.date_created DESC, ot.id DESC
+            LIMIT ?
+        """, params + [limit + 1]).fetchall()
+        ids, next_cursor = _next_page(keys, limit)
+        if not ids:
+            ids = [None]
+
+        df = cur.execute(f"""
+            SELECT 
+                ot.id AS transaction_id,
+                CONCAT(c.firstname, ' ', c.lastname) AS customer_name,
+                c.contact_number,
+                c.email AS customer_email,
+                c.address,
+
+                os.status_code,
+                os.description AS status_description,
 
-            os.status_code,
-            os.description AS status_description,
+                CONCAT(a.firstname, ' ', a.lastname) AS admin_name,
+                a.email AS admin_email,
 
-            CONCAT(a.firstname, ' ', a.lastname) AS admin_name,
-            a.email AS admin_email,
+                ot.date_created,
+                ot.total_amount,
 
-            ot.date_created,
-            ot.total_amount,
+                COALESCE(SUM(oi.quantity), 0) AS total_items_ordered,
 
-            COALESCE(SUM(oi.quantity), 0) AS total_items_ordered,
+                -- Concatenate product names into a comma-separated list
+                GROUP_CONCAT(DISTINCT i.item_name, ', ') AS product_names
 
-            -- Concatenate product names into a comma-separated list
-            GROUP_CONCAT(DISTINCT i.item_name, ', ') AS product_names
+            FROM order_transactions ot
+            JOIN customers c ON ot.customer_id = c.id
+            JOIN order_statuses os ON ot.status_id = os.id
+            JOIN admin a ON ot.admin_id = a.id
+            LEFT JOIN order_items oi ON ot.id = oi.order_id
+            LEFT JOIN products p ON oi.product_id = p.id
+            LEFT JOIN items i ON p.item_id = i.id
 
-        FROM order_transactions ot
-        JOIN customers c ON ot.customer_id = c.id
-        JOIN order_statuses os ON ot.status_id = os.id
-        JOIN admin a ON ot.admin_id = a.id
-        LEFT JOIN order_items oi ON ot.id = oi.order_id
-        LEFT JOIN products p ON oi.product_id = p.id
-        LEFT JOIN items i ON p.item_id = i.id
+            WHERE ot.id IN ({",".join(["?"] * len(ids))})
 
-        GROUP BY 
-            ot.id, customer_name, c.contact_number, c.email, c.address,
-            os.status_code, os.description,
-            admin_name, a.email,
-            ot.date_created, ot.total_amount
+            GROUP BY 
+                ot.id, customer_name, c.contact_number, c.email, c.address,
+                os.status_code, os.description,
+                admin_name, a.email,
+                ot.date_created, ot.total_amount
 
-        ORDER BY ot.date_created DESC
-    """).fetchdf()
+            ORDER BY ot.date_created DESC, ot.id DESC
+        """, ids).fetchdf()
+    return df, next_cursor
 
+@write_transaction
 def delete_order_transaction(transaction_id: str):
-    con = get_db_connection()
-    cur = con.cursor()
+    cur = get_db_connection()
 
     try:
         # Begin transaction
-        con.execute("BEGIN")
+        cur.execute("BEGIN")
 
         # Check if the order exists
         existing = cur.execute("""
@@ -2583,6 +3335,8 @@ def delete_order_transaction(transaction_id: str):
         if not existing:
             raise HTTPException(status_code=404, detail="Order transaction not found")
 
+        rollups.record_orders(cur, transaction_id, sign=-1)
+
         # Delete child order items
         cur.execute("""
             DELETE FROM order_items
@@ -2594,8 +3348,11 @@ def delete_order_transaction(transaction_id: str):
             DELETE FROM order_transactions
             WHERE id = ?
         """, (transaction_id,))
+        table_versions.bump(cur, "order_transactions")
 
-        con.execute("COMMIT")
+        cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
         return {
             "transaction_id": transaction_id,
@@ -2604,36 +3361,37 @@ def delete_order_transaction(transaction_id: str):
 
     except Exception as e:
         # Rollback if anything fails
-        try:
-            con.execute("ROLLBACK")
-        except:
-            pass
+        rollback(cur)
+        if is_conflict(e):
+            raise  # retried by write_transaction
         raise HTTPException(status_code=500, detail=f"Deletion failed: {str(e)}")
+    finally:
+        cur.close()
 
 #Other Get/Reads
 def get_unit_measurements():
-    return con.execute("""
-        SELECT id, measurement_code, description
-        FROM unit_measurements
-    """).fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("""
+            SELECT id, measurement_code, description
+            FROM unit_measurements
+        """).fetchdf()
 
 def get_stock_transaction_types():
-    return con.execute("""
-        SELECT id, type_code, description
-        FROM stock_transaction_types
-    """).fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("""
+            SELECT id, type_code, description
+            FROM stock_transaction_types
+        """).fetchdf()
 
 def get_order_statuses():
-    return con.execute("""
-        SELECT id, status_code, description
-        FROM order_statuses
-    """).fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("""
+            SELECT id, status_code, description
+            FROM order_statuses
+        """).fetchdf()
 
 # Auth
 def get_user_by_email(email: str):
-    conn = duckdb.connect(DB_PATH)
-    # conn = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
     # Check admin
     admin_query = """
         SELECT id, firstname, lastname, email, password, 'admin' AS role
@@ -2641,12 +3399,6 @@ def get_user_by_email(email: str):
         WHERE email = ?
         LIMIT 1
     """
-    admin_result = conn.execute(admin_query, [email]).fetchone()
-    if admin_result:
-        columns = [desc[0] for desc in conn.description]
-        conn.close()
-        return dict(zip(columns, admin_result))
-
     # Check employee
     employee_query = """
         SELECT id, firstname, lastname, email, password, 'employee' AS role,
@@ -2655,13 +3407,17 @@ def get_user_by_email(email: str):
         WHERE email = ?
         LIMIT 1
     """
-    employee_result = conn.execute(employee_query, [email]).fetchone()
-    if employee_result:
-        columns = [desc[0] for desc in conn.description]
-        conn.close()
-        return dict(zip(columns, employee_result))
+    with db_cursor() as conn:
+        admin_result = conn.execute(admin_query, [email]).fetchone()
+        if admin_result:
+            columns = [desc[0] for desc in conn.description]
+            return dict(zip(columns, admin_result))
+
+        employee_result = conn.execute(employee_query, [email]).fetchone()
+        if employee_result:
+            columns = [desc[0] for desc in conn.description]
+            return dict(zip(columns, employee_result))
 
-    conn.close()
     return None
 
 
@@ -2684,18 +3440,19 @@ def authenticate_user(email: str, password: str):
 
 # Settings Functionalities
 def get_employees():
-    return con.execute("""
-        SELECT
-             id AS employee_id,
-             firstname || '' || lastname AS fullname,
-             email,
-             contact_number,
-             is_active AS status, 
-             date_created,
-             date_updated,
-             last_login
-        FROM employees
-        """).fetchdf()
+    with db_cursor() as cur:
+        return cur.execute("""
+            SELECT
+                 id AS employee_id,
+                 firstname || '' || lastname AS fullname,
+                 email,
+                 contact_number,
+                 is_active AS status, 
+                 date_created,
+                 date_updated,
+                 last_login
+            FROM employees
+            """).fetchdf()
 
 
 def create_admin_account(firstname: str, lastname: str, email: str, password: str):
@@ -2704,28 +3461,30 @@ def create_admin_account(firstname: str, lastname: str, email: str, password: st
     If the email already exists, raises an exception.
     Returns the created admin record including the auto-generated ID.
     """
-    # Check if email already exists
-    result = con.execute("SELECT 1 FROM admin WHERE email = ?", [email]).fetchone()
-    if result:
-        raise ValueError(f"Admin with email '{email}' already exists.")
+    with db_cursor() as cur:
+        # Check if email already exists
+        result = cur.execute("SELECT 1 FROM admin WHERE email = ?", [email]).fetchone()
+        if result:
+            raise ValueError(f"Admin with email '{email}' already exists.")
 
-    # Hash password using Argon2
-    hashed_password = ph.hash(password)
+        # Hash password using Argon2
+        hashed_password = ph.hash(password)
 
-    # Get current timestamp
-    date_created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        # Get current timestamp
+        date_created = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-    # Insert and return the created row (DuckDB supports RETURNING)
-    created_admin = con.execute("""
-        INSERT INTO admin (firstname, lastname, email, password, date_created, last_login)
-        VALUES (?, ?, ?, ?, ?, NULL)
-        RETURNING id, firstname, lastname, email, date_created, last_login
-    """, [firstname, lastname, email, hashed_password, date_created]).fetchone()
+        # Insert and return the created row (DuckDB supports RETURNING)
+        created_admin = cur.execute("""
+            INSERT INTO admin (firstname, lastname, email, password, date_created, last_login)
+            VALUES (?, ?, ?, ?, ?, NULL)
+            RETURNING id, firstname, lastname, email, date_created, last_login
+        """, [firstname, lastname, email, hashed_password, date_created]).fetchone()
 
     print(f"✅ Admin account '{email}' created successfully.")
     return created_admin
 
 
+@write_transaction
 def add_employee(data: dict, admin_id: Optional[str] = None, cur=None):
     """
     Add an employee. Requires admin_id for audit logging.
@@ -2765,6 +3524,9 @@ def add_employee(data: dict, admin_id: Optional[str] = None, cur=None):
         return f"****{p[-4:]}"
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         firstname = data['firstname'].strip().title()
         lastname = data['lastname'].strip().title()
         email = data['email'].strip().lower()
@@ -2804,13 +3566,17 @@ def add_employee(data: dict, admin_id: Optional[str] = None, cur=None):
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "Message": "Employee added successfully!", "employee_id": new_id}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
+@write_transaction
 def update_account_status(id: str, is_active: bool, admin_id: Optional[str] = None, cur=None):
     """
     Toggle employee active status. Requires admin_id for audit logging.
@@ -2835,6 +3601,9 @@ def update_account_status(id: str, is_active: bool, admin_id: Optional[str] = No
             own_cursor = True
 
     try:
+        if own_cursor and conn_used is not None:
+            cur.execute("BEGIN")
+
         # read existing state
         old_row = cur.execute("SELECT is_active FROM employees WHERE id = ?", (id,)).fetchone()
         if not old_row:
@@ -2871,15 +3640,19 @@ def update_account_status(id: str, is_active: bool, admin_id: Optional[str] = No
         )
 
         if own_cursor and conn_used is not None:
-            conn_used.commit()
+            cur.execute("COMMIT")
         return {"success": True, "id": id, "is_active": is_active}
     except Exception:
         if own_cursor and conn_used is not None:
-            conn_used.rollback()
+            rollback(cur)
         raise
+    finally:
+        if own_cursor and conn_used is not None:
+            cur.close()
 
 
 # THIS IS DONE
+@write_transaction
 def change_employee_password(
     admin_id: str,
     target_employee_id: str,
@@ -2906,7 +3679,7 @@ def change_employee_password(
             conn_used = con
         except NameError:
             raise RuntimeError("Database connection `con` is not defined in this module.")
-        exec_obj = conn_used  # DuckDB connection supports .execute()
+        exec_obj = conn_used.cursor()
         own_conn = True
     else:
         # If caller passed a connection-like object with .execute(), use it directly
@@ -2944,6 +3717,9 @@ def change_employee_password(
         raise HTTPException(status_code=500, detail="Error hashing new password.")
 
     try:
+        if own_conn:
+            exec_obj.execute("BEGIN")
+
         # Perform update
         exec_obj.execute(
             """
@@ -2965,7 +3741,7 @@ def change_employee_password(
                 action="password_change",
                 details=details,
                 admin_id=admin_id,
-                cur_or_conn=conn_used  # use cur_or_conn for newer signature; backward-compatible too
+                cur_or_conn=exec_obj  # use cur_or_conn for newer signature; backward-compatible too
             )
         except TypeError:
             # fallback if your log_audit hasn't been updated yet; use legacy param name
@@ -2978,26 +3754,18 @@ def change_employee_password(
                 cur=exec_obj
             )
 
-        # commit if we opened the connection here
-        if own_conn and conn_used is not None:
-            try:
-                conn_used.commit()
-            except Exception:
-                # commit error -> rollback and re-raise
-                try:
-                    conn_used.rollback()
-                except Exception:
-                    pass
-                raise
+        # commit if we opened the transaction here
+        if own_conn:
+            exec_obj.execute("COMMIT")
 
         return {"success": True, "message": "Employee password changed successfully."}
     except Exception:
-        if own_conn and conn_used is not None:
-            try:
-                conn_used.rollback()
-            except Exception:
-                pass
+        if own_conn:
+            rollback(exec_obj)
         raise
+    finally:
+        if own_conn:
+            exec_obj.close()
 
 
 def get_current_admin(request: Request):
@@ -3007,6 +3775,7 @@ def get_current_admin(request: Request):
     return user
 
 
+@write_transaction
 def delete_old_transactions(years: int, *, admin_id: str, dry_run: bool = False):
     if admin_id is None:
         raise ValueError("Error: Admin ID is required (admin only)")
@@ -3014,7 +3783,8 @@ def delete_old_transactions(years: int, *, admin_id: str, dry_run: bool = False)
     if years < 2:
         raise ValueError("Error: Cutoff year should be at least 5 years ago or older")
     
-    admin_exists = con.execute("SELECT 1 FROM admin WHERE id = ?", (admin_id,)).fetchone()
+    with db_cursor() as cur:
+        admin_exists = cur.execute("SELECT 1 FROM admin WHERE id = ?", (admin_id,)).fetchone()
     if not admin_exists:
         raise ValueError("Error: Admin ID not found")
 
@@ -3028,8 +3798,9 @@ def delete_old_transactions(years: int, *, admin_id: str, dry_run: bool = False)
                "old_stocks": 0
     }
 
+    cur = get_db_connection()
     try:
-        cur = con.cursor()
+        cur.execute("BEGIN")
 
         if dry_run:
             deleted["old_order_items"] = cur.execute(
@@ -3093,6 +3864,9 @@ def delete_old_transactions(years: int, *, admin_id: str, dry_run: bool = False)
                 "DELETE FROM stock_transactions WHERE date_created < ?", (cutoff_param,)
             ).rowcount
 
+            # months at or before the cutoff lost rows; recompute their rollups
+            rollups.rebuild_rollups(cur, through=cutoff_date)
+
             # write audit only when something was deleted
             total_deleted = (
                 (deleted.get("old_order_items") or 0)
@@ -3116,11 +3890,15 @@ def delete_old_transactions(years: int, *, admin_id: str, dry_run: bool = False)
                     cur=cur
                 )
 
-            con.commit()
+        cur.execute("COMMIT")
+        chart_cache.invalidate()
+        events.changed()
 
     except Exception:
-        con.rollback()
+        rollback(cur)
         raise
+    finally:
+        cur.close()
 
     return {"success": True, "cutoff_date": cutoff_date.isoformat(), **deleted}
 
@@ -3134,11 +3912,9 @@ def get_audit_logs(limit: int = 100, offset: int = 0, cur=None) -> List[Dict[str
     own_cursor = False
 
     if cur is None:
-        # use a short-lived connection so callers don't need to pass one
-        conn_used = duckdb.connect(DB_PATH)
-        # conn_used = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-        cur = conn_used.cursor()
+        # use a short-lived cursor so callers don't need to pass one
+        conn_used = get_db_connection()
+        cur = conn_used
         own_cursor = True
     else:
         # caller passed either a connection or a cursor
@@ -3163,7 +3939,7 @@ def get_audit_logs(limit: int = 100, offset: int = 0, cur=None) -> List[Dict[str
         result = [dict(zip(cols, row)) for row in rows]
         return result
     finally:
-        # close local connection if we opened it
+        # close local cursor if we opened it
         if own_cursor and conn_used is not None:
             try:
                 conn_used.close()
@@ -3183,8 +3959,9 @@ def migrate_plaintext_passwords_to_hash():
     ph = PasswordHasher()
     updated = {"admin": 0, "employees": 0}
 
+    cur = get_db_connection()
     for table in ("admin", "employees"):
-        rows = con.execute(f"SELECT id, password FROM {table}").fetchall()
+        rows = cur.execute(f"SELECT id, password FROM {table}").fetchall()
         count = 0
 
         for _id, pw in rows:
@@ -3196,7 +3973,7 @@ def migrate_plaintext_passwords_to_hash():
             except Exception:
                 continue
 
-            con.execute(
+            cur.execute(
                 f"UPDATE {table} SET password = ? WHERE id = ?",
                 (new_hash, _id)
             )
@@ -3204,7 +3981,7 @@ def migrate_plaintext_passwords_to_hash():
 
         updated[table] = count
 
-    con.commit()
+    cur.close()
     return {
         "success": True,
         "updated_admin_passwords": updated["admin"],
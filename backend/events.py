@@ -0,0 +1,188 @@
+# events.py
+# Server-sent events push channel for the alert bell and the dashboard KPIs.
+#
+# The write paths in database.py call changed() after committing, next to
+# chart_cache.invalidate(). One publisher thread wakes up on that, waits
+# DEBOUNCE_SECONDS so a burst of writes is handled once, then re-evaluates
+# the alerts (alerts.evaluate) and rebuilds the dashboard snapshot, and
+# publishes only what differs from the previous state:
+#
+#   event: alerts   data: {"changed": [{id, category, message, timestamp, ...}], "resolved": [ids]}
+#   event: kpis     data: {"generated_at": ..., "changed": {section: value}}
+#
+# That work is done once per change, however many clients are connected;
+# clients that are connected while nothing changes only get heartbeats.
+# Published events are kept in a ring buffer so a client reconnecting with
+# Last-Event-ID gets what it missed; a client that is new, comes from
+# another server process, or fell out of the buffer gets a full `snapshot`.
+import asyncio
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import date
+
+from . import alerts, analytics
+
+DEBOUNCE_SECONDS = float(os.environ.get("EVENTS_DEBOUNCE", 0.5))
+HEARTBEAT_SECONDS = float(os.environ.get("EVENTS_HEARTBEAT", 15))
+BUFFER_SIZE = int(os.environ.get("EVENTS_BUFFER", 256))
+RETRY_MS = 3000
+# Without writes the publisher still looks in this often, for the daily
+# alert sweep and the week/month boundaries of the KPI cards
+IDLE_REFRESH_SECONDS = 60
+
+# Event ids are "<epoch>:<n>"; the epoch tells ids of an earlier process apart
+EPOCH = uuid.uuid4().hex[:8]
+
+_lock = threading.Lock()
+_changed = threading.Event()
+_started = False
+_buffer = deque(maxlen=BUFFER_SIZE)   # (n, event, data)
+_last_n = 0
+_subscribers = set()                  # (loop, asyncio.Queue)
+
+# Last published state: alert id -> entry, and the KPI snapshot
+_alerts = {}
+_kpis = {}
+_kpis_day = None
+
+
+def changed():
+    """Signal that committed data may have changed alerts or KPIs. Cheap; never blocks."""
+    _changed.set()
+
+
+# --- Publisher ---------------------------------------------------------------
+
+def _current_alerts():
+    return {
+        entry["id"]: {"category": category, **entry}
+        for category, entries in alerts.current_alerts().items()
+        for entry in entries
+    }
+
+
+def _current_kpis():
+    analytics.invalidate_dashboard_snapshot()
+    snapshot = analytics.get_dashboard_snapshot()
+    snapshot.pop("generated_at", None)
+    return snapshot
+
+
+def _publish(event: str, data: dict):
+    global _last_n
+    with _lock:
+        _last_n += 1
+        item = (_last_n, event, json.dumps(data, default=str))
+        _buffer.append(item)
+        subscribers = list(_subscribers)
+    for loop, queue in subscribers:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            pass  # the client's loop is already closed
+
+
+def _refresh(kpis: bool):
+    global _alerts, _kpis, _kpis_day
+    alerts.evaluate()
+    current = _current_alerts()
+    changed_alerts = [entry for key, entry in current.items() if _alerts.get(key) != entry]
+    resolved = [key for key in _alerts if key not in current]
+    _alerts = current
+    if changed_alerts or resolved:
+        _publish("alerts", {"changed": changed_alerts, "resolved": resolved})
+
+    if kpis or _kpis_day != date.today():
+        current = _current_kpis()
+        delta = {section: value for section, value in current.items() if _kpis.get(section) != value}
+        _kpis, _kpis_day = current, date.today()
+        if delta:
+            _publish("kpis", {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "changed": delta})
+
+
+def _run():
+    while True:
+        woken = _changed.wait(IDLE_REFRESH_SECONDS)
+        if woken:
+            time.sleep(DEBOUNCE_SECONDS)
+            _changed.clear()
+        try:
+            _refresh(kpis=woken)
+        except Exception as e:
+            # e.g. a write conflict in the alert evaluation; retried on the next wake-up
+            print(f"Event publisher refresh failed: {e}")
+
+
+def start():
+    """Compute the initial state and start the publisher thread (once per process)."""
+    global _alerts, _kpis, _kpis_day, _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    alerts.evaluate()
+    _alerts = _current_alerts()
+    _kpis, _kpis_day = _current_kpis(), date.today()
+    threading.Thread(target=_run, name="events-publisher", daemon=True).start()
+
+
+# --- Subscribers -------------------------------------------------------------
+
+def _format(n: int, event: str, data: str) -> str:
+    return f"id: {EPOCH}:{n}\nevent: {event}\ndata: {data}\n\n"
+
+
+def _snapshot_event(n: int) -> str:
+    data = {"alerts": list(_alerts.values()), "kpis": _kpis}
+    return _format(n, "snapshot", json.dumps(data, default=str))
+
+
+def _replay(last_event_id):
+    """
+    Events after `last_event_id` still in the buffer, or None if the client
+    must start over from a snapshot. Call with _lock held.
+    """
+    epoch, _, n = (last_event_id or "").partition(":")
+    if epoch != EPOCH or not n.isdigit():
+        return None
+    n = int(n)
+    oldest = _buffer[0][0] if _buffer else _last_n + 1
+    if n > _last_n or n < oldest - 1:
+        return None
+    return [item for item in _buffer if item[0] > n]
+
+
+async def stream(last_event_id, is_disconnected):
+    """
+    Async generator of SSE text for one client: a snapshot or the missed
+    events, then live events, with a heartbeat comment when idle.
+    """
+    if not _started:
+        await asyncio.get_running_loop().run_in_executor(None, start)
+
+    queue = asyncio.Queue()
+    subscriber = (asyncio.get_running_loop(), queue)
+    with _lock:
+        _subscribers.add(subscriber)
+        missed = _replay(last_event_id)
+        sent = _last_n
+        first = _snapshot_event(sent) if missed is None else "".join(_format(*item) for item in missed)
+
+    try:
+        yield f"retry: {RETRY_MS}\n\n" + first
+        while not await is_disconnected():
+            try:
+                n, event, data = await asyncio.wait_for(queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if n > sent:   # already covered by the snapshot/replay
+                sent = n
+                yield _format(n, event, data)
+    finally:
+        with _lock:
+            _subscribers.discard(subscriber)
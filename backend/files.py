@@ -0,0 +1,17 @@
+# files.py
+# Files the app stores for later reads (registered logos, stored reports).
+#
+# write_atomic() writes to "<path>.tmp" and renames it over `path`, so a
+# reader sees either the old file or the complete new one, never half a
+# file. A .tmp left by an interrupted write is removed by sweeper.py.
+import os
+
+
+def write_atomic(path: str, data):
+    """Write `data` (bytes, or str as UTF-8) to `path` through a temporary file."""
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        f.write(data)
+    os.replace(path + ".tmp", path)
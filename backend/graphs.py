@@ -1,5 +1,4 @@
 # graph.py
-import duckdb
 from datetime import datetime, timedelta
 import calendar
 import plotly.graph_objects as go
@@ -9,75 +8,56 @@ import plotly.subplots as sp
 from statsmodels.tsa.seasonal import STL
 from dateutil.relativedelta import relativedelta
 import json
-import shutil
-import os
-
-REPO_DB_PATH = "backend/db_timestock1"
-
-# If running locally, use a local file
-if os.environ.get("RAILWAY") == "1":
-    # Production (Railway) path: the mounted volume
-    DB_PATH = "/data/db_timestock1"
-else:
-    # Local path
-    DB_PATH = "backend/db_timestock1"
-
-os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-
-# Copy starter DB if it doesn't exist yet
-if not os.path.exists(DB_PATH):
-    if os.path.exists(REPO_DB_PATH):
-        shutil.copy(REPO_DB_PATH, DB_PATH)
-        print(f"Copied starter DB to {DB_PATH}")
-    else:
-        print(f"No starter DB found at {REPO_DB_PATH}. A new DB will be created.")
+import threading
+
+from markupsafe import Markup
+
+from .connection import cursor
+from . import rollups, periods, reorder
+from .chart_cache import cached
+
+
+# Charts are returned as Plotly figure JSON and drawn in the browser by
+# templates/js/charts.js with the plotly.js bundle main.py serves under /js,
+# instead of as fig.to_html() output that carried its own copy of plotly.js.
+# Numeric arrays are written as base64 typed arrays ({"dtype", "bdata"}).
+# When there is nothing to plot the chart functions return an HTML message
+# instead, which chart_embed() passes through.
+def figure_json(fig) -> str:
+    return fig.to_json(validate=False)
 
 
-# Connect to DuckDB
-con = duckdb.connect(DB_PATH)
-print(f"Connected to DB at {DB_PATH}")
+def is_figure(chart: str) -> bool:
+    return chart.startswith("{")
 
+
+def chart_embed(chart: str) -> Markup:
+    """Jinja filter: a placeholder charts.js plots the figure JSON into, or the no-data message."""
+    if not is_figure(chart):
+        return Markup(chart)
+    # "</" would end the script element early
+    data = chart.replace("</", "<\\/")
+    return Markup(f'<div class="plotly-chart"><script type="application/json">{data}</script></div>')
+
+@cached("orders_sales_revenue")
 def get_graph_html(period='month'):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+    # Rollups are monthly, so only month or coarser periods can be derived from them
+    if period not in ('month', 'quarter', 'year'):
+        period = 'month'
 
-    # Total Orders
-    df_orders = con.execute(f"""
-        SELECT 
-            DATE_TRUNC('{period}', ot.date_created) AS period,
-            COUNT(DISTINCT ot.id) AS total_orders
-        FROM order_transactions ot
-        WHERE ot.status_id = 'OS005'
-        GROUP BY period
-        ORDER BY period;
-    """).fetchdf()
-
-    # Total Sales (quantity)
-    df_sales = con.execute(f"""
-        SELECT 
-            DATE_TRUNC('{period}', ot.date_created) AS period,
-            SUM(oi.quantity) AS total_sales
-        FROM order_transactions ot
-        JOIN order_items oi ON ot.id = oi.order_id
-        WHERE ot.status_id = 'OS005'
-        GROUP BY period
-        ORDER BY period;
-    """).fetchdf()
-
-    # Total Revenue
-    df_revenue = con.execute(f"""
-        SELECT 
-            DATE_TRUNC('{period}', ot.date_created) AS period,
-            SUM(ot.total_amount) AS total_revenue
-        FROM order_transactions ot
-        WHERE ot.status_id = 'OS005'
-        GROUP BY period
-        ORDER BY period;
-    """).fetchdf()
-
-    # Merge the three metrics
-    df = df_orders.merge(df_sales, on='period', how='outer').merge(df_revenue, on='period', how='outer')
-    df = df.sort_values('period')
+    with cursor() as cur:
+        # Total Orders, Sales (quantity) and Revenue per period
+        df = cur.execute(f"""
+            SELECT 
+                DATE_TRUNC('{period}', r.month) AS period,
+                CAST(SUM(r.order_count) AS BIGINT) AS total_orders,
+                CAST(SUM(r.total_quantity) AS BIGINT) AS total_sales,
+                SUM(r.total_revenue) AS total_revenue
+            FROM sales_monthly_rollup r
+            WHERE r.status_id = 'OS005'
+            GROUP BY period
+            ORDER BY period;
+        """).fetchdf()
 
     if df.empty or df['total_revenue'].sum() == 0:
         return "<p>No sales data available.</p>", "<p>No data to report.</p>"
@@ -111,7 +91,7 @@ def get_graph_html(period='month'):
     )
 
     report = generate_chart_report(df)
-    return fig.to_html(full_html=False, config={'responsive': True}), report
+    return figure_json(fig), report
 
 def generate_chart_report(df):
     highest_revenue_row = df.loc[df['total_revenue'].idxmax()]
@@ -133,44 +113,42 @@ def generate_chart_report(df):
     💵 Average Monthly Revenue: ₱{avg_revenue:,.2f}
     """
     
+@cached("turnover")
 def get_turnover_combined_graph():
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    df = con.execute("""
-        WITH monthly_data AS (
-            SELECT
-                DATE_TRUNC('month', st.date_created) AS period,
-                SUM(CASE WHEN stt.type_code = 'stock-in' THEN sti.quantity * m.material_cost ELSE 0 END) AS stock_in_value,
-                SUM(CASE WHEN stt.type_code = 'stock-out' THEN sti.quantity * m.material_cost ELSE 0 END) AS cogs,
-                SUM(m.current_stock * m.material_cost) AS ending_inventory_value
-            FROM stock_transaction_items sti
-            JOIN stock_transactions st ON st.id = sti.stock_transaction_id
-            JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
-            JOIN materials m ON m.id = sti.material_id
-            GROUP BY period
-        ),
-        turnover_calc AS (
-            SELECT
-                STRFTIME(period, '%Y-%m') AS label,
-                cogs,
-                ending_inventory_value,
-                ROUND(
-                    (ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0, 2
-                ) AS avg_inventory,
-                ROUND(
-                    CASE
-                        WHEN ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0) > 0
-                        THEN cogs / ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0)
-                        ELSE 0
-                    END, 2
-                ) AS turnover_rate
-            FROM monthly_data
-        )
-        SELECT label, cogs, avg_inventory, turnover_rate
-        FROM turnover_calc
-        ORDER BY label;
-    """).fetchdf()
+    with cursor() as cur:
+        df = cur.execute("""
+            WITH monthly_data AS (
+                SELECT
+                    r.month AS period,
+                    SUM(CASE WHEN stt.type_code = 'stock-in' THEN r.total_quantity * m.material_cost ELSE 0 END) AS stock_in_value,
+                    SUM(CASE WHEN stt.type_code = 'stock-out' THEN r.total_quantity * m.material_cost ELSE 0 END) AS cogs,
+                    SUM(r.line_count * m.current_stock * m.material_cost) AS ending_inventory_value
+                FROM stock_movement_monthly_rollup r
+                JOIN stock_transaction_types stt ON stt.id = r.stock_type_id
+                JOIN materials m ON m.id = r.material_id
+                GROUP BY period
+            ),
+            turnover_calc AS (
+                SELECT
+                    STRFTIME(period, '%Y-%m') AS label,
+                    cogs,
+                    ending_inventory_value,
+                    ROUND(
+                        (ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0, 2
+                    ) AS avg_inventory,
+                    ROUND(
+                        CASE
+                            WHEN ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0) > 0
+                            THEN cogs / ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0)
+                            ELSE 0
+                        END, 2
+                    ) AS turnover_rate
+                FROM monthly_data
+            )
+            SELECT label, cogs, avg_inventory, turnover_rate
+            FROM turnover_calc
+            ORDER BY label;
+        """).fetchdf()
 
     if df.empty or (df[['cogs','avg_inventory']].sum().sum() == 0):
         return "<p>No turnover data available.</p>", None, "<p>No data to summarize.</p>"
@@ -227,7 +205,7 @@ def get_turnover_combined_graph():
     )
 
     summary_html = generate_turnover_summary(df)
-    return fig.to_html(full_html=False, config={'responsive': True}), df, summary_html
+    return figure_json(fig), df, summary_html
 
 def generate_turnover_summary(df):
     if df.empty or df['turnover_rate'].sum() == 0:
@@ -250,8 +228,10 @@ def generate_turnover_summary(df):
     """
 
 
+@cached("fastest_moving_materials", daily=True)
 def get_fastest_moving_materials_chart():
-    query = """
+    since, params = periods.range_sql("ot.date_created", periods.trailing(months=3, month_start=True))
+    query = f"""
     SELECT 
         i.item_name,
         m.unit_measurement,
@@ -262,16 +242,15 @@ def get_fastest_moving_materials_chart():
     JOIN materials m ON pm.material_id = m.id
     JOIN items i ON m.item_id = i.id
     JOIN order_transactions ot ON ot.id = oi.order_id
-    WHERE ot.date_created >= DATE_TRUNC('month', CURRENT_DATE - INTERVAL 3 MONTH)
+    WHERE {since}
     AND ot.status_id = 'OS005'
     GROUP BY i.item_name, m.unit_measurement
     ORDER BY total_material_used DESC
     LIMIT 10;
     """
 
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
-        df = conn.execute(query).fetchdf()
+    with cursor() as conn:
+        df = conn.execute(query, params).fetchdf()
 
     if df.empty:
         return "<p>No data available for the past 3 months.</p>"
@@ -324,47 +303,34 @@ def get_fastest_moving_materials_chart():
         template="plotly_white"
     )
 
-    return fig.to_html(full_html=False, include_plotlyjs='cdn', config={"responsive": True})
+    return figure_json(fig)
 
+@cached("reorder_point", daily=True)
 def get_reorder_point_chart(return_df=False):
+    # Reorder points come from the daily plan (reorder.py); materials
+    # without usage in its window have nothing to plan and are left out
     query = """
-        WITH daily_usage AS (
-          SELECT 
-            sti.material_id,
-            DATE(st.date_created) AS usage_day,
-            SUM(sti.quantity) AS total_used
-          FROM stock_transaction_items sti
-          JOIN stock_transactions st ON sti.stock_transaction_id = st.id
-          JOIN stock_transaction_types stt ON st.stock_type_id = stt.id
-          WHERE stt.type_code = 'stock-out'
-            AND st.date_created >= (CURRENT_DATE - INTERVAL 30 DAY)
-          GROUP BY sti.material_id, DATE(st.date_created)
-        ),
-        average_usage AS (
-          SELECT 
-            material_id,
-            ROUND(AVG(total_used), 2) AS avg_daily_usage
-          FROM daily_usage
-          GROUP BY material_id
-        )
         SELECT 
           m.id AS material_id,
           i.item_name,
           m.current_stock,
-          au.avg_daily_usage,
-          ROUND((au.avg_daily_usage * 5 + 10), 2) AS reorder_point,
+          ROUND(rp.avg_daily_usage, 2) AS avg_daily_usage,
+          ROUND(rp.safety_stock, 2) AS safety_stock,
+          rp.lead_time_days,
+          ROUND(rp.reorder_point, 2) AS reorder_point,
           CASE 
-            WHEN m.current_stock <= (au.avg_daily_usage * 5 + 10) THEN '⚠️ Reorder Needed'
+            WHEN m.current_stock <= rp.reorder_point THEN '⚠️ Reorder Needed'
             ELSE '✅ Sufficient Stock'
           END AS reorder_status
         FROM materials m
         JOIN items i ON m.item_id = i.id
-        JOIN average_usage au ON m.id = au.material_id
+        JOIN reorder_plan rp ON m.id = rp.material_id
+        WHERE rp.avg_daily_usage > 0
         ORDER BY reorder_status DESC, item_name;
     """
 
-    with duckdb.connect(DB_PATH) as conn:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as conn:
+    with cursor() as conn:
+        reorder.ensure_plan(conn)
         df = conn.execute(query).fetchdf()
 
     if return_df:
@@ -388,9 +354,10 @@ def get_reorder_point_chart(return_df=False):
         text=df['reorder_status'],
         textposition='outside',
         hovertemplate=(
-            "<b>%{x}</b><br>Stock: %{y}<br>ROP: %{customdata[0]}<br>Daily Usage: %{customdata[1]}<extra></extra>"
+            "<b>%{x}</b><br>Stock: %{y}<br>ROP: %{customdata[0]}<br>Daily Usage: %{customdata[1]}"
+            "<br>Safety Stock: %{customdata[2]}<br>Lead Time: %{customdata[3]} days<extra></extra>"
         ),
-        customdata=df[['reorder_point', 'avg_daily_usage']]
+        customdata=df[['reorder_point', 'avg_daily_usage', 'safety_stock', 'lead_time_days']]
     ))
 
     fig.add_trace(go.Scatter(
@@ -413,24 +380,29 @@ def get_reorder_point_chart(return_df=False):
         margin=dict(t=60, b=120)
     )
 
-    return fig.to_html(full_html=False, include_plotlyjs='cdn', config={"responsive": True})
+    return figure_json(fig)
 
 
-def get_stl_decomposition_graph():
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
+# --- STL fit cache ---
+# The fit only depends on order data, so it is reused until the 'sales'
+# rollup version changes (bumped in the same transaction as every order write).
+_stl_cache = {"version": None, "fit": None}
+_stl_cache_lock = threading.Lock()
+
 
+def _fit_stl():
     # Monthly order quantity
     query = """
     SELECT 
-        DATE_TRUNC('month', ot.date_created) AS order_month,
-        SUM(oi.quantity) AS total_quantity
-    FROM order_transactions ot
-    JOIN order_items oi ON ot.id = oi.order_id
+        r.month AS order_month,
+        SUM(r.total_quantity) AS total_quantity
+    FROM sales_monthly_rollup r
     GROUP BY order_month
+    HAVING SUM(r.total_quantity) > 0
     ORDER BY order_month
     """
-    df = con.execute(query).fetchdf()
+    with cursor() as cur:
+        df = cur.execute(query).fetchdf()
     df['order_month'] = pd.to_datetime(df['order_month'])
 
     df.set_index('order_month', inplace=True)
@@ -438,35 +410,64 @@ def get_stl_decomposition_graph():
     df['total_quantity'] = df['total_quantity'].fillna(0)
 
     if df.empty or df['total_quantity'].sum() == 0 or len(df) < 12:
-        return "<p>Insufficient data for STL decomposition.</p>", "<p>No recommendations available.</p>", df, None, None
+        return df, None, None
 
     stl = STL(df['total_quantity'], period=12)
     result = stl.fit()
 
     # Top-selling product per month
-    top_products_df = con.execute("""
-        SELECT month, product_name FROM (
-            SELECT 
-                DATE_TRUNC('month', ot.date_created) AS month,
-                i.item_name AS product_name,
-                SUM(oi.quantity) AS total_qty,
-                RANK() OVER (
-                    PARTITION BY DATE_TRUNC('month', ot.date_created) 
-                    ORDER BY SUM(oi.quantity) DESC
-                ) AS rnk
-            FROM order_transactions ot
-            JOIN order_items oi ON ot.id = oi.order_id
-            JOIN products p ON oi.product_id = p.id
-            JOIN items i ON p.item_id = i.id
-            GROUP BY month, product_name
-        ) 
-        WHERE rnk = 1
-    """).fetchdf()
+    with cursor() as cur:
+        top_products_df = cur.execute("""
+            SELECT month, product_name FROM (
+                SELECT 
+                    r.month AS month,
+                    i.item_name AS product_name,
+                    SUM(r.total_quantity) AS total_qty,
+                    RANK() OVER (
+                        PARTITION BY r.month 
+                        ORDER BY SUM(r.total_quantity) DESC
+                    ) AS rnk
+                FROM product_sales_monthly_rollup r
+                JOIN products p ON r.product_id = p.id
+                JOIN items i ON p.item_id = i.id
+                GROUP BY month, product_name
+            ) 
+            WHERE rnk = 1
+        """).fetchdf()
 
     top_products_df['month'] = pd.to_datetime(top_products_df['month'])
     top_products_df.rename(columns={'month': 'order_month', 'product_name': 'top_product'}, inplace=True)
 
-    
+    return df, result, top_products_df
+
+
+def get_stl_fit():
+    """
+    Return (df, result, top_products_df) for the monthly order quantity STL.
+    `result` and `top_products_df` are None when there are fewer than 12 months.
+    The fitted result is shared between callers; treat it as read-only.
+    """
+    version = rollups.data_version("sales")
+    fit = _stl_cache["fit"]
+    if fit is None or _stl_cache["version"] != version:
+        with _stl_cache_lock:
+            # another thread may have refit while we waited
+            if _stl_cache["fit"] is None or _stl_cache["version"] != version:
+                _stl_cache["fit"] = _fit_stl()
+                _stl_cache["version"] = version
+            fit = _stl_cache["fit"]
+
+    df, result, top_products_df = fit
+    return df.copy(), result, (top_products_df.copy() if top_products_df is not None else None)
+
+
+@cached("stl_decomposition")
+def get_stl_decomposition_graph():
+    df, result, top_products_df = get_stl_fit()
+
+    if result is None:
+        return "<p>Insufficient data for STL decomposition.</p>", "<p>No recommendations available.</p>", df, None, None
+
     # Merge for hover info
     merged = result.trend.to_frame(name='trend').reset_index()
     merged = merged.merge(top_products_df, how='left', on='order_month')
@@ -519,7 +520,7 @@ def get_stl_decomposition_graph():
     recommendation_html = "<ul>" + "".join(f"<li>{r}</li>" for r in recommendations) + "</ul>"
     report_html = "<hr><h4>📌 Recommendations</h4>" + recommendation_html
 
-    return fig.to_html(full_html=False), report_html, df, result, top_products_df
+    return figure_json(fig), report_html, df, result, top_products_df
 
 
 def get_stl_decomposition_report(df, result):
@@ -811,43 +812,41 @@ def generate_recommendations_from_stl(df: pd.DataFrame, result, top_products_df:
     return flat_recs, grouped
 
 
+@cached("sales_moving_average")
 def get_sales_moving_average_chart():
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
     # Total monthly sales
-    df = con.execute("""
-        SELECT
-            DATE_TRUNC('month', ot.date_created) AS month,
-            SUM(ot.total_amount) AS total_sales
-        FROM order_transactions ot
-        WHERE ot.status_id = 'OS005'
-        GROUP BY month
-        ORDER BY month;
-    """).fetchdf()
+    with cursor() as cur:
+        df = cur.execute("""
+            SELECT
+                r.month AS month,
+                r.total_revenue AS total_sales
+            FROM sales_monthly_rollup r
+            WHERE r.status_id = 'OS005'
+            ORDER BY month;
+        """).fetchdf()
     df['month'] = pd.to_datetime(df['month'])
 
     # Top-selling product by quantity for each month
-    top_products_df = con.execute("""
-            SELECT month, product_name FROM (
-                SELECT 
-                    DATE_TRUNC('month', ot.date_created) AS month,
-                    i.item_name AS product_name,
-                    SUM(oi.quantity) AS total_qty,
-                    RANK() OVER (
-                        PARTITION BY DATE_TRUNC('month', ot.date_created) 
-                        ORDER BY SUM(oi.quantity) DESC
-                    ) AS rnk
-                FROM order_transactions ot
-                JOIN order_items oi ON ot.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                JOIN items i ON p.item_id = i.id
-                WHERE ot.status_id = 'OS005'
-                GROUP BY month, product_name
-            ) 
-            WHERE rnk = 1;
+    with cursor() as cur:
+        top_products_df = cur.execute("""
+                SELECT month, product_name FROM (
+                    SELECT 
+                        r.month AS month,
+                        i.item_name AS product_name,
+                        SUM(r.total_quantity) AS total_qty,
+                        RANK() OVER (
+                            PARTITION BY r.month 
+                            ORDER BY SUM(r.total_quantity) DESC
+                        ) AS rnk
+                    FROM product_sales_monthly_rollup r
+                    JOIN products p ON r.product_id = p.id
+                    JOIN items i ON p.item_id = i.id
+                    WHERE r.status_id = 'OS005'
+                    GROUP BY month, product_name
+                ) 
+                WHERE rnk = 1;
 
-    """).fetchdf()
+        """).fetchdf()
     top_products_df['month'] = pd.to_datetime(top_products_df['month'])
 
     # Merge with main sales df
@@ -898,8 +897,7 @@ def get_sales_moving_average_chart():
         legend=dict(orientation='h', x=0, y=1.15)
     )
 
-    html = fig.to_html(full_html=False, config={'responsive': True})
-    return html, df
+    return figure_json(fig), df
 
     
 def generate_moving_average_recommendations(df: pd.DataFrame) -> list:
@@ -1011,394 +1009,3 @@ def generate_sales_moving_average_report(df: pd.DataFrame) -> str:
     🔹 3-Month MA: ₱{latest_3_ma:,.2f}<br>
     🟢 6-Month MA: ₱{latest_6_ma:,.2f}
     """
-
-# ------------ Reports -----------
-def get_text_report_for_month(year: int, month: int):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    query = f"""
-        SELECT 
-            DATE_TRUNC('day', ot.date_created) AS period,
-            COUNT(DISTINCT ot.id) AS total_orders,
-            COALESCE(SUM(oi.quantity), 0) AS total_sales,
-            COALESCE(SUM(ot.total_amount), 0) AS total_revenue
-        FROM order_transactions ot
-        LEFT JOIN (
-            SELECT order_id, SUM(quantity) AS quantity
-            FROM order_items
-            GROUP BY order_id
-        ) oi ON ot.id = oi.order_id
-        WHERE ot.status_id = 'OS005'
-        AND EXTRACT(YEAR FROM ot.date_created) = {year}
-        AND EXTRACT(MONTH FROM ot.date_created) = {month}
-        GROUP BY period
-        ORDER BY period;
-    """
-
-    df = con.execute(query).fetchdf()
-
-    #Always return a dict
-    if df.empty:
-        return {
-            "empty": True,
-            "message": f"No sales records found for {year}-{month:02d}.",
-            "title": f"Report for {pd.Timestamp(year=year, month=month, day=1).strftime('%B %Y')}",
-            "total_orders": 0,
-            "total_sales": 0,
-            "total_revenue": 0.0,
-            "breakdown": []
-        }
-
-    # Monthly totals
-    total_orders = int(df["total_orders"].sum())
-    total_sales = int(df["total_sales"].sum())
-    total_revenue = float(df["total_revenue"].sum())
-
-    breakdown = [
-        {
-            "day": row['period'].strftime("%Y-%m-%d"),
-            "orders": int(row['total_orders']),
-            "sales": int(row['total_sales']),
-            "revenue": float(row['total_revenue'])
-        }
-        for _, row in df.iterrows()
-    ]
-
-    return {
-        "empty": False,
-        "title": f"Report for {pd.Timestamp(year=year, month=month, day=1).strftime('%B %Y')}",
-        "total_orders": total_orders,
-        "total_sales": total_sales,
-        "total_revenue": total_revenue,
-        "breakdown": breakdown
-    }
-
-def get_turnover_text_report_for_month(year: int, month: int):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    query = f"""
-        WITH monthly_data AS (
-            SELECT
-                DATE_TRUNC('month', st.date_created) AS period,
-                SUM(CASE WHEN stt.type_code = 'stock-in' THEN sti.quantity * m.material_cost ELSE 0 END) AS stock_in_value,
-                SUM(CASE WHEN stt.type_code = 'stock-out' THEN sti.quantity * m.material_cost ELSE 0 END) AS cogs,
-                SUM(m.current_stock * m.material_cost) AS ending_inventory_value
-            FROM stock_transaction_items sti
-            JOIN stock_transactions st ON st.id = sti.stock_transaction_id
-            JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
-            JOIN materials m ON m.id = sti.material_id
-            WHERE EXTRACT(YEAR FROM st.date_created) = {year}
-              AND EXTRACT(MONTH FROM st.date_created) = {month}
-            GROUP BY period
-        ),
-        turnover_calc AS (
-            SELECT
-                STRFTIME(period, '%Y-%m') AS label,
-                cogs,
-                ending_inventory_value,
-                ROUND(
-                    (ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0, 2
-                ) AS avg_inventory,
-                ROUND(
-                    CASE
-                        WHEN ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0) > 0
-                        THEN cogs / ((ending_inventory_value + (cogs + stock_in_value - ending_inventory_value)) / 2.0)
-                        ELSE 0
-                    END, 2
-                ) AS turnover_rate
-            FROM monthly_data
-        )
-        SELECT label, cogs, avg_inventory, turnover_rate
-        FROM turnover_calc
-        ORDER BY label;
-    """
-    df = con.execute(query).fetchdf()
-
-    if df.empty:
-        return {"empty": True, "message": f"No turnover records found for {year}-{month:02d}"}
-
-    row = df.iloc[0]  # only one row since it's month-level
-    cogs = float(row["cogs"])
-    avg_inventory = float(row["avg_inventory"])
-    turnover_rate = float(row["turnover_rate"])
-
-    interpretation = (
-        f"Inventory turned over about {turnover_rate:.2f} times in {year}-{month:02d}."
-        if turnover_rate > 0 else
-        "No turnover occurred this month."
-    )
-
-    return {
-        "empty": False,
-        "title": f"Inventory Turnover Report for {pd.Timestamp(year=year, month=month, day=1).strftime('%B %Y')}",
-        "cogs": cogs,
-        "avg_inventory": avg_inventory,
-        "turnover_rate": turnover_rate,
-        "interpretation": interpretation
-    }
-
-def get_stl_text_report_for_month(year: int, month: int):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    # Monthly order quantity
-    query = """
-    SELECT 
-        DATE_TRUNC('month', ot.date_created) AS order_month,
-        SUM(oi.quantity) AS total_quantity
-    FROM order_transactions ot
-    JOIN order_items oi ON ot.id = oi.order_id
-    GROUP BY order_month
-    ORDER BY order_month
-    """
-    df = con.execute(query).fetchdf()
-    if df.empty:
-        return {"empty": True, "message": f"No STL data found for {year}-{month:02d}"}
-
-    df['order_month'] = pd.to_datetime(df['order_month'])
-    df.set_index('order_month', inplace=True)
-    df = df.asfreq('MS')
-    df['total_quantity'] = df['total_quantity'].fillna(0)
-
-    # Run STL decomposition
-    stl = STL(df['total_quantity'], period=12)
-    result = stl.fit()
-
-    # Top-selling product for that month
-    top_products_df = con.execute("""
-        SELECT month, product_name FROM (
-            SELECT 
-                DATE_TRUNC('month', ot.date_created) AS month,
-                i.item_name AS product_name,
-                SUM(oi.quantity) AS total_qty,
-                RANK() OVER (
-                    PARTITION BY DATE_TRUNC('month', ot.date_created) 
-                    ORDER BY SUM(oi.quantity) DESC
-                ) AS rnk
-            FROM order_transactions ot
-            JOIN order_items oi ON ot.id = oi.order_id
-            JOIN products p ON oi.product_id = p.id
-            JOIN items i ON p.item_id = i.id
-            GROUP BY month, product_name
-        ) 
-        WHERE rnk = 1
-    """).fetchdf()
-
-    if not top_products_df.empty:
-        top_products_df['month'] = pd.to_datetime(top_products_df['month'])
-        top_products_df.rename(columns={'month': 'order_month', 'product_name': 'top_product'}, inplace=True)
-
-    # Extract just that month
-    target_date = pd.Timestamp(year=year, month=month, day=1)
-    if target_date not in df.index:
-        return {"empty": True, "message": f"No STL data available for {year}-{month:02d}"}
-
-    trend_val = float(result.trend.loc[target_date])
-    seasonal_val = float(result.seasonal.loc[target_date])
-    resid_val = float(result.resid.loc[target_date])
-
-    top_product_row = (
-        top_products_df[top_products_df['order_month'] == target_date]
-        if not top_products_df.empty else None
-    )
-    top_product = top_product_row['top_product'].iloc[0] if top_product_row is not None and not top_product_row.empty else "N/A"
-
-    # Interpretations
-    if seasonal_val > 0:
-        seasonal_text = "Seasonality boosted demand this month."
-    elif seasonal_val < 0:
-        seasonal_text = "Seasonality reduced demand this month."
-    else:
-        seasonal_text = "Neutral seasonality this month."
-
-    if resid_val > 0:
-        resid_text = "Residual suggests an unexpected demand spike."
-    elif resid_val < 0:
-        resid_text = "Residual suggests an unexpected drop in demand."
-    else:
-        resid_text = "Residual suggests stable demand."
-
-    return {
-        "empty": False,
-        "title": f"STL Decomposition Report for {pd.Timestamp(year=year, month=month, day=1).strftime('%B %Y')}",
-        "top_product": top_product,
-        "trend": trend_val,
-        "seasonal": seasonal_val,
-        "residual": resid_val,
-        "interpretations": [seasonal_text, resid_text]
-    }
-
-def get_sales_moving_average_text_report(year: int, month: int | None = None):
-    with duckdb.connect(DB_PATH) as con:
-    # with duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN}) as con:
-        # --- get full dataset (no filtering here) ---
-        df = con.execute("""
-        SELECT
-            DATE_TRUNC('month', ot.date_created) AS month,
-            SUM(ot.total_amount) AS total_sales
-        FROM order_transactions ot
-        WHERE ot.status_id = 'OS005'
-        GROUP BY month
-        ORDER BY month;
-        """).fetchdf()
-
-        if df.empty:
-            return {"empty": True, "message": "No moving average records found."}
-
-        df['month'] = pd.to_datetime(df['month'])
-
-        # --- top-selling product for each month ---
-        top_products_df = con.execute("""
-            SELECT month, product_name FROM (
-                SELECT 
-                    DATE_TRUNC('month', ot.date_created) AS month,
-                    i.item_name AS product_name,
-                    SUM(oi.quantity) AS total_qty,
-                    RANK() OVER (
-                        PARTITION BY DATE_TRUNC('month', ot.date_created) 
-                        ORDER BY SUM(oi.quantity) DESC
-                    ) AS rnk
-                FROM order_transactions ot
-                JOIN order_items oi ON ot.id = oi.order_id
-                JOIN products p ON oi.product_id = p.id
-                JOIN items i ON p.item_id = i.id
-                WHERE ot.status_id = 'OS005'
-                GROUP BY month, product_name
-            ) 
-            WHERE rnk = 1
-        """).fetchdf()
-
-        if not top_products_df.empty:
-            top_products_df['month'] = pd.to_datetime(top_products_df['month'])
-
-        df = df.merge(top_products_df, on='month', how='left')
-        df.rename(columns={'product_name': 'top_product'}, inplace=True)
-
-        # --- moving averages ---
-        df['3_MA'] = df['total_sales'].rolling(window=3).mean()
-        df['6_MA'] = df['total_sales'].rolling(window=6).mean()
-
-        # --- select target row ---
-        if month is not None:
-            target_date = pd.Timestamp(year=year, month=month, day=1)
-            if target_date not in df['month'].values:
-                return {"empty": True, "message": f"No moving average data for {year}-{month:02d}"}
-            row = df[df['month'] == target_date].iloc[0]
-        else:
-            # last available month of that year
-            year_df = df[df['month'].dt.year == year]
-            if year_df.empty:
-                return {"empty": True, "message": f"No moving average records found for {year}"}
-            row = year_df.iloc[-1]
-
-        total_sales = float(row['total_sales'])
-        top_product = row['top_product'] if pd.notna(row['top_product']) else "No sales"
-        ma3 = float(row['3_MA']) if pd.notna(row['3_MA']) else None
-        ma6 = float(row['6_MA']) if pd.notna(row['6_MA']) else None
-
-        # --- return structured data ---
-        return {
-            "empty": False,
-            "title": f"Moving Average Report for {row['month'].strftime('%B %Y')}",
-            "total_sales": total_sales,
-            "top_product": top_product,
-            "ma3": ma3,
-            "ma6": ma6
-        }
-
-def get_stock_movement_report_for_month(year: int, month: int):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    query = f"""
-        SELECT 
-            m.id AS material_id,
-            i.item_name AS material_name,
-            COUNT(CASE WHEN stt.type_code = 'stock-in' THEN 1 END) AS stock_in_count,
-            COUNT(CASE WHEN stt.type_code = 'stock-out' THEN 1 END) AS stock_out_count
-        FROM stock_transaction_items sti
-        JOIN stock_transactions st ON st.id = sti.stock_transaction_id
-        JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
-        JOIN materials m ON m.id = sti.material_id
-        JOIN items i ON i.id = m.item_id
-        WHERE EXTRACT(YEAR FROM st.date_created) = {year}
-        AND EXTRACT(MONTH FROM st.date_created) = {month}
-        GROUP BY m.id, i.item_name
-        ORDER BY i.item_name;
-    """
-
-    df = con.execute(query).fetchdf()
-
-    if df.empty:
-        return {"empty": True, "message": f"No stock movement found for {year}-{month:02d}"}
-    
-
-    # --- totals across all materials ---
-    total_stock_in_events = int(df["stock_in_count"].sum())
-    total_stock_out_events = int(df["stock_out_count"].sum())
-
-    # --- material-level breakdown ---
-    breakdown = [
-        {
-            "material_id": row["material_id"],
-            "material_name": row["material_name"],
-            "stock_in_events": int(row["stock_in_count"]),
-            "stock_out_events": int(row["stock_out_count"])
-        }
-        for _, row in df.iterrows()
-    ]
-
-    return {
-        "empty": False,
-        "title": f"Stock Movement Report for {pd.Timestamp(year=year, month=month, day=1).strftime('%B %Y')} (By Frequency)",
-        "total_stock_in_events": total_stock_in_events,
-        "total_stock_out_events": total_stock_out_events,
-        "breakdown": breakdown
-    }
-
-def get_products_sold_for_month(year: int, month: int):
-    con = duckdb.connect(DB_PATH)
-    # con = duckdb.connect('md:mdb_timestock', config={"motherduck_token": MOTHERDUCK_TOKEN})
-
-    query = f"""
-        SELECT 
-            i.item_name AS product_name,
-            SUM(oi.quantity) AS total_quantity,
-            SUM(oi.line_total) AS total_sales
-        FROM order_transactions ot
-        JOIN order_items oi ON ot.id = oi.order_id
-        JOIN products p ON oi.product_id = p.id
-        JOIN items i ON p.item_id = i.id
-        WHERE ot.status_id = 'OS005'  -- only completed orders
-        AND EXTRACT(YEAR FROM ot.date_created) = {year}
-        AND EXTRACT(MONTH FROM ot.date_created) = {month}
-        GROUP BY i.item_name
-        ORDER BY total_quantity DESC;
-    """
-
-    df = con.execute(query).fetchdf()
-
-    if df.empty:
-        return {"empty": True, "message": f"No products sold in {year}-{month:02d}"}
-
-    breakdown = [
-        {
-            "product_name": row["product_name"],
-            "total_quantity": int(row["total_quantity"]),
-            "total_sales": float(row["total_sales"])
-        }
-        for _, row in df.iterrows()
-    ]
-
-    total_quantity_all = int(df["total_quantity"].sum())
-    total_sales_all = float(df["total_sales"].sum())
-
-    return {
-        "empty": False,
-        "title": f"Products Sold in {pd.Timestamp(year=year, month=month, day=1).strftime('%B %Y')}",
-        "total_quantity_all": total_quantity_all,
-        "total_sales_all": total_sales_all,
-        "breakdown": breakdown
-    }
@@ -0,0 +1,121 @@
+# http_cache.py
+# Cache-Control policy per route, applied by the cache_headers middleware in
+# main.py in place of the blanket no-store it used to set:
+#
+#   static assets (/js, /css, /images)
+#       URL fingerprinted by static_url() (?v=<content hash>): cached for a
+#       year, immutable. Otherwise no-cache: StaticFiles sends ETag and
+#       Last-Modified and answers a revalidation with 304.
+#   reference and catalog GET endpoints (VERSIONED_ROUTES)
+#       ETag derived from the versions of the tables they read
+#       (table_versions.py), no-cache. A request whose If-None-Match still
+#       matches gets a 304 before the endpoint runs.
+#   other GET endpoints under /api
+#       private, no-cache: may be kept, but always fetched again.
+#   HTML pages (authenticated) and every mutation
+#       no-store.
+#
+# A Cache-Control header set by the endpoint itself (e.g. /api/events) is
+# left alone.
+import hashlib
+import os
+import uuid
+from datetime import date
+from functools import lru_cache
+
+import plotly
+
+from . import table_versions
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+PRIVATE_REVALIDATE = "private, no-cache"
+NO_STORE = "no-store, no-cache, must-revalidate, max-age=0"
+
+STATIC_PREFIXES = ("/js/", "/css/", "/images/")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_DIR = os.path.join(BASE_DIR, "../templates")
+# plotly.js as bundled with the plotly package, so charts also work offline (Electron)
+PLOTLY_JS = os.path.join(os.path.dirname(plotly.__file__), "package_data", "plotly.min.js")
+
+# GET path -> (tables whose versions make up the ETag, also changes daily)
+VERSIONED_ROUTES = {
+    "/api/unit-measurements": ((), False),
+    "/api/order-statuses": ((), False),
+    "/api/stock-transaction-types": ((), False),
+    "/api/product-categories": (("product_categories",), False),
+    "/api/material-categories": (("material_categories",), False),
+    "/api/customers": (("customers",), False),
+    "/api/suppliers": (("suppliers",), False),
+    "/api/products": (("products", "product_categories"), False),
+    "/api/product-materials": (("product_materials", "products", "materials"), False),
+    # Stock levels move with stock and order writes; the reorder plan and the
+    # fast-moving ratings move with the day
+    "/api/materials": (
+        ("materials", "material_categories", "suppliers", "stock_transactions", "order_transactions"),
+        True,
+    ),
+}
+
+# Part of every ETag: a restart may be a new build whose responses differ for the same data
+_BUILD = uuid.uuid4().hex[:8]
+
+
+def _static_file(path: str) -> str:
+    return PLOTLY_JS if path == "js/plotly.min.js" else os.path.join(TEMPLATES_DIR, path)
+
+
+@lru_cache(maxsize=None)
+def _fingerprint(file: str, mtime: float) -> str:
+    with open(file, "rb") as f:
+        return hashlib.md5(f.read()).hexdigest()[:10]
+
+
+def static_url(path: str) -> str:
+    """URL of a static asset ('css/style.css', 'js/charts.js'), fingerprinted by its content."""
+    file = _static_file(path)
+    return f"/{path}?v={_fingerprint(file, os.path.getmtime(file))}"
+
+
+def versioned_route(request):
+    """The VERSIONED_ROUTES entry for a GET request, or None."""
+    if request.method != "GET":
+        return None
+    return VERSIONED_ROUTES.get(request.url.path)
+
+
+def etag(request, route, cur=None) -> str:
+    tables, daily = route
+    # Accept: listings come as JSON or Arrow (responses.py)
+    key = (_BUILD, request.url.path, request.url.query, request.headers.get("accept", ""),
+           table_versions.versions(tables, cur), date.today().isoformat() if daily else "")
+    return '"' + hashlib.md5(repr(key).encode()).hexdigest()[:16] + '"'
+
+
+def not_modified(request, tag: str) -> bool:
+    """True if the request's If-None-Match lists `tag` (weak or strong) or is '*'."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return "*" in candidates or tag in candidates
+
+
+def cache_control(request, response, tag=None) -> None:
+    """Set the Cache-Control (and ETag) of `response` according to the policy above."""
+    if "cache-control" in response.headers:
+        return
+    path = request.url.path
+    if path.startswith(STATIC_PREFIXES):
+        response.headers["Cache-Control"] = IMMUTABLE if "v" in request.query_params else REVALIDATE
+    elif tag is not None and response.status_code == 200:
+        response.headers["ETag"] = tag
+        response.headers["Cache-Control"] = REVALIDATE
+        response.headers["Vary"] = "Accept"
+    elif request.method == "GET" and path.startswith("/api/"):
+        response.headers["Cache-Control"] = PRIVATE_REVALIDATE
+    else:
+        response.headers["Cache-Control"] = NO_STORE
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
@@ -0,0 +1,89 @@
+# logo_store.py
+# Company logos for receipts and quotations, uploaded once and referenced by ID.
+#
+# register() decodes an uploaded image once, downscales it to at most
+# MAX_SIDE pixels a side (the PDFs draw it at 80 points at most) and stores
+# it as PNG under LOGO_DIR, named by the SHA-256 of the uploaded bytes. That
+# hash is the logo ID: uploading the same file again returns the same ID
+# without decoding it again. get() returns the stored PNG bytes the PDF
+# renderers embed, cached in memory per process.
+#
+#   python -m backend.logo_store logo.png     # register a file, print its ID
+import base64
+import hashlib
+import io
+import os
+import re
+import sys
+from functools import lru_cache
+
+from PIL import Image, UnidentifiedImageError
+
+from .files import write_atomic
+
+LOGO_DIR = os.environ.get("LOGO_DIR", "logos")
+MAX_SIDE = int(os.environ.get("LOGO_MAX_SIDE", 320))
+MAX_UPLOAD_BYTES = int(os.environ.get("LOGO_MAX_BYTES", 5 * 1024 * 1024))
+
+_LOGO_ID = re.compile(r"[0-9a-f]{64}")
+
+
+def _path(logo_id: str) -> str:
+    return os.path.join(LOGO_DIR, logo_id + ".png")
+
+
+def _downscale(data: bytes) -> bytes:
+    """PNG bytes of the image in `data`, at most MAX_SIDE pixels a side. Raises ValueError if it is not an image."""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.load()
+            img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+    except (UnidentifiedImageError, OSError, Image.DecompressionBombError) as e:
+        raise ValueError("Not a readable image") from e
+    img.thumbnail((MAX_SIDE, MAX_SIDE))
+    out = io.BytesIO()
+    img.save(out, format="PNG", optimize=True)
+    return out.getvalue()
+
+
+def register(data: bytes) -> str:
+    """Store an uploaded logo and return its ID. Raises ValueError if it is too large or not an image."""
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Logo exceeds {MAX_UPLOAD_BYTES} bytes")
+    logo_id = hashlib.sha256(data).hexdigest()
+    path = _path(logo_id)
+    if os.path.exists(path):
+        return logo_id
+
+    write_atomic(path, _downscale(data))
+    return logo_id
+
+
+def register_data_url(value: str) -> str:
+    """register() for a base64 data URL ("data:image/png;base64,...") as sent inline by older clients."""
+    try:
+        data = base64.b64decode(value.split(",")[-1], validate=True)
+    except ValueError as e:
+        raise ValueError(f"Invalid base64 logo: {e}")
+    return register(data)
+
+
+@lru_cache(maxsize=32)
+def _read(logo_id: str) -> bytes:
+    with open(_path(logo_id), "rb") as f:
+        return f.read()
+
+
+def get(logo_id: str):
+    """The PNG bytes of a registered logo, or None if there is no logo with that ID."""
+    if not _LOGO_ID.fullmatch(logo_id or ""):
+        return None
+    try:
+        return _read(logo_id)
+    except FileNotFoundError:
+        return None
+
+
+if __name__ == "__main__":
+    with open(sys.argv[1], "rb") as f:
+        print(register(f.read()))
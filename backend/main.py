@@ -1,15 +1,17 @@
-from fastapi import FastAPI, Request, Depends
+from fastapi import FastAPI, Request, Depends, HTTPException
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
+from starlette.concurrency import run_in_threadpool
 from datetime import datetime, timedelta
 from .api import router as api_router
 from .auth import router as auth_router, get_current_user
 import os
 import asyncio
-from backend import graphs
+from concurrent.futures import ThreadPoolExecutor
+from backend import graphs, http_cache, report_store, sweeper
 
 app = FastAPI(title="TimeStock Inventory API")
 app.add_middleware(
@@ -33,17 +35,45 @@ app.include_router(api_router, prefix="/api")
 app.include_router(auth_router)
 
 
+@app.on_event("startup")
+def start_background_jobs():
+    # Keeps the stored reports of closed months current; see report_store.py
+    report_store.start()
+    # Removes generated files left on disk; see sweeper.py
+    sweeper.start()
+
+
+@app.on_event("shutdown")
+def stop_background_jobs():
+    # The report store thread may be rendering inside DuckDB/ReportLab
+    report_store.stop()
+
+
+# Caching policy per route: see http_cache.py
 @app.middleware("http")
-async def no_cache_headers(request: Request, call_next):
+async def cache_headers(request: Request, call_next):
+    route = http_cache.versioned_route(request)
+    tag = None
+    if route is not None:
+        tag = await run_in_threadpool(http_cache.etag, request, route)
+        if http_cache.not_modified(request, tag):
+            return Response(status_code=304, headers={"ETag": tag, "Cache-Control": http_cache.REVALIDATE, "Vary": "Accept"})
+
     response = await call_next(request)
-    response.headers["Cache-Control"] = "no-store, no-cache, must-revalidate, max-age=0"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
+    http_cache.cache_control(request, response, tag)
     return response
 
 # Set up Jinja templates directory
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 templates = Jinja2Templates(directory=os.path.join(BASE_DIR, "../templates/html"))
+templates.env.globals["static_url"] = http_cache.static_url
+templates.env.filters["chart"] = graphs.chart_embed
+
+@app.get("/js/plotly.min.js", include_in_schema=False)
+def plotly_js():
+    return FileResponse(http_cache.PLOTLY_JS, media_type="text/javascript")
+
+app.mount("/js", StaticFiles(directory=os.path.join(BASE_DIR, "../templates/js")), name="js")
 app.mount("/css", StaticFiles(directory=os.path.join(BASE_DIR, "../templates/css")), name="css")
 app.mount("/images", StaticFiles(directory=os.path.join(BASE_DIR, "../templates/images")), name="images")
 
@@ -92,52 +122,66 @@ def materials_page(request: Request, user: dict = Depends(get_current_user)):
         return RedirectResponse(url="/login")
     return templates.TemplateResponse("Materials.html", {"request": request, "user": user})
 
-async def get_all_graphs():
-    tasks = [
-        asyncio.to_thread(graphs.get_graph_html),
-        asyncio.to_thread(graphs.get_turnover_combined_graph),
-        asyncio.to_thread(graphs.get_stl_decomposition_graph),
-        asyncio.to_thread(graphs.get_sales_moving_average_chart),
-    ]
-    results = await asyncio.gather(*tasks)
-    return results
+# ------------ Analytics chart fragments -----------
+# Analytics.html is sent as a shell; each chart is fetched from its own
+# fragment endpoint and built in this bounded pool so the four charts are
+# computed side by side instead of one after another.
+chart_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="analytics-chart")
 
-@app.get("/Analytics.html", response_class=HTMLResponse)
-def analytics_page(request: Request, user: dict = Depends(get_current_user)):
-    if not user:
-        return RedirectResponse(url="/login")
-
-    # Basic sales and turnover charts
+def build_sales_fragment():
     chart_html, chart_report = graphs.get_graph_html()
-    turnover_combined_html, _, summary_html = graphs.get_turnover_combined_graph()
+    return {"chart_html": chart_html, "chart_report": chart_report}
 
-    # STL Decomposition
+def build_turnover_fragment():
+    turnover_combined_html, _, summary_html = graphs.get_turnover_combined_graph()
+    return {"turnover_combined_html": turnover_combined_html, "summary": summary_html}
 
+def build_stl_fragment():
     stl_html, _, df, result, top_products_df = graphs.get_stl_decomposition_graph()
     stl_report = graphs.get_stl_decomposition_report(df, result)
     stl_recommendation_flat, stl_recommendation_grouped = graphs.generate_recommendations_from_stl(df, result, top_products_df)
+    return {
+        "stl_html": stl_html,
+        "stl_report": stl_report,
+        "stl_recommendation": stl_recommendation_flat,
+        "stl_recommendation_grouped": stl_recommendation_grouped,
+    }
 
-    # Moving Average Chart & Recommendations
+def build_ma_fragment():
     ma_chart_html, ma_df = graphs.get_sales_moving_average_chart()
     ma_report = graphs.generate_sales_moving_average_report(ma_df)
-    ma_recommendation = graphs.generate_moving_average_recommendations(ma_df) 
+    ma_recommendation = graphs.generate_moving_average_recommendations(ma_df)
+    return {"ma_chart_html": ma_chart_html, "ma_report": ma_report, "ma_recommendation": ma_recommendation}
+
+# fragment name -> (partial template, context builder)
+ANALYTICS_FRAGMENTS = {
+    "sales": ("analytics_sales.html", build_sales_fragment),
+    "turnover": ("analytics_turnover.html", build_turnover_fragment),
+    "stl": ("analytics_stl.html", build_stl_fragment),
+    "ma": ("analytics_ma.html", build_ma_fragment),
+}
+
+@app.get("/Analytics.html", response_class=HTMLResponse)
+def analytics_page(request: Request, user: dict = Depends(get_current_user)):
+    if not user:
+        return RedirectResponse(url="/login")
 
     return templates.TemplateResponse("Analytics.html", {
         "request": request,
         "user": user,
-        "chart_html": chart_html,
-        "chart_report": chart_report,
-        "turnover_combined_html": turnover_combined_html,
-        "summary": summary_html,
-        "stl_html": stl_html,
-        "stl_report": stl_report,
-        "stl_recommendation": stl_recommendation_flat,       
-        "stl_recommendation_grouped": stl_recommendation_grouped,  
-        "ma_chart_html": ma_chart_html,
-        "ma_report": ma_report,
-        "ma_recommendation": ma_recommendation
     })
 
+@app.get("/Analytics/fragments/{name}", response_class=HTMLResponse)
+async def analytics_fragment(name: str, request: Request, user: dict = Depends(get_current_user)):
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    if name not in ANALYTICS_FRAGMENTS:
+        raise HTTPException(status_code=404, detail="Unknown chart")
+
+    template_name, build = ANALYTICS_FRAGMENTS[name]
+    context = await asyncio.get_running_loop().run_in_executor(chart_pool, build)
+    return templates.TemplateResponse(template_name, {"request": request, **context})
+
 
 @app.get("/Order_and_Quotation.html", response_class=HTMLResponse)
 def order_quotation_page(request: Request, user: dict = Depends(get_current_user)):
@@ -186,23 +230,20 @@ def reports_page(request: Request, user: dict = Depends(get_current_user), month
             "request": request,
             "user": user,
             "error_message": f"Invalid month/year: {ve}",
+            "report": None,
             "year": year,
             "month": month
         })
 
-    # Try generating reports, catch any errors (e.g., no data)
+    # Try generating the report, catch any errors (e.g., no data)
     try:
-        report_text = graphs.get_text_report_for_month(year, month)
-        turnover_report = graphs.get_turnover_text_report_for_month(year, month)
-        stl_report = graphs.get_stl_text_report_for_month(year, month)
-        moving_avg_report = graphs.get_sales_moving_average_text_report(month=month, year=year)
-        stock_movement_report = graphs.get_stock_movement_report_for_month(year, month)
-        products_sold_report = graphs.get_products_sold_for_month(year, month)
+        report = report_store.month_report(year, month)
     except Exception as e:
         return templates.TemplateResponse("Reports.html", {
             "request": request,
             "user": user,
             "error_message": f"No data found or an error occurred for {month}/{year}: {e}",
+            "report": None,
             "year": year,
             "month": month
         })
@@ -210,12 +251,7 @@ def reports_page(request: Request, user: dict = Depends(get_current_user), month
     return templates.TemplateResponse("Reports.html", {
         "request": request,
         "user": user,
-        "report_text": report_text,
-        "turnover_report": turnover_report,
-        "stl_report": stl_report,
-        "moving_avg_report": moving_avg_report,
-        "stock_movement_report": stock_movement_report, 
-        "products_sold_report": products_sold_report,
+        "report": report,
         "year": year,
         "month": month
     })
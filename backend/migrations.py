@@ -0,0 +1,406 @@
+# migrations.py
+# Versioned schema migrations applied on top of the shipped db_timestock1.
+#
+# Each migration runs once, in its own transaction, and is recorded in
+# schema_migrations together with when it was applied. run_migrations() is
+# called at startup (database.py), so a database on the Railway volume is
+# brought up to the current schema the first time a new build opens it.
+# Append new migrations to MIGRATIONS; never renumber or edit applied ones.
+#
+# Note: DuckDB refuses ALTER TABLE on a table that has indexes, so a later
+# migration that alters one of the indexed tables must drop and recreate
+# its indexes around the ALTER.
+#
+#   python -m backend.migrations     # apply pending migrations, print status
+from .connection import cursor as db_cursor
+
+SCHEMA_MIGRATIONS_DDL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INTEGER PRIMARY KEY,
+        name VARCHAR NOT NULL,
+        applied_at TIMESTAMP NOT NULL
+    )
+"""
+
+# Each migration below holds its own SQL, as it was when the migration was
+# added, rather than calling the modules that use the tables: those change,
+# and an applied migration must not.
+
+
+# --- 1: monthly rollup tables (rollups.py) -----------------------------------
+
+_ROLLUP_TABLES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS sales_monthly_rollup (
+        month TIMESTAMP NOT NULL,
+        status_id VARCHAR NOT NULL,
+        order_count BIGINT NOT NULL,
+        total_quantity BIGINT NOT NULL,
+        total_revenue DOUBLE NOT NULL,
+        PRIMARY KEY (month, status_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS product_sales_monthly_rollup (
+        month TIMESTAMP NOT NULL,
+        status_id VARCHAR NOT NULL,
+        product_id VARCHAR NOT NULL,
+        line_count BIGINT NOT NULL,
+        total_quantity BIGINT NOT NULL,
+        total_sales DOUBLE NOT NULL,
+        PRIMARY KEY (month, status_id, product_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stock_movement_monthly_rollup (
+        month TIMESTAMP NOT NULL,
+        stock_type_id VARCHAR NOT NULL,
+        material_id VARCHAR NOT NULL,
+        line_count BIGINT NOT NULL,
+        total_quantity DOUBLE NOT NULL,
+        PRIMARY KEY (month, stock_type_id, material_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS rollup_versions (
+        scope VARCHAR PRIMARY KEY,
+        version BIGINT NOT NULL,
+        changed_at TIMESTAMP
+    )
+    """,
+    """
+    INSERT INTO rollup_versions VALUES
+        ('sales', 0, CURRENT_TIMESTAMP),
+        ('stock', 0, CURRENT_TIMESTAMP)
+    ON CONFLICT (scope) DO NOTHING
+    """,
+)
+
+# Backfill of a database that already holds history
+_ROLLUP_BACKFILL = (
+    """
+    INSERT INTO sales_monthly_rollup
+    SELECT
+        DATE_TRUNC('month', ot.date_created) AS month,
+        ot.status_id,
+        COUNT(*) AS order_count,
+        COALESCE(SUM(oi.quantity), 0) AS total_quantity,
+        COALESCE(SUM(ot.total_amount), 0) AS total_revenue
+    FROM order_transactions ot
+    LEFT JOIN (
+        SELECT order_id, SUM(quantity) AS quantity
+        FROM order_items
+        GROUP BY order_id
+    ) oi ON ot.id = oi.order_id
+    GROUP BY 1, 2
+    """,
+    """
+    INSERT INTO product_sales_monthly_rollup
+    SELECT
+        DATE_TRUNC('month', ot.date_created) AS month,
+        ot.status_id,
+        oi.product_id,
+        COUNT(*) AS line_count,
+        COALESCE(SUM(oi.quantity), 0) AS total_quantity,
+        COALESCE(SUM(oi.line_total), 0) AS total_sales
+    FROM order_items oi
+    JOIN order_transactions ot ON ot.id = oi.order_id
+    GROUP BY 1, 2, 3
+    """,
+    """
+    INSERT INTO stock_movement_monthly_rollup
+    SELECT
+        DATE_TRUNC('month', st.date_created) AS month,
+        st.stock_type_id,
+        sti.material_id,
+        COUNT(*) AS line_count,
+        COALESCE(SUM(sti.quantity), 0) AS total_quantity
+    FROM stock_transaction_items sti
+    JOIN stock_transactions st ON st.id = sti.stock_transaction_id
+    GROUP BY 1, 2, 3
+    """,
+)
+
+
+def _create_rollup_tables(cur):
+    for ddl in _ROLLUP_TABLES_DDL:
+        cur.execute(ddl)
+    has_rollups = cur.execute(
+        "SELECT EXISTS (SELECT 1 FROM sales_monthly_rollup) OR EXISTS (SELECT 1 FROM stock_movement_monthly_rollup)"
+    ).fetchone()[0]
+    if not has_rollups:
+        for sql in _ROLLUP_BACKFILL:
+            cur.execute(sql)
+
+
+# --- 2: indexes ----------------------------------------------------------------
+
+# Date range filters (graphs.py, analytics.py, reports) and the joins every
+# order/stock/BOM query makes. status_id is left unindexed: it has a handful
+# of values, so DuckDB scans it faster than it could probe an index.
+_HOT_INDEXES = (
+    ("idx_order_transactions_date_created", "order_transactions", "date_created"),
+    ("idx_stock_transactions_date_created", "stock_transactions", "date_created"),
+    ("idx_order_items_order_id", "order_items", "order_id"),
+    ("idx_stock_transaction_items_stock_transaction_id", "stock_transaction_items", "stock_transaction_id"),
+    ("idx_product_materials_product_id", "product_materials", "product_id"),
+    ("idx_materials_item_id", "materials", "item_id"),
+)
+
+
+def _create_hot_indexes(cur):
+    for name, table, column in _HOT_INDEXES:
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({column})")
+
+
+# --- 3: unique product/material pairs ------------------------------------------
+
+def _unique_product_material(cur):
+    # A product lists each material once (add_product_materials skips repeats)
+    duplicates = cur.execute("""
+        SELECT product_id, material_id, COUNT(*) AS n
+        FROM product_materials
+        GROUP BY product_id, material_id
+        HAVING COUNT(*) > 1
+        ORDER BY product_id, material_id
+        LIMIT 10
+    """).fetchall()
+    if duplicates:
+        listed = ", ".join(f"{p}/{m} (x{n})" for p, m, n in duplicates)
+        raise RuntimeError(
+            f"product_materials has duplicate product/material rows: {listed}. "
+            "Remove the duplicates before starting the app."
+        )
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_product_materials_product_material
+        ON product_materials (product_id, material_id)
+    """)
+
+
+# --- 4: alerts (alerts.py) -----------------------------------------------------
+
+_ALERT_TABLES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS alerts (
+        alert_key VARCHAR PRIMARY KEY,
+        category VARCHAR NOT NULL,
+        subject_id VARCHAR NOT NULL,
+        message VARCHAR NOT NULL,
+        first_seen TIMESTAMP NOT NULL,
+        last_seen TIMESTAMP NOT NULL,
+        resolved_at TIMESTAMP
+    )
+    """,
+    "CREATE SEQUENCE IF NOT EXISTS alert_material_changes_seq",
+    """
+    CREATE TABLE IF NOT EXISTS alert_material_changes (
+        seq BIGINT PRIMARY KEY DEFAULT nextval('alert_material_changes_seq'),
+        material_id VARCHAR NOT NULL,
+        changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS alert_engine_state (
+        id INTEGER PRIMARY KEY,
+        last_run TIMESTAMP,
+        last_full_run DATE,
+        stock_version BIGINT
+    )
+    """,
+    "INSERT INTO alert_engine_state VALUES (1, NULL, NULL, NULL) ON CONFLICT (id) DO NOTHING",
+)
+
+
+def _create_alert_tables(cur):
+    for ddl in _ALERT_TABLES_DDL:
+        cur.execute(ddl)
+
+
+# --- 5: reorder planning (reorder.py) ------------------------------------------
+
+_REORDER_TABLES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS supplier_lead_times (
+        supplier_id VARCHAR PRIMARY KEY,
+        lead_time_days DOUBLE NOT NULL,
+        date_updated TIMESTAMP
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reorder_plan (
+        material_id VARCHAR PRIMARY KEY,
+        plan_date DATE NOT NULL,
+        lead_time_days DOUBLE NOT NULL,
+        avg_daily_usage DOUBLE NOT NULL,
+        usage_std DOUBLE NOT NULL,
+        safety_stock DOUBLE NOT NULL,
+        reorder_point DOUBLE NOT NULL
+    )
+    """,
+)
+
+
+def _create_reorder_tables(cur):
+    for ddl in _REORDER_TABLES_DDL:
+        cur.execute(ddl)
+
+
+# --- 6: batch STL components (stl_batch.py) ------------------------------------
+
+_STL_TABLES_DDL = (
+    """
+    CREATE TABLE IF NOT EXISTS stl_components (
+        kind VARCHAR NOT NULL,
+        series_id VARCHAR NOT NULL,
+        month TIMESTAMP NOT NULL,
+        observed DOUBLE NOT NULL,
+        trend DOUBLE NOT NULL,
+        seasonal DOUBLE NOT NULL,
+        resid DOUBLE NOT NULL,
+        PRIMARY KEY (kind, series_id, month)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stl_series (
+        kind VARCHAR NOT NULL,
+        series_id VARCHAR NOT NULL,
+        first_month TIMESTAMP NOT NULL,
+        months INTEGER NOT NULL,
+        trend_strength DOUBLE NOT NULL,
+        seasonal_strength DOUBLE NOT NULL,
+        trend_change DOUBLE NOT NULL,
+        PRIMARY KEY (kind, series_id)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS stl_batch_runs (
+        kind VARCHAR PRIMARY KEY,
+        sales_version BIGINT NOT NULL,
+        fitted_at TIMESTAMP NOT NULL,
+        series_count INTEGER NOT NULL
+    )
+    """,
+)
+
+
+def _create_stl_tables(cur):
+    for ddl in _STL_TABLES_DDL:
+        cur.execute(ddl)
+
+
+# --- 7: catalog table version counters (replaced by 9) -------------------------
+
+_VERSIONED_TABLES = (
+    "customers",
+    "suppliers",
+    "materials",
+    "material_categories",
+    "products",
+    "product_categories",
+    "product_materials",
+    "order_transactions",
+    "stock_transactions",
+)
+
+
+def _create_table_versions(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_versions (
+            table_name VARCHAR PRIMARY KEY,
+            version BIGINT NOT NULL,
+            changed_at TIMESTAMP
+        )
+    """)
+    for table in _VERSIONED_TABLES:
+        cur.execute(
+            "INSERT INTO table_versions VALUES (?, 0, CURRENT_TIMESTAMP) ON CONFLICT (table_name) DO NOTHING",
+            (table,)
+        )
+
+
+# --- 8: stored monthly reports (report_store.py) -------------------------------
+
+def _create_report_store(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS report_store (
+            month TIMESTAMP PRIMARY KEY,
+            fingerprint VARCHAR NOT NULL,
+            generated_at TIMESTAMP NOT NULL
+        )
+    """)
+
+
+# --- 9: insert-only table change log (table_versions.py) -----------------------
+
+def _table_change_log(cur):
+    # The counter rows of migration 7 conflicted under concurrent writes
+    cur.execute("CREATE SEQUENCE IF NOT EXISTS table_changes_seq")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS table_changes (
+            seq BIGINT PRIMARY KEY DEFAULT nextval('table_changes_seq'),
+            table_name VARCHAR NOT NULL,
+            changed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cur.execute("DROP TABLE IF EXISTS table_versions")
+
+
+# (version, name, apply(cur))
+MIGRATIONS = (
+    (1, "monthly rollup tables", _create_rollup_tables),
+    (2, "indexes on hot filter and join columns", _create_hot_indexes),
+    (3, "unique product/material pairs in product_materials", _unique_product_material),
+    (4, "alert state and material change log tables", _create_alert_tables),
+    (5, "supplier lead times and reorder plan tables", _create_reorder_tables),
+    (6, "per-product and per-material STL component tables", _create_stl_tables),
+    (7, "catalog table version counters", _create_table_versions),
+    (8, "stored monthly reports of closed months", _create_report_store),
+    (9, "insert-only table change log in place of the version counters", _table_change_log),
+)
+
+
+def applied_versions(cur=None):
+    """Return {version: applied_at} for the migrations already applied."""
+    if cur is None:
+        with db_cursor() as cur:
+            return applied_versions(cur)
+    cur.execute(SCHEMA_MIGRATIONS_DDL)
+    return dict(cur.execute("SELECT version, applied_at FROM schema_migrations").fetchall())
+
+
+def run_migrations(cur=None):
+    """
+    Apply every migration not yet recorded in schema_migrations, in version
+    order. Returns the versions applied by this call.
+    """
+    if cur is None:
+        with db_cursor() as cur:
+            return run_migrations(cur)
+
+    done = applied_versions(cur)
+    applied = []
+    for version, name, apply in MIGRATIONS:
+        if version in done:
+            continue
+        cur.execute("BEGIN")
+        try:
+            apply(cur)
+            cur.execute(
+                "INSERT INTO schema_migrations VALUES (?, ?, CURRENT_TIMESTAMP)",
+                (version, name)
+            )
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+        print(f"Applied migration {version}: {name}")
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    run_migrations()
+    done = applied_versions()
+    for version, name, _ in MIGRATIONS:
+        status = f"applied {done[version]}" if version in done else "pending"
+        print(f"{version:>4}  {name:<55} {status}")
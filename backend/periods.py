@@ -0,0 +1,94 @@
+# periods.py
+# Half-open [start, end) timestamp ranges for the report and analytics filters.
+#
+# Queries compare the raw column against bound parameters
+# (`date_created >= ? AND date_created < ?`) instead of wrapping it in
+# EXTRACT(...) = ... or DATE_TRUNC(...) = ...: DuckDB can then skip row groups
+# by their min/max zone maps and use the date_created indexes, and no year,
+# month or period value is ever formatted into the SQL text.
+#
+#   sql, params = periods.range_sql("ot.date_created", periods.month_range(2024, 5))
+#   cur.execute(f"SELECT ... WHERE ot.status_id = 'OS005' AND {sql}", params)
+from datetime import date, datetime, timedelta
+
+from dateutil.relativedelta import relativedelta
+
+PERIODS = ("day", "week", "month", "quarter", "year")
+
+
+def _midnight(day) -> datetime:
+    return datetime(day.year, day.month, day.day)
+
+
+def _today() -> datetime:
+    return _midnight(date.today())
+
+
+def month_range(year: int, month: int):
+    start = datetime(int(year), int(month), 1)
+    return start, start + relativedelta(months=1)
+
+
+def quarter_range(year: int, quarter: int):
+    start = datetime(int(year), 3 * (int(quarter) - 1) + 1, 1)
+    return start, start + relativedelta(months=3)
+
+
+def year_range(year: int):
+    start = datetime(int(year), 1, 1)
+    return start, start + relativedelta(years=1)
+
+
+def week_range(day=None):
+    """The Monday-to-Monday week containing `day` (as DATE_TRUNC('week'))."""
+    start = _midnight(day or date.today())
+    start -= timedelta(days=start.weekday())
+    return start, start + timedelta(days=7)
+
+
+def period_range(period: str, day=None):
+    """The calendar day/week/month/quarter/year containing `day` (default today)."""
+    day = _midnight(day or date.today())
+    if period == "day":
+        return day, day + timedelta(days=1)
+    if period == "week":
+        return week_range(day)
+    if period == "month":
+        return month_range(day.year, day.month)
+    if period == "quarter":
+        return quarter_range(day.year, (day.month - 1) // 3 + 1)
+    if period == "year":
+        return year_range(day.year)
+    raise ValueError(f"Unknown period '{period}'. Use one of: {', '.join(PERIODS)}")
+
+
+def date_range(date_from=None, date_to=None):
+    """Whole days from `date_from` through `date_to` inclusive; a missing bound is open."""
+    start = _midnight(date_from) if date_from else None
+    end = _midnight(date_to) + timedelta(days=1) if date_to else None
+    return start, end
+
+
+def trailing(days: int = 0, months: int = 0, now=None, month_start: bool = False):
+    """
+    Open-ended range covering the last `days`/`months` up to now, anchored at
+    `now` (default: today's midnight, as CURRENT_DATE). `month_start` widens
+    the start to the first of its month.
+    """
+    start = (now or _today()) - relativedelta(months=months, days=days)
+    if month_start:
+        start = datetime(start.year, start.month, 1)
+    return start, None
+
+
+def range_sql(column: str, bounds):
+    """Return (sql, params) restricting `column` to the half-open (start, end) range."""
+    start, end = bounds
+    clauses, params = [], []
+    if start is not None:
+        clauses.append(f"{column} >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append(f"{column} < ?")
+        params.append(end)
+    return " AND ".join(clauses) or "TRUE", params
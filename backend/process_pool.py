@@ -0,0 +1,17 @@
+# process_pool.py
+# CPU-bound batch work on worker processes (stl_batch.py, report_batch.py).
+#
+# Workers are started with spawn, not fork: the parent holds the DuckDB
+# connection and the server's threads, which a forked child must not
+# inherit. Spawned workers import the module of the task function afresh,
+# so tasks and their arguments must be picklable and must not need the
+# database; callers read what the workers need first and pass it along.
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+def map_in_processes(func, items: list, workers: int) -> list:
+    """[func(item) for item in items], across at most `workers` spawned processes, in order."""
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=min(workers, len(items)), mp_context=context) as pool:
+        return list(pool.map(func, items))
@@ -4,27 +4,102 @@ from reportlab.lib import colors
 from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, HRFlowable, Image
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from datetime import datetime
-import calendar
+from functools import lru_cache
 from xml.sax.saxutils import escape
-import time, os, base64,io
+import io
 
 
-def cleanup_old_pdfs(directory, max_age_minutes=10):
-    now = time.time()
-    max_age_seconds = max_age_minutes * 60
-
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-        if filename.endswith(".pdf") and os.path.isfile(file_path):
-            file_age = now - os.path.getmtime(file_path)
-            if file_age > max_age_seconds:
-                try:
-                    os.remove(file_path)
-                except Exception as e:
-                    print(f"Failed to remove old PDF: {file_path}, error: {e}")
-
 def format_currency(value):
     return f"Php{value:,.2f}"
+
+#----------- Styles ----------
+# Paragraph and table styles of each document, built on first use and shared
+# by every render in the process (ReportLab only reads them).
+
+def _receipt_styles():
+    small = ParagraphStyle(name="Small", fontSize=7.3, leading=8.5)
+    bold = ParagraphStyle(name="Bold", parent=small, fontName="Helvetica-Bold")
+    return {
+        "small": small,
+        "bold": bold,
+        "center": ParagraphStyle(name="Center", parent=small, alignment=1),
+        "center_bold": ParagraphStyle(name="CenterBold", parent=bold, alignment=1),
+        "items": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+            ('GRID', (0, 0), (-1, -1), 0.2, colors.grey),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 6.8),
+            ('ALIGN', (2, 1), (2, -1), 'CENTER'),
+            ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ]),
+        "summary": TableStyle([
+            ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+            ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 7.2),
+            ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
+            ('LINEABOVE', (0, -1), (-1, -1), 0.5, colors.black),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+            ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ]),
+    }
+
+def _quotation_styles():
+    normal = getSampleStyleSheet()['Normal']
+    return {
+        "normal": normal,
+        "bold": ParagraphStyle(name="Bold", parent=normal, fontName="Helvetica-Bold", fontSize=10),
+        "title": ParagraphStyle(name="Title", fontName="Helvetica-Bold", fontSize=18, alignment=1, textColor=colors.HexColor("#1F3B4D")),
+        "company": ParagraphStyle(name="Company", fontName="Helvetica-Bold", fontSize=14, alignment=1, textColor=colors.HexColor("#005691")),
+        "small": ParagraphStyle(name="Small", fontSize=9, fontName="Helvetica"),
+        "label": ParagraphStyle(name="Label", fontName="Helvetica-Bold", fontSize=9, textColor=colors.HexColor("#1F3B4D")),
+        "section_title": ParagraphStyle(name="SectionTitle", fontName="Helvetica-Bold", fontSize=11, textColor=colors.HexColor("#003e74")),
+        "pricing": TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#d6eaff")),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor("#003e74")),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, -1), 9),
+            ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('GRID', (0, 0), (-1, -1), 0.4, colors.grey),
+            ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
+            ('TOPPADDING', (0, 0), (-1, -1), 5),
+        ]),
+    }
+
+def _report_styles():
+    sheet = getSampleStyleSheet()
+    return {
+        "Title": sheet["Title"],
+        "Normal": sheet["Normal"],
+        "SectionTitle": ParagraphStyle(name="SectionTitle", fontSize=14, leading=16, spaceAfter=10, textColor=colors.darkblue),
+        # Header row and grid of the report's tables
+        "table": TableStyle([
+            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
+            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
+            ("GRID", (0, 0), (-1, -1), 1, colors.black),
+        ]),
+    }
+
+_STYLE_BUILDERS = {
+    "receipt": _receipt_styles,
+    "quotation": _quotation_styles,
+    "report": _report_styles,
+}
+
+@lru_cache(maxsize=None)
+def document_styles(document):
+    """The styles of a document ("receipt", "quotation" or "report"), built once per process."""
+    return _STYLE_BUILDERS[document]()
+
+def _logo(logo, size):
+    """A centered Image of a logo_store PNG, scaled to size x size points."""
+    img = Image(io.BytesIO(logo), width=size, height=size)
+    img.hAlign = 'CENTER'
+    return img
 #Receipt
 def estimate_height(num_items):
     # Base height: header + customer info + payment summary + footer
@@ -33,27 +108,23 @@ def estimate_height(num_items):
     return (base_height + num_items * item_row_height) * mm
 
 def generate_unofficial_receipt(
-    filename, company_name, customer_name, address, phone,
-    items, down_payment, logo_data=None
-):
+    company_name, customer_name, address, phone,
+    items, down_payment, logo=None
+) -> bytes:
+    """Render the receipt in memory and return the PDF bytes. `logo` is PNG bytes from logo_store."""
     receipt_width = 80 * mm
     receipt_height = estimate_height(len(items))
 
-    doc = SimpleDocTemplate(filename, pagesize=(receipt_width, receipt_height),
+    buffer = io.BytesIO()
+    doc = SimpleDocTemplate(buffer, pagesize=(receipt_width, receipt_height),
                             rightMargin=5, leftMargin=5, topMargin=5, bottomMargin=5)
 
-    styles = getSampleStyleSheet()
-    small = ParagraphStyle(name="Small", fontSize=7.3, leading=8.5)
-    bold = ParagraphStyle(name="Bold", parent=small, fontName="Helvetica-Bold")
-    center = ParagraphStyle(name="Center", parent=small, alignment=1)
-    center_bold = ParagraphStyle(name="CenterBold", parent=bold, alignment=1)
+    styles = document_styles("receipt")
+    small, center, center_bold = styles["small"], styles["center"], styles["center_bold"]
 
     elements = []
-    if logo_data:
-        logo_bytes = io.BytesIO(base64.b64decode(logo_data.split(",")[-1]))
-        img = Image(logo_bytes, width=40, height=40)  # adjust size as needed
-        img.hAlign = 'CENTER'
-        elements.append(img)
+    if logo:
+        elements.append(_logo(logo, 40))
         elements.append(Spacer(1, 5))
 
     # Header
@@ -84,18 +155,7 @@ def generate_unofficial_receipt(
         data.append([unit_id, Paragraph(name, small), str(qty), format_currency(total)])
 
     table = Table(data, colWidths=[40, 90, 25, 50])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.whitesmoke),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
-        ('GRID', (0, 0), (-1, -1), 0.2, colors.grey),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 6.8),
-        ('ALIGN', (2, 1), (2, -1), 'CENTER'),
-        ('ALIGN', (3, 1), (3, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-    ]))
+    table.setStyle(styles["items"])
     elements.append(table)
     elements.append(Spacer(1, 6))
 
@@ -107,15 +167,7 @@ def generate_unofficial_receipt(
         ["Remaining Balance", format_currency(remaining)]
     ], colWidths=[75, 60])
 
-    summary_table.setStyle(TableStyle([
-        ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
-        ('FONTNAME', (0, -1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 7.2),
-        ('ALIGN', (1, 0), (-1, -1), 'RIGHT'),
-        ('LINEABOVE', (0, -1), (-1, -1), 0.5, colors.black),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-    ]))
+    summary_table.setStyle(styles["summary"])
     elements.append(summary_table)
     elements.append(Spacer(1, 5))
     elements.append(HRFlowable(width="100%", color=colors.black, thickness=0.5))
@@ -126,12 +178,10 @@ def generate_unofficial_receipt(
     elements.append(Paragraph("Thank you for your business!", center_bold))
 
     doc.build(elements)
-    
-    print(f"Receipt saved to: {filename}")
+    return buffer.getvalue()
 
 #Quote
 def generate_modern_quotation_pdf(
-    filename,
     client_name,
     client_address,
     items_quote,
@@ -144,23 +194,16 @@ def generate_modern_quotation_pdf(
     company_name="Times Stock Aluminum & Glass Services",
     company_address=None,
     company_contact=None,
-    logo_data=None
-):
-    styles = getSampleStyleSheet()
-    normal = styles['Normal']
-    bold = ParagraphStyle(name="Bold", parent=normal, fontName="Helvetica-Bold", fontSize=10)
-    title = ParagraphStyle(name="Title", fontName="Helvetica-Bold", fontSize=18, alignment=1, textColor=colors.HexColor("#1F3B4D"))
-    company = ParagraphStyle(name="Company", fontName="Helvetica-Bold", fontSize=14, alignment=1, textColor=colors.HexColor("#005691"))
-    small = ParagraphStyle(name="Small", fontSize=9, fontName="Helvetica")
-    label = ParagraphStyle(name="Label", fontName="Helvetica-Bold", fontSize=9, textColor=colors.HexColor("#1F3B4D"))
-    section_title = ParagraphStyle(name="SectionTitle", fontName="Helvetica-Bold", fontSize=11, textColor=colors.HexColor("#003e74"))
+    logo=None
+) -> bytes:
+    """Render the quotation in memory and return the PDF bytes. `logo` is PNG bytes from logo_store."""
+    styles = document_styles("quotation")
+    bold, title, company = styles["bold"], styles["title"], styles["company"]
+    small, label, section_title = styles["small"], styles["label"], styles["section_title"]
 
     elements = []
-    if logo_data:
-        logo_bytes = io.BytesIO(base64.b64decode(logo_data.split(",")[-1]))
-        img = Image(logo_bytes, width=80, height=80)  # adjust size as needed
-        img.hAlign = 'CENTER'
-        elements.append(img)
+    if logo:
+        elements.append(_logo(logo, 80))
         elements.append(Spacer(1, 10))
 
     elements.append(Paragraph(company_name, company))
@@ -210,17 +253,7 @@ def generate_modern_quotation_pdf(
         ])
 
     table = Table(table_data, colWidths=[20, 250, 40, 80, 80])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor("#d6eaff")),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.HexColor("#003e74")),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, -1), 9),
-        ('ALIGN', (2, 1), (-1, -1), 'CENTER'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('GRID', (0, 0), (-1, -1), 0.4, colors.grey),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 5),
-        ('TOPPADDING', (0, 0), (-1, -1), 5),
-    ]))
+    table.setStyle(styles["pricing"])
     elements.append(table)
 
     # --- Total ---
@@ -273,30 +306,33 @@ def generate_modern_quotation_pdf(
     elements.append(Paragraph(owner_position, small))
 
     # --- Build PDF ---
+    buffer = io.BytesIO()
     doc = SimpleDocTemplate(
-        filename, pagesize=letter,
+        buffer, pagesize=letter,
         rightMargin=30, leftMargin=30, topMargin=30, bottomMargin=30
     )
     doc.build(elements)
-    print(f"✅ Quotation PDF generated: {filename}")
+    return buffer.getvalue()
 
 #----------- Reports ----------
 
-def generate_report_pdf(report_text, turnover_report, stl_report, moving_avg_report, stock_movement_report,products_sold_report, year, month=None):
-    # File setup
-    month_name = calendar.month_name[month] if month else "ALL"
-    filename = f"report_{month_name}_{year}.pdf"
-    filepath = os.path.join("reports", filename)
-    os.makedirs("reports", exist_ok=True)
-
-    doc = SimpleDocTemplate(filepath, pagesize=A4)
+def generate_report_pdf(report, filepath=None):
+    """Render a reports.build_report() report to `filepath` (a path or file object), or in memory and return the PDF bytes."""
+    report_text = report["sales"]
+    turnover_report = report["turnover"]
+    stl_report = report["stl"]
+    moving_avg_report = report["moving_average"]
+    stock_movement_report = report["stock_movement"]
+    products_sold_report = report["products_sold"]
+
+    buffer = io.BytesIO() if filepath is None else None
+    doc = SimpleDocTemplate(filepath if buffer is None else buffer, pagesize=A4)
     story = []
-    styles = getSampleStyleSheet()
-    styles.add(ParagraphStyle(name="SectionTitle", fontSize=14, leading=16, spaceAfter=10, textColor=colors.darkblue))
+    styles = document_styles("report")
 
     # Title
-    story.append(Paragraph(f"Business Report - {month_name} {year}", styles["Title"]))
-    story.append(Paragraph(f"Generated on {datetime.now().strftime('%B %d, %Y %H:%M:%S')}", styles["Normal"]))
+    story.append(Paragraph(report["title"], styles["Title"]))
+    story.append(Paragraph(f"Generated on {report['generated_at'].strftime('%B %d, %Y %H:%M:%S')}", styles["Normal"]))
     story.append(Spacer(1, 20))
 
     # Sales Report
@@ -311,17 +347,13 @@ def generate_report_pdf(report_text, turnover_report, stl_report, moving_avg_rep
         data = [["Date", "Orders", "Sales", "Revenue"]]
         for row in report_text["breakdown"]:
             data.append([
-                row["day"],
+                row["period"],
                 row["orders"],
                 row["sales"],
                 f"Php{row['revenue']:,.2f}"
             ])
         table = Table(data, colWidths=[100, 80, 80, 100])
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-            ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        table.setStyle(styles["table"])
         story.append(table)
         story.append(Spacer(1, 20))
 
@@ -381,11 +413,7 @@ def generate_report_pdf(report_text, turnover_report, stl_report, moving_avg_rep
                 row["stock_out_events"]
             ])
         table = Table(data, colWidths=[200, 100, 100])
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-            ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        table.setStyle(styles["table"])
         story.append(table)
         story.append(Spacer(1, 20))
     elif stock_movement_report and stock_movement_report.get("empty", False):
@@ -408,11 +436,7 @@ def generate_report_pdf(report_text, turnover_report, stl_report, moving_avg_rep
                 f"Php{row['total_sales']:,.2f}"
             ])
         table = Table(data, colWidths=[200, 100, 100])
-        table.setStyle(TableStyle([
-            ("BACKGROUND", (0, 0), (-1, 0), colors.grey),
-            ("TEXTCOLOR", (0, 0), (-1, 0), colors.whitesmoke),
-            ("GRID", (0, 0), (-1, -1), 1, colors.black),
-        ]))
+        table.setStyle(styles["table"])
         story.append(table)
         story.append(Spacer(1, 20))
     elif products_sold_report and products_sold_report.get("empty", False):
@@ -422,4 +446,4 @@ def generate_report_pdf(report_text, turnover_report, stl_report, moving_avg_rep
 
     # Build PDF
     doc.build(story)
-    return filepath
+    return filepath if buffer is None else buffer.getvalue()
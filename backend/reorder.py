@@ -0,0 +1,153 @@
+# reorder.py
+# Reorder planning: demand statistics, safety stock and reorder points for
+# every material, stored in reorder_plan.
+#
+# The stock-out history of the last USAGE_WINDOW_DAYS complete days is pulled
+# once as a dense material x day matrix, so days without usage count as zero
+# instead of being left out of the average. For each material, with d the
+# daily usage and L its supplier's lead time (supplier_lead_times, or
+# DEFAULT_LEAD_TIME_DAYS):
+#
+#   safety_stock  = z * std(d) * sqrt(L)       z for SERVICE_LEVEL
+#   reorder_point = mean(d) * L + safety_stock
+#
+# The plan only changes with the day (the window moves) and with lead times,
+# so it is rebuilt by ensure_plan() on the first read of a day and by
+# database.update_supplier_lead_time(). The reorder chart (graphs.py), the
+# reorder alerts (alerts.py) and /api/materials all read the table.
+#
+#   python -m backend.reorder        # rebuild now
+import os
+from datetime import date, datetime, timedelta
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from .connection import cursor as db_cursor, new_cursor, write_transaction, rollback
+from .migrations import run_migrations
+
+USAGE_WINDOW_DAYS = int(os.environ.get("REORDER_WINDOW_DAYS", 30))
+SERVICE_LEVEL = float(os.environ.get("REORDER_SERVICE_LEVEL", 0.95))
+DEFAULT_LEAD_TIME_DAYS = float(os.environ.get("REORDER_LEAD_TIME_DAYS", 5))
+
+def usage_matrix(cur, day=None, days: int = USAGE_WINDOW_DAYS):
+    """
+    Stock-out quantities for the `days` complete days before `day` (default
+    today): (material ids, supplier ids, lead times, matrix of shape
+    materials x days). Every material gets a row, used or not.
+    """
+    end = datetime.combine(day or date.today(), datetime.min.time())
+    start = end - timedelta(days=days)
+
+    materials = cur.execute("""
+        SELECT m.id, m.supplier_id, COALESCE(lt.lead_time_days, ?) AS lead_time_days
+        FROM materials m
+        LEFT JOIN supplier_lead_times lt ON lt.supplier_id = m.supplier_id
+        ORDER BY m.id
+    """, (DEFAULT_LEAD_TIME_DAYS,)).fetchnumpy()
+
+    # Row/column positions come straight from SQL so the matrix fills in one assignment
+    usage = cur.execute("""
+        WITH positions AS (
+            SELECT id, ROW_NUMBER() OVER (ORDER BY id) - 1 AS row_idx
+            FROM materials
+        )
+        SELECT
+            p.row_idx,
+            DATE_DIFF('day', CAST(? AS DATE), CAST(st.date_created AS DATE)) AS day_idx,
+            SUM(sti.quantity) AS quantity
+        FROM stock_transaction_items sti
+        JOIN stock_transactions st ON st.id = sti.stock_transaction_id
+        JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
+        JOIN positions p ON p.id = sti.material_id
+        WHERE stt.type_code = 'stock-out'
+          AND st.date_created >= ? AND st.date_created < ?
+        GROUP BY 1, 2
+    """, (start, start, end)).fetchnumpy()
+
+    matrix = np.zeros((len(materials["id"]), days))
+    matrix[usage["row_idx"].astype(np.intp), usage["day_idx"].astype(np.intp)] = usage["quantity"]
+    return materials["id"], materials["supplier_id"], materials["lead_time_days"].astype(float), matrix
+
+
+def compute_plan(matrix, lead_times, service_level: float = SERVICE_LEVEL):
+    """Demand mean/std, safety stock and reorder point per matrix row (vectorised)."""
+    mean = matrix.mean(axis=1)
+    std = matrix.std(axis=1, ddof=1) if matrix.shape[1] > 1 else np.zeros(len(matrix))
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * std * np.sqrt(lead_times)
+    return {
+        "avg_daily_usage": mean,
+        "usage_std": std,
+        "safety_stock": safety_stock,
+        "reorder_point": mean * lead_times + safety_stock,
+    }
+
+
+def rebuild_plan(cur=None, day=None):
+    """Recompute reorder_plan for every material. Runs inside the caller's transaction, if any."""
+    if cur is None:
+        with db_cursor() as cur:
+            return rebuild_plan(cur, day)
+
+    day = day or date.today()
+    material_ids, _, lead_times, matrix = usage_matrix(cur, day)
+    plan = pd.DataFrame({
+        "material_id": material_ids,
+        "plan_date": day,
+        "lead_time_days": lead_times,
+        **compute_plan(matrix, lead_times),
+    })
+
+    cur.execute("DELETE FROM reorder_plan")
+    cur.register("reorder_plan_rows", plan)
+    try:
+        cur.execute("""
+            INSERT INTO reorder_plan
+            SELECT material_id, plan_date, lead_time_days, avg_daily_usage, usage_std, safety_stock, reorder_point
+            FROM reorder_plan_rows
+        """)
+    finally:
+        cur.unregister("reorder_plan_rows")
+    return len(plan)
+
+
+def _is_current(cur) -> bool:
+    return cur.execute("SELECT MAX(plan_date) FROM reorder_plan").fetchone()[0] == date.today()
+
+
+@write_transaction
+def _rebuild_for_today():
+    # Serialised with the other writers (update_supplier_lead_time rebuilds
+    # the same rows); the first caller of the day rebuilds, the rest find it current
+    cur = new_cursor()
+    try:
+        if _is_current(cur):
+            return
+        cur.execute("BEGIN")
+        rebuild_plan(cur)
+        cur.execute("COMMIT")
+    except Exception:
+        rollback(cur)
+        raise
+    finally:
+        cur.close()
+
+
+def ensure_plan(cur=None):
+    """Rebuild the plan if it was not built today. Cheap when it is current."""
+    if cur is None:
+        with db_cursor() as cur:
+            return ensure_plan(cur)
+    if not _is_current(cur):
+        _rebuild_for_today()
+
+
+if __name__ == "__main__":
+    run_migrations()
+    with db_cursor() as cur:
+        cur.execute("BEGIN")
+        count = rebuild_plan(cur)
+        cur.execute("COMMIT")
+    print(f"Rebuilt reorder plan for {count} materials")
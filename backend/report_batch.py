@@ -0,0 +1,103 @@
+# report_batch.py
+# Reports for a span of months at once: every monthly PDF plus a summary
+# of the whole span, bundled into one zip (year-end closing, audits).
+#
+# The span is read once (reports.load_period) and cut into months with
+# reports.slice_frames(). Deriving the sections and rendering each PDF
+# with ReportLab is the slow part; it runs on a process pool
+# (REPORT_WORKERS, default: all cores), one month per task, once the span
+# has enough months to pay for starting the workers. Workers only get the
+# frames: the parent holds the DuckDB file, which another process cannot
+# open. Closed months that the report store holds (report_store.py) are
+# read from there instead of being rendered again.
+#
+#   python -m backend.report_batch 2024            # writes reports_2024.zip
+#   python -m backend.report_batch 2023-07 2024-06
+import io
+import os
+import sys
+import zipfile
+
+from .connection import cursor as db_cursor
+from .process_pool import map_in_processes
+from . import reports, receipt, report_store
+
+REPORT_WORKERS = int(os.environ.get("REPORT_WORKERS", os.cpu_count() or 1))
+# Starting a worker (importing pandas and ReportLab) takes about a second,
+# rendering a month a fraction of that unless it has large tables
+PARALLEL_MIN_MONTHS = int(os.environ.get("REPORT_PARALLEL_MIN_MONTHS", 6))
+MAX_MONTHS = 120
+
+
+def _render(job):
+    """Worker: the PDF bytes of the report of one period."""
+    frames, period, stl = job
+    return receipt.generate_report_pdf(reports.derive_report(frames, period, stl))
+
+
+def render_all(jobs: list, workers: int = REPORT_WORKERS) -> list:
+    """PDF bytes for each (frames, period, stl) job, across `workers` processes for long spans."""
+    if workers <= 1 or len(jobs) < PARALLEL_MIN_MONTHS:
+        return [_render(job) for job in jobs]
+    return map_in_processes(_render, jobs, workers)
+
+
+def archive_name(period: dict) -> str:
+    return f"reports_{period['code']}.zip"
+
+
+def build_archive(period: dict, cur=None) -> bytes:
+    """
+    A zip, built in memory, of the monthly PDF of every month in `period`
+    and the summary PDF of the whole period.
+    """
+    if cur is None:
+        with db_cursor() as cur:
+            return build_archive(period, cur)
+
+    months = reports.months_of(period)
+    if len(months) > MAX_MONTHS:
+        raise ValueError(f"At most {MAX_MONTHS} months per archive")
+
+    frames = reports.load_period(cur, period)
+    files, jobs = {}, []
+    for month in months:
+        name = reports.pdf_filename(month)
+        stored = report_store.stored_pdf(month["year"], month["month"])
+        if stored is not None:
+            with open(stored, "rb") as f:
+                files[name] = f.read()
+        else:
+            files[name] = None
+            jobs.append((name, (reports.slice_frames(frames, month), month, reports.stl_section(month))))
+    if len(months) > 1:
+        files[reports.pdf_filename(period)] = None
+        jobs.append((reports.pdf_filename(period), (frames, period, reports.stl_section(period))))
+
+    for (name, _), pdf in zip(jobs, render_all([job for _, job in jobs])):
+        files[name] = pdf
+
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, pdf in files.items():
+            archive.writestr(name, pdf)
+    return buffer.getvalue()
+
+
+def parse_month(value: str):
+    """(year, month) of a 'YYYY-MM' string."""
+    year, month = value.split("-")
+    year, month = int(year), int(month)
+    if not 1 <= month <= 12:
+        raise ValueError(f"Invalid month: {value}")
+    return year, month
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and "-" not in sys.argv[1]:
+        target = reports.year_period(int(sys.argv[1]))
+    else:
+        target = reports.span_period(*parse_month(sys.argv[1]), *parse_month(sys.argv[-1]))
+    with open(archive_name(target), "wb") as f:
+        f.write(build_archive(target))
+    print(archive_name(target))
@@ -0,0 +1,256 @@
+# report_store.py
+# Stored monthly reports for closed months.
+#
+# A closed month (any month before the current one) only changes when its
+# orders or stock movements are edited after the fact, or purged by
+# delete_old_transactions(). For each closed month with data, this module
+# keeps the structured report (reports.build_month_report(), as JSON) and
+# its rendered PDF under STORE_DIR, so /Reports.html and /api/reports/pdf
+# serve them as file reads instead of querying and running ReportLab again.
+#
+# The report_store table records the fingerprint each month was generated
+# at: a hash of the month's rollup rows (rollups.py) plus the completed
+# revenue of the earlier months in its moving-average window. A background
+# thread runs sync(), which regenerates months whose fingerprint moved, adds
+# newly closed months, and drops months left without data. It runs at
+# startup, whenever the rollup versions change (every order/stock write
+# bumps them), and at month rollover. While the rollup versions and the
+# current month are as they were at the last sync, the stored files are
+# current; otherwise the report is built live and a sync is requested.
+# main.py calls stop() at shutdown, which waits for the thread to finish
+# the month it is on.
+#
+# Stored reports are snapshots: the STL components and the item names and
+# material costs are those of when the month was generated. FORMAT_VERSION
+# is part of the fingerprint; bump it when the report or PDF layout changes
+# to regenerate everything.
+#
+#   python -m backend.report_store     # sync now
+import json
+import os
+import threading
+from datetime import datetime
+
+from .connection import cursor as db_cursor, new_cursor, write_transaction, rollback
+from .files import write_atomic
+from . import rollups, reports, receipt
+
+FORMAT_VERSION = 2
+STORE_DIR = os.environ.get("REPORT_STORE_DIR", os.path.join("reports", "store"))
+# How often the background thread checks for writes and month rollover
+CHECK_SECONDS = float(os.environ.get("REPORT_STORE_INTERVAL", 60))
+
+# Fingerprint of every month that has rollup rows, before the given month
+_FINGERPRINTS = """
+    WITH sales AS (
+        SELECT month, string_agg(concat_ws(':', status_id, order_count, total_quantity, total_revenue), ',' ORDER BY status_id) AS rows
+        FROM sales_monthly_rollup
+        GROUP BY month
+    ),
+    products AS (
+        SELECT month, string_agg(concat_ws(':', status_id, product_id, line_count, total_quantity, total_sales), ',' ORDER BY status_id, product_id) AS rows
+        FROM product_sales_monthly_rollup
+        GROUP BY month
+    ),
+    stock AS (
+        SELECT month, string_agg(concat_ws(':', stock_type_id, material_id, line_count, total_quantity), ',' ORDER BY stock_type_id, material_id) AS rows
+        FROM stock_movement_monthly_rollup
+        GROUP BY month
+    ),
+    revenue_window AS (
+        SELECT month, concat_ws(',',
+            lag(total_revenue, 5, 0) OVER w, lag(total_revenue, 4, 0) OVER w, lag(total_revenue, 3, 0) OVER w,
+            lag(total_revenue, 2, 0) OVER w, lag(total_revenue, 1, 0) OVER w, total_revenue
+        ) AS rows
+        FROM sales_monthly_rollup
+        WHERE status_id = 'OS005'
+        WINDOW w AS (ORDER BY month)
+    ),
+    months AS (
+        SELECT month FROM sales_monthly_rollup
+        UNION
+        SELECT month FROM stock_movement_monthly_rollup
+    )
+    SELECT m.month, md5(concat_ws('|', ?, coalesce(s.rows, ''), coalesce(p.rows, ''), coalesce(st.rows, ''), coalesce(w.rows, '')))
+    FROM months m
+    LEFT JOIN sales s ON s.month = m.month
+    LEFT JOIN products p ON p.month = m.month
+    LEFT JOIN stock st ON st.month = m.month
+    LEFT JOIN revenue_window w ON w.month = m.month
+    WHERE m.month < ?
+"""
+
+_lock = threading.Lock()
+_running = threading.Lock()   # held while sync() runs
+_wake = threading.Event()
+_stop = threading.Event()     # set by stop(); sync() returns between months
+_thread = None
+_synced_key = None            # _store_key() as of the last completed sync
+
+
+def _current_month() -> datetime:
+    return datetime.today().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _store_key(cur):
+    # Read before the data it guards (rollups.data_version)
+    return (rollups.data_version("sales", cur)[0], rollups.data_version("stock", cur)[0], _current_month())
+
+
+def _paths(month: datetime):
+    stem = os.path.join(STORE_DIR, month.strftime("%Y-%m"))
+    return stem + ".json", stem + ".pdf"
+
+
+def _write(report: dict, month: datetime):
+    """Write the report's JSON and PDF (files.write_atomic)."""
+    json_path, pdf_path = _paths(month)
+    write_atomic(pdf_path, receipt.generate_report_pdf(report))
+    write_atomic(json_path, json.dumps(report, default=str))
+
+
+def _remove(month: datetime):
+    for path in _paths(month):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+@write_transaction
+def _record(month: datetime, fingerprint=None):
+    """Store the fingerprint a month was generated at, or with None forget the month."""
+    cur = new_cursor()
+    try:
+        cur.execute("BEGIN")
+        if fingerprint is None:
+            cur.execute("DELETE FROM report_store WHERE month = ?", (month,))
+        else:
+            cur.execute("""
+                INSERT INTO report_store VALUES (?, ?, ?)
+                ON CONFLICT (month) DO UPDATE SET
+                    fingerprint = EXCLUDED.fingerprint,
+                    generated_at = EXCLUDED.generated_at
+            """, (month, fingerprint, datetime.now()))
+        cur.execute("COMMIT")
+    except Exception:
+        rollback(cur)
+        raise
+    finally:
+        cur.close()
+
+
+def sync(cur=None) -> dict:
+    """
+    Bring the store up to date. Returns {"generated": [months], "removed": [months]}.
+    After stop() it returns early, between months, leaving the store to the next sync.
+    """
+    global _synced_key
+    if cur is None:
+        with _running, db_cursor() as cur:
+            return sync(cur)
+
+    key = _store_key(cur)
+    current = dict(cur.execute(_FINGERPRINTS, (str(FORMAT_VERSION), key[2])).fetchall())
+    stored = dict(cur.execute("SELECT month, fingerprint FROM report_store").fetchall())
+
+    generated = []
+    for month in sorted(current):
+        if _stop.is_set():
+            return {"generated": generated, "removed": []}
+        if stored.get(month) == current[month] and os.path.exists(_paths(month)[1]):
+            continue
+        _write(reports.build_month_report(month.year, month.month, cur), month)
+        _record(month, current[month])
+        generated.append(month)
+
+    removed = [month for month in stored if month not in current]
+    for month in removed:
+        _record(month)
+        _remove(month)
+
+    _synced_key = key
+    return {"generated": generated, "removed": removed}
+
+
+def _is_current(cur) -> bool:
+    return _synced_key is not None and _store_key(cur) == _synced_key
+
+
+def _stored_path(year: int, month: int, kind: int):
+    """Path of a month's stored JSON (kind 0) or PDF (kind 1) if the store is current and has it, else None."""
+    target = datetime(year, month, 1)
+    if target >= _current_month():
+        return None
+    with db_cursor() as cur:
+        current = _is_current(cur)
+    if not current:
+        _wake.set()
+        return None
+    # A current store has every closed month with data
+    path = _paths(target)[kind]
+    return path if os.path.exists(path) else None
+
+
+def month_report(year: int, month: int) -> dict:
+    """The report of a month: read from the store when it holds it, otherwise built now."""
+    path = _stored_path(year, month, 0)
+    if path is None:
+        return reports.build_month_report(year, month)
+    with open(path, encoding="utf-8") as f:
+        report = json.load(f)
+    report["generated_at"] = datetime.fromisoformat(report["generated_at"])
+    return report
+
+
+def stored_pdf(year: int, month: int):
+    """Path of the stored PDF of a month, or None if the store does not hold a current one."""
+    return _stored_path(year, month, 1)
+
+
+# --- Background job ----------------------------------------------------------
+
+def _run():
+    while True:
+        _wake.wait(CHECK_SECONDS)
+        _wake.clear()
+        if _stop.is_set():
+            return
+        try:
+            with db_cursor() as cur:
+                if _is_current(cur):
+                    continue
+            result = sync()
+            if result["generated"] or result["removed"]:
+                print(f"Report store: {len(result['generated'])} generated, {len(result['removed'])} removed")
+        except Exception as e:
+            # e.g. a write conflict on report_store; retried on the next check
+            print(f"Report store sync failed: {e}")
+
+
+def start():
+    """Start the background sync thread (once per process); it syncs right away."""
+    global _thread
+    with _lock:
+        if _thread is not None:
+            return
+        _thread = threading.Thread(target=_run, name="report-store", daemon=True)
+    _wake.set()
+    _thread.start()
+
+
+def stop():
+    """
+    Stop the background thread and wait for it, at app shutdown. A sync in
+    progress finishes the month it is rendering; exiting while the thread is
+    inside DuckDB or ReportLab aborts the process.
+    """
+    _stop.set()
+    _wake.set()
+    with _lock:
+        thread = _thread
+    if thread is not None:
+        thread.join()
+
+
+if __name__ == "__main__":
+    result = sync()
+    print(f"{len(result['generated'])} generated, {len(result['removed'])} removed")
@@ -0,0 +1,388 @@
+# reports.py
+# Report engine behind Reports.html and /api/reports/*.
+#
+# A report covers a period of whole months: one month, a calendar year, or
+# any span of months (month_period(), year_period(), span_period()).
+# load_period() reads the period once, in one read transaction, as column
+# frames: its orders, their order items and the stock ledger lines, plus the
+# completed revenue per month up to its end (for the moving averages).
+# derive_report() computes the six sections from those frames in pandas;
+# it does not touch the database, so it also runs in worker processes
+# (report_batch.py), and slice_frames() cuts a month out of a longer
+# period's frames without reading again. Only the STL section comes from
+# elsewhere, the cached fit of graphs.get_stl_fit() (stl_section()).
+#
+# The report is a single dict. The template and receipt.generate_report_pdf()
+# both render from it:
+#
+#   {"year", "month" (None unless a single month), "code", "label", "title",
+#    "generated_at",
+#    "sales", "turnover", "stl", "moving_average", "stock_movement", "products_sold"}
+#
+# Each section is {"empty": True, "message": ...} when there is nothing to
+# report. Monthly reports break sales down by day, longer periods by month;
+# the moving average and STL sections describe the last month of the period
+# that has data.
+import calendar
+from datetime import datetime
+
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from .connection import cursor as db_cursor
+from . import periods
+
+COMPLETED = "OS005"   # order status counted as a sale
+
+_ORDERS = """
+    SELECT ot.id AS order_id, CAST(ot.date_created AS DATE) AS day, ot.status_id, ot.total_amount
+    FROM order_transactions ot
+    WHERE {in_period}
+"""
+
+# Items of orders whose product was deleted keep a NULL product_name
+_ORDER_ITEMS = """
+    SELECT oi.order_id, CAST(ot.date_created AS DATE) AS day, ot.status_id,
+           i.item_name AS product_name, oi.quantity, oi.line_total
+    FROM order_items oi
+    JOIN order_transactions ot ON ot.id = oi.order_id
+    LEFT JOIN products p ON p.id = oi.product_id
+    LEFT JOIN items i ON i.id = p.item_id
+    WHERE {in_period}
+"""
+
+_STOCK_LINES = """
+    SELECT
+        CAST(st.date_created AS DATE) AS day,
+        sti.material_id,
+        i.item_name AS material_name,
+        stt.type_code,
+        sti.quantity,
+        m.material_cost
+    FROM stock_transaction_items sti
+    JOIN stock_transactions st ON st.id = sti.stock_transaction_id
+    JOIN stock_transaction_types stt ON stt.id = st.stock_type_id
+    JOIN materials m ON m.id = sti.material_id
+    JOIN items i ON i.id = m.item_id
+    WHERE {in_period}
+"""
+
+# Completed revenue of every month with sales up to the end of the period
+_MONTHLY_REVENUE = """
+    SELECT month, total_revenue
+    FROM sales_monthly_rollup
+    WHERE status_id = ? AND month < ?
+    ORDER BY month
+"""
+
+
+# --- Periods -----------------------------------------------------------------
+
+def month_period(year: int, month: int) -> dict:
+    start, end = periods.month_range(year, month)
+    return {
+        "start": start, "end": end, "year": start.year, "month": start.month,
+        "code": f"{start:%Y-%m}", "label": f"{start:%B %Y}",
+    }
+
+
+def span_period(start_year: int, start_month: int, end_year: int, end_month: int) -> dict:
+    """The months from start_year-start_month through end_year-end_month, inclusive."""
+    start = periods.month_range(start_year, start_month)[0]
+    end = periods.month_range(end_year, end_month)[1]
+    if end <= start:
+        raise ValueError("The period must end on or after the month it starts")
+    if end == start + relativedelta(months=1):
+        return month_period(start_year, start_month)
+    if (start.month, end.month, end.year) == (1, 1, start.year + 1):
+        code = label = str(start.year)
+    else:
+        last = end - relativedelta(months=1)
+        code, label = f"{start:%Y-%m}_to_{last:%Y-%m}", f"{start:%B %Y} - {last:%B %Y}"
+    return {"start": start, "end": end, "year": start.year, "month": None, "code": code, "label": label}
+
+
+def year_period(year: int) -> dict:
+    return span_period(year, 1, year, 12)
+
+
+def months_of(period: dict) -> list:
+    """The month_period() of every month in `period`, in order."""
+    months, start = [], period["start"]
+    while start < period["end"]:
+        months.append(month_period(start.year, start.month))
+        start += relativedelta(months=1)
+    return months
+
+
+def pdf_filename(report: dict) -> str:
+    if report["month"]:
+        return f"report_{calendar.month_name[report['month']]}_{report['year']}.pdf"
+    if report["code"] == str(report["year"]):
+        return f"report_ALL_{report['year']}.pdf"
+    return f"report_{report['code']}.pdf"
+
+
+# --- Loading -----------------------------------------------------------------
+
+def load_period(cur, period: dict) -> dict:
+    """The period's orders, order items and stock ledger lines, and the monthly completed revenue, as frames."""
+    bounds = (period["start"], period["end"])
+    orders_sql, orders_params = periods.range_sql("ot.date_created", bounds)
+    stock_sql, stock_params = periods.range_sql("st.date_created", bounds)
+
+    cur.execute("BEGIN")
+    try:
+        frames = {
+            "orders": cur.execute(_ORDERS.format(in_period=orders_sql), orders_params).fetchdf(),
+            "order_items": cur.execute(_ORDER_ITEMS.format(in_period=orders_sql), orders_params).fetchdf(),
+            "stock_lines": cur.execute(_STOCK_LINES.format(in_period=stock_sql), stock_params).fetchdf(),
+            "revenue": cur.execute(_MONTHLY_REVENUE, (COMPLETED, period["end"])).fetchdf(),
+        }
+        cur.execute("COMMIT")
+    except Exception:
+        cur.execute("ROLLBACK")
+        raise
+    return frames
+
+
+def _within(df: pd.DataFrame, start, end) -> pd.DataFrame:
+    return df[(df["day"] >= pd.Timestamp(start)) & (df["day"] < pd.Timestamp(end))]
+
+
+def slice_frames(frames: dict, period: dict) -> dict:
+    """The frames of `period`, cut out of the frames of a period that contains it."""
+    sliced = {name: _within(frames[name], period["start"], period["end"]) for name in ("orders", "order_items", "stock_lines")}
+    sliced["revenue"] = frames["revenue"][frames["revenue"]["month"] < pd.Timestamp(period["end"])]
+    return sliced
+
+
+# --- Sections ----------------------------------------------------------------
+
+def _sales(frames, period):
+    title = f"Report for {period['label']}"
+    orders = frames["orders"][frames["orders"]["status_id"] == COMPLETED]
+    if orders.empty:
+        return {
+            "empty": True,
+            "message": f"No sales records found for {period['code']}.",
+            "title": title,
+            "total_orders": 0,
+            "total_sales": 0,
+            "total_revenue": 0.0,
+            "breakdown": []
+        }
+
+    quantities = frames["order_items"].groupby("order_id")["quantity"].sum()
+    orders = orders.assign(
+        quantity=orders["order_id"].map(quantities).fillna(0),
+        period=orders["day"].dt.strftime("%Y-%m-%d" if period["month"] else "%Y-%m"),
+    )
+    totals = orders.groupby("period").agg(
+        total_orders=("order_id", "nunique"),
+        total_sales=("quantity", "sum"),
+        total_revenue=("total_amount", "sum"),
+    ).sort_index()
+
+    return {
+        "empty": False,
+        "title": title,
+        "total_orders": int(totals["total_orders"].sum()),
+        "total_sales": int(totals["total_sales"].sum()),
+        "total_revenue": float(totals["total_revenue"].sum()),
+        "breakdown": [
+            {"period": label, "orders": int(orders_), "sales": int(sales), "revenue": float(revenue)}
+            for label, orders_, sales, revenue in totals.itertuples()
+        ]
+    }
+
+
+def _turnover(frames, period):
+    lines = frames["stock_lines"]
+    if lines.empty:
+        return {"empty": True, "message": f"No turnover records found for {period['code']}"}
+
+    value = lines["quantity"] * lines["material_cost"]
+    stock_in_value = float(value[lines["type_code"] == "stock-in"].sum())
+    cogs = float(value[lines["type_code"] == "stock-out"].sum())
+    # Average of the ending inventory and the opening inventory implied by the
+    # period's movements; the ending value cancels out
+    average = (cogs + stock_in_value) / 2.0
+    turnover_rate = round(cogs / average, 2) if average > 0 else 0.0
+
+    if turnover_rate > 0:
+        interpretation = f"Inventory turned over about {turnover_rate:.2f} times in {period['code']}."
+    elif period["month"]:
+        interpretation = "No turnover occurred this month."
+    else:
+        interpretation = "No turnover occurred in this period."
+    return {
+        "empty": False,
+        "title": f"Inventory Turnover Report for {period['label']}",
+        "cogs": cogs,
+        "avg_inventory": round(average, 2),
+        "turnover_rate": turnover_rate,
+        "interpretation": interpretation
+    }
+
+
+def stl_section(period: dict) -> dict:
+    """STL components of the last month of `period` in the fit of total monthly demand."""
+    from . import graphs   # plotly/statsmodels; not needed by the report workers
+
+    code = period["code"]
+    df, result, top_products_df = graphs.get_stl_fit()
+    if df.empty:
+        return {"empty": True, "message": f"No STL data found for {code}"}
+    if result is None:
+        return {"empty": True, "message": f"Insufficient data for STL decomposition ({code})"}
+
+    in_period = df.index[(df.index >= pd.Timestamp(period["start"])) & (df.index < pd.Timestamp(period["end"]))]
+    if in_period.empty:
+        return {"empty": True, "message": f"No STL data available for {code}"}
+    target_date = in_period.max()
+
+    trend_val = float(result.trend.loc[target_date])
+    seasonal_val = float(result.seasonal.loc[target_date])
+    resid_val = float(result.resid.loc[target_date])
+
+    top_product_row = (
+        top_products_df[top_products_df['order_month'] == target_date]
+        if not top_products_df.empty else None
+    )
+    top_product = top_product_row['top_product'].iloc[0] if top_product_row is not None and not top_product_row.empty else "N/A"
+
+    if seasonal_val > 0:
+        seasonal_text = "Seasonality boosted demand this month."
+    elif seasonal_val < 0:
+        seasonal_text = "Seasonality reduced demand this month."
+    else:
+        seasonal_text = "Neutral seasonality this month."
+
+    if resid_val > 0:
+        resid_text = "Residual suggests an unexpected demand spike."
+    elif resid_val < 0:
+        resid_text = "Residual suggests an unexpected drop in demand."
+    else:
+        resid_text = "Residual suggests stable demand."
+
+    return {
+        "empty": False,
+        "title": f"STL Decomposition Report for {target_date.strftime('%B %Y')}",
+        "top_product": top_product,
+        "trend": trend_val,
+        "seasonal": seasonal_val,
+        "residual": resid_val,
+        "interpretations": [seasonal_text, resid_text]
+    }
+
+
+def _completed_products(items):
+    """Quantity and sales per product name over the completed orders among `items`, best-selling first."""
+    items = items[(items["status_id"] == COMPLETED) & items["product_name"].notna()]
+    totals = items.groupby("product_name").agg(
+        total_quantity=("quantity", "sum"),
+        total_sales=("line_total", "sum"),
+    ).reset_index()
+    return totals.sort_values(["total_quantity", "product_name"], ascending=[False, True])
+
+
+def _moving_average(frames, period):
+    # Months without completed sales have no rollup row, so the averages run
+    # over the months that have one, as in the moving average chart
+    window = frames["revenue"].iloc[::-1].head(6)
+    if window.empty or pd.Timestamp(window["month"].iloc[0]) < pd.Timestamp(period["start"]):
+        return {"empty": True, "message": f"No moving average data for {period['code']}"}
+
+    target_date = pd.Timestamp(window["month"].iloc[0])
+    revenue = window["total_revenue"].astype(float)
+    items = _within(frames["order_items"], target_date, target_date + pd.DateOffset(months=1))
+    products = _completed_products(items)
+    return {
+        "empty": False,
+        "title": f"Moving Average Report for {target_date.strftime('%B %Y')}",
+        "total_sales": float(revenue.iloc[0]),
+        "top_product": products["product_name"].iloc[0] if not products.empty else "No sales",
+        "ma3": float(revenue.iloc[:3].mean()) if len(revenue) >= 3 else None,
+        "ma6": float(revenue.iloc[:6].mean()) if len(revenue) >= 6 else None
+    }
+
+
+def _stock_movement(frames, period):
+    lines = frames["stock_lines"]
+    if lines.empty:
+        return {"empty": True, "message": f"No stock movement found for {period['code']}"}
+
+    counts = lines.assign(
+        stock_in_count=lines["type_code"] == "stock-in",
+        stock_out_count=lines["type_code"] == "stock-out",
+    ).groupby(["material_name", "material_id"])[["stock_in_count", "stock_out_count"]].sum()
+
+    return {
+        "empty": False,
+        "title": f"Stock Movement Report for {period['label']} (By Frequency)",
+        "total_stock_in_events": int(counts["stock_in_count"].sum()),
+        "total_stock_out_events": int(counts["stock_out_count"].sum()),
+        "breakdown": [
+            {
+                "material_id": material_id,
+                "material_name": material_name,
+                "stock_in_events": int(stock_in),
+                "stock_out_events": int(stock_out)
+            }
+            for (material_name, material_id), stock_in, stock_out in counts.itertuples()
+        ]
+    }
+
+
+def _products_sold(frames, period):
+    products = _completed_products(frames["order_items"])
+    if products.empty:
+        return {"empty": True, "message": f"No products sold in {period['code']}"}
+
+    return {
+        "empty": False,
+        "title": f"Products Sold in {period['label']}",
+        "total_quantity_all": int(products["total_quantity"].sum()),
+        "total_sales_all": float(products["total_sales"].sum()),
+        "breakdown": [
+            {"product_name": name, "total_quantity": int(quantity), "total_sales": float(sales)}
+            for name, quantity, sales in products.itertuples(index=False)
+        ]
+    }
+
+
+# --- Reports -----------------------------------------------------------------
+
+def derive_report(frames: dict, period: dict, stl: dict) -> dict:
+    """The report of `period` from its frames (load_period/slice_frames) and its stl_section()."""
+    return {
+        "year": period["year"],
+        "month": period["month"],
+        "code": period["code"],
+        "label": period["label"],
+        "title": f"Business Report - {period['label']}",
+        "generated_at": datetime.now(),
+        "sales": _sales(frames, period),
+        "turnover": _turnover(frames, period),
+        "stl": stl,
+        "moving_average": _moving_average(frames, period),
+        "stock_movement": _stock_movement(frames, period),
+        "products_sold": _products_sold(frames, period),
+    }
+
+
+def build_report(period: dict, cur=None) -> dict:
+    """Every section of the report of `period`, from a single read of it."""
+    if cur is None:
+        with db_cursor() as cur:
+            return build_report(period, cur)
+    return derive_report(load_period(cur, period), period, stl_section(period))
+
+
+def build_month_report(year: int, month: int, cur=None) -> dict:
+    return build_report(month_period(year, month), cur)
+
+
+def build_year_report(year: int, cur=None) -> dict:
+    return build_report(year_period(year), cur)
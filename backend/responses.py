@@ -0,0 +1,127 @@
+# responses.py
+# Fast serialization for the DataFrame-backed listing endpoints.
+#
+# Returning df.to_dict(orient="records") makes a dict per row, which
+# FastAPI's jsonable_encoder then walks value by value. Instead, the frame is
+# registered with DuckDB, which renders the whole JSON array straight from
+# its columns and hands Python back one string. Missing values come out as
+# null (the old path produced NaN/"NaT", which is not JSON), and
+# timestamps keep the isoformat() shape ("2024-05-01T10:00:00[.ffffff]",
+# with "+HH:MM" for tz-aware ones).
+#
+# A client that sends `Accept: application/vnd.apache.arrow.stream` gets the
+# same frame as an Arrow IPC stream instead (pyarrow, see requirements.txt).
+# Extra top-level fields of the JSON body (next_cursor) travel as X-* headers
+# there.
+import json
+
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException
+from fastapi.responses import Response
+
+from .connection import cursor as db_cursor
+
+try:
+    import pyarrow as pa
+except ImportError:   # in requirements.txt; without it only the Arrow format is unavailable
+    pa = None
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+
+
+def _quote(column) -> str:
+    return '"' + str(column).replace('"', '""') + '"'
+
+
+def _listing_frame(df: pd.DataFrame):
+    """
+    The frame to register for `df`: each tz-aware column replaced by its
+    wall-clock time in its own zone plus an "<column>__utcoffset" column of
+    seconds (DuckDB would read it as TIMESTAMPTZ and print it in the session
+    time zone, without the offset), and a "__position" column that keeps the
+    rows in order. Returns (frame, names of the tz-aware columns).
+    """
+    zoned = [c for c, dtype in df.dtypes.items() if isinstance(dtype, pd.DatetimeTZDtype)]
+    extra = {"__position": np.arange(len(df))}
+    for column in zoned:
+        wall = df[column].dt.tz_localize(None)
+        extra[f"{column}__utcoffset"] = (wall - df[column].dt.tz_convert(None)).dt.total_seconds().astype("Int64")
+        extra[column] = wall
+    return df.assign(**extra), zoned
+
+
+def _json_select(df: pd.DataFrame, zoned=()) -> str:
+    # One JSON array string for the whole frame: each row becomes a struct of
+    # its columns, aggregated in frame order. DuckDB writes timestamps as
+    # "2024-05-01 10:00:00.1234"; format them as isoformat() does: a 'T', six
+    # fraction digits unless there are none, and "+HH:MM" after the tz-aware
+    # ones (see _listing_frame)
+    iso = ("CASE WHEN microsecond({c}) % 1000000 = 0 THEN strftime({c}, '%Y-%m-%dT%H:%M:%S') "
+           "ELSE strftime({c}, '%Y-%m-%dT%H:%M:%S.%f') END")
+    offset = (" || printf('%s%02d:%02d', CASE WHEN {o} < 0 THEN '-' ELSE '+' END, "
+              "abs({o}) // 3600, abs({o}) % 3600 // 60)")
+    fields = []
+    for column, dtype in df.dtypes.items():
+        value = _quote(column)
+        if pd.api.types.is_datetime64_any_dtype(dtype):
+            value = iso.format(c=value)
+            if column in zoned:
+                value += offset.format(o=_quote(f"{column}__utcoffset"))
+        fields.append(f"{_quote(column)} := {value}")
+    return (f"SELECT CAST(to_json(list(struct_pack({', '.join(fields)}) ORDER BY __position)) AS VARCHAR) "
+            "FROM listing_rows")
+
+
+def records_json(df: pd.DataFrame, cur=None) -> str:
+    """JSON array of the rows of `df`, in order, as df.to_dict(orient="records") would list them."""
+    if cur is None:
+        with db_cursor() as cur:
+            return records_json(df, cur)
+    if df.empty:
+        return "[]"
+    frame, zoned = _listing_frame(df)
+    cur.register("listing_rows", frame)
+    try:
+        return cur.execute(_json_select(df, zoned)).fetchone()[0]
+    finally:
+        cur.unregister("listing_rows")
+
+
+class RecordsResponse(Response):
+    """JSON response rendered from a DataFrame by records_json(), optionally wrapped as {key: rows, **extra}."""
+    media_type = "application/json"
+
+    def __init__(self, df: pd.DataFrame, key: str = None, extra: dict = None, **kwargs):
+        body = records_json(df)
+        if key is not None:
+            fields = [f"{json.dumps(key)}:{body}"]
+            fields += [f"{json.dumps(k)}:{json.dumps(v, default=str)}" for k, v in (extra or {}).items()]
+            body = "{" + ",".join(fields) + "}"
+        super().__init__(content=body, **kwargs)
+
+
+class ArrowResponse(Response):
+    """Arrow IPC stream of a DataFrame."""
+    media_type = ARROW_STREAM
+
+    def render(self, content: pd.DataFrame) -> bytes:
+        table = pa.Table.from_pandas(content, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+
+
+def wants_arrow(request) -> bool:
+    return ARROW_STREAM in request.headers.get("accept", "")
+
+
+def records_response(request, df: pd.DataFrame, key: str = None, **extra) -> Response:
+    """The listing in the format the client accepts: JSON records (default) or an Arrow stream."""
+    if not wants_arrow(request):
+        return RecordsResponse(df, key, extra)
+    if pa is None:
+        raise HTTPException(status_code=406, detail="Arrow output needs pyarrow on the server")
+    headers = {f"X-{k.replace('_', '-').title()}": str(v) for k, v in extra.items() if v is not None}
+    return ArrowResponse(df, headers=headers)
@@ -0,0 +1,234 @@
+# rollups.py
+# Monthly rollup tables for sales and stock movement.
+#
+# The analytics/report functions in graphs.py read these instead of
+# re-aggregating the full order/stock history on every request. The write
+# paths in database.py keep them current by calling record_orders() /
+# record_stock_transactions() on the same cursor as the write, and
+# rebuild_rollups() recomputes them from the base tables (backfill, purge).
+# Every change also bumps a per-scope counter in rollup_versions, in the same
+# transaction, which caches of derived results (e.g. the STL fit) key on.
+#
+#   python -m backend.rollups        # full rebuild
+from .connection import cursor as db_cursor
+from .migrations import run_migrations
+
+ROLLUP_TABLES = (
+    "sales_monthly_rollup",
+    "product_sales_monthly_rollup",
+    "stock_movement_monthly_rollup",
+)
+
+# Version scopes: 'sales' covers orders/order items, 'stock' covers stock movement
+VERSION_SCOPES = ("sales", "stock")
+
+
+# --- Source aggregates -------------------------------------------------------
+# Each takes a {where} filter on the base table alias (ot / st) so the same SQL
+# serves both the per-write deltas and the range rebuilds.
+
+_SALES_SOURCE = """
+    SELECT
+        DATE_TRUNC('month', ot.date_created) AS month,
+        ot.status_id,
+        {sign} * COUNT(*) AS order_count,
+        {sign} * COALESCE(SUM(oi.quantity), 0) AS total_quantity,
+        {sign} * COALESCE(SUM(ot.total_amount), 0) AS total_revenue
+    FROM order_transactions ot
+    LEFT JOIN (
+        SELECT order_id, SUM(quantity) AS quantity
+        FROM order_items
+        WHERE order_id IN (SELECT ot.id FROM order_transactions ot WHERE {where})
+        GROUP BY order_id
+    ) oi ON ot.id = oi.order_id
+    WHERE {where}
+    GROUP BY 1, 2
+"""
+
+_PRODUCT_SALES_SOURCE = """
+    SELECT
+        DATE_TRUNC('month', ot.date_created) AS month,
+        ot.status_id,
+        oi.product_id,
+        {sign} * COUNT(*) AS line_count,
+        {sign} * COALESCE(SUM(oi.quantity), 0) AS total_quantity,
+        {sign} * COALESCE(SUM(oi.line_total), 0) AS total_sales
+    FROM order_items oi
+    JOIN order_transactions ot ON ot.id = oi.order_id
+    WHERE {where}
+    GROUP BY 1, 2, 3
+"""
+
+_STOCK_SOURCE = """
+    SELECT
+        DATE_TRUNC('month', st.date_created) AS month,
+        st.stock_type_id,
+        sti.material_id,
+        {sign} * COUNT(*) AS line_count,
+        {sign} * COALESCE(SUM(sti.quantity), 0) AS total_quantity
+    FROM stock_transaction_items sti
+    JOIN stock_transactions st ON st.id = sti.stock_transaction_id
+    WHERE {where}
+    GROUP BY 1, 2, 3
+"""
+
+_UPSERT = {
+    "sales_monthly_rollup": """
+        ON CONFLICT (month, status_id) DO UPDATE SET
+            order_count = order_count + EXCLUDED.order_count,
+            total_quantity = total_quantity + EXCLUDED.total_quantity,
+            total_revenue = total_revenue + EXCLUDED.total_revenue
+    """,
+    "product_sales_monthly_rollup": """
+        ON CONFLICT (month, status_id, product_id) DO UPDATE SET
+            line_count = line_count + EXCLUDED.line_count,
+            total_quantity = total_quantity + EXCLUDED.total_quantity,
+            total_sales = total_sales + EXCLUDED.total_sales
+    """,
+    "stock_movement_monthly_rollup": """
+        ON CONFLICT (month, stock_type_id, material_id) DO UPDATE SET
+            line_count = line_count + EXCLUDED.line_count,
+            total_quantity = total_quantity + EXCLUDED.total_quantity
+    """,
+}
+
+# A rollup row whose count drops to zero no longer describes anything
+_PRUNE = {
+    "sales_monthly_rollup": "DELETE FROM sales_monthly_rollup WHERE order_count <= 0",
+    "product_sales_monthly_rollup": "DELETE FROM product_sales_monthly_rollup WHERE line_count <= 0",
+    "stock_movement_monthly_rollup": "DELETE FROM stock_movement_monthly_rollup WHERE line_count <= 0",
+}
+
+
+def _placeholders(ids):
+    return ",".join(["?"] * len(ids))
+
+
+def _bump(cur, scope):
+    cur.execute("""
+        UPDATE rollup_versions
+        SET version = version + 1, changed_at = CURRENT_TIMESTAMP
+        WHERE scope = ?
+    """, (scope,))
+
+
+def _apply(cur, table, source, where, params, sign):
+    cur.execute(
+        f"INSERT INTO {table} " + source.format(sign=int(sign), where=where) + _UPSERT[table],
+        params
+    )
+    if sign < 0:
+        cur.execute(_PRUNE[table])
+
+
+def record_orders(cur, order_ids, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) the contribution of the given orders,
+    as they currently stand in the base tables, to the sales rollups.
+    Call with -1 before changing/deleting an order and +1 after.
+    """
+    order_ids = [order_ids] if isinstance(order_ids, str) else list(order_ids)
+    if not order_ids:
+        return
+    where = f"ot.id IN ({_placeholders(order_ids)})"
+    _apply(cur, "sales_monthly_rollup", _SALES_SOURCE, where, order_ids * 2, sign)
+    _apply(cur, "product_sales_monthly_rollup", _PRODUCT_SALES_SOURCE, where, order_ids, sign)
+    _bump(cur, "sales")
+
+
+def record_stock_transactions(cur, stock_transaction_ids, sign: int = 1):
+    """
+    Add (sign=1) or remove (sign=-1) the given stock transactions'
+    line items to the stock movement rollup.
+    """
+    ids = [stock_transaction_ids] if isinstance(stock_transaction_ids, str) else list(stock_transaction_ids)
+    if not ids:
+        return
+    where = f"st.id IN ({_placeholders(ids)})"
+    _apply(cur, "stock_movement_monthly_rollup", _STOCK_SOURCE, where, ids, sign)
+    _bump(cur, "stock")
+
+
+def remove_product(cur, product_id: str):
+    """Drop a product's order lines from the sales rollups (call before deleting them)."""
+    cur.execute("""
+        INSERT INTO sales_monthly_rollup
+        SELECT
+            DATE_TRUNC('month', ot.date_created) AS month,
+            ot.status_id,
+            0,
+            -SUM(oi.quantity),
+            0
+        FROM order_items oi
+        JOIN order_transactions ot ON ot.id = oi.order_id
+        WHERE oi.product_id = ?
+        GROUP BY 1, 2
+    """ + _UPSERT["sales_monthly_rollup"], (product_id,))
+    cur.execute("DELETE FROM product_sales_monthly_rollup WHERE product_id = ?", (product_id,))
+    _bump(cur, "sales")
+
+
+def remove_material(cur, material_id: str):
+    """Drop a material's stock lines from the stock movement rollup."""
+    cur.execute("DELETE FROM stock_movement_monthly_rollup WHERE material_id = ?", (material_id,))
+    _bump(cur, "stock")
+
+
+def rebuild_rollups(cur=None, through=None):
+    """
+    Recompute the rollups from the base tables.
+    With `through` (a datetime), only months up to and including the month
+    containing it are rebuilt; later months are left untouched.
+    """
+    if cur is None:
+        with db_cursor() as cur:
+            return rebuild_rollups(cur, through)
+
+    if through is None:
+        month_filter, params = "TRUE", ()
+    else:
+        month_filter, params = "month <= DATE_TRUNC('month', CAST(? AS TIMESTAMP))", (through,)
+
+    for table in ROLLUP_TABLES:
+        cur.execute(f"DELETE FROM {table} WHERE {month_filter}", params)
+
+    def source_filter(alias):
+        if through is None:
+            return "TRUE", ()
+        return (
+            f"{alias}.date_created < DATE_TRUNC('month', CAST(? AS TIMESTAMP)) + INTERVAL 1 MONTH",
+            (through,)
+        )
+
+    where, p = source_filter("ot")
+    cur.execute("INSERT INTO sales_monthly_rollup " + _SALES_SOURCE.format(sign=1, where=where), p * 2)
+    cur.execute("INSERT INTO product_sales_monthly_rollup " + _PRODUCT_SALES_SOURCE.format(sign=1, where=where), p)
+    where, p = source_filter("st")
+    cur.execute("INSERT INTO stock_movement_monthly_rollup " + _STOCK_SOURCE.format(sign=1, where=where), p)
+    for scope in VERSION_SCOPES:
+        _bump(cur, scope)
+
+
+def data_version(scope: str, cur=None):
+    """
+    Return (version, changed_at) for a scope ('sales' or 'stock').
+    Read it before the data it guards: a cache entry stored under this key can
+    then only be newer than the key, never older.
+    """
+    if cur is None:
+        with db_cursor() as cur:
+            return data_version(scope, cur)
+    row = cur.execute(
+        "SELECT version, changed_at FROM rollup_versions WHERE scope = ?", (scope,)
+    ).fetchone()
+    return tuple(row) if row else (0, None)
+
+
+if __name__ == "__main__":
+    run_migrations()
+    with db_cursor() as cur:
+        cur.execute("BEGIN")
+        rebuild_rollups(cur)
+        cur.execute("COMMIT")
+        counts = {t: cur.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ROLLUP_TABLES}
+    print("Rebuilt rollups: " + ", ".join(f"{t}={n}" for t, n in counts.items()))
@@ -0,0 +1,243 @@
+# stl_batch.py
+# Batch STL decomposition of monthly demand per product and per raw material.
+#
+# graphs.get_stl_fit() decomposes total monthly order quantity only. This job
+# builds one series per product (from product_sales_monthly_rollup) and one
+# per material (the same quantities exploded through product_materials), as
+# a series x month matrix from a single query per kind, and fits STL for
+# every series, on a process pool (STL_WORKERS, default: all cores) once
+# there are enough series to pay for starting it. Series spanning fewer
+# than MIN_MONTHS months from their first sale are skipped.
+#
+# Components are stored in stl_components (one row per series and month) and
+# a per-series summary in stl_series, so the Analytics page reads any SKU
+# without fitting anything. stl_batch_runs records the 'sales' rollup
+# version each kind was fitted at; refresh_in_background() refits when it
+# moved. Material series use the current bill of materials.
+#
+#   python -m backend.stl_batch      # refit everything now
+import os
+import threading
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.seasonal import STL
+
+from .connection import cursor as db_cursor
+from .migrations import run_migrations
+from .process_pool import map_in_processes
+from . import rollups
+
+PERIOD = 12
+MIN_MONTHS = 24
+STL_WORKERS = int(os.environ.get("STL_WORKERS", os.cpu_count() or 1))
+CHUNK_SIZE = 32   # series per task sent to a worker
+# One fit takes about a millisecond while starting a worker (importing
+# statsmodels) takes seconds, so small batches are fitted in-process
+PARALLEL_MIN_SERIES = int(os.environ.get("STL_PARALLEL_MIN_SERIES", 2000))
+
+KINDS = ("product", "material")
+
+# Monthly quantity per series; every order status, as the total STL
+_SERIES_SOURCE = {
+    "product": """
+        SELECT r.product_id AS series_id, r.month, SUM(r.total_quantity) AS quantity
+        FROM product_sales_monthly_rollup r
+        GROUP BY 1, 2
+    """,
+    "material": """
+        SELECT pm.material_id AS series_id, r.month, SUM(r.total_quantity * pm.used_quantity) AS quantity
+        FROM product_sales_monthly_rollup r
+        JOIN product_materials pm ON pm.product_id = r.product_id
+        GROUP BY 1, 2
+    """,
+}
+
+_running = threading.Lock()   # held while a batch runs
+
+
+def series_matrix(cur, kind: str):
+    """
+    (series ids, first month, matrix of shape series x months) for `kind`,
+    on a common month axis from the earliest to the latest month with sales.
+    """
+    rows = cur.execute(f"""
+        WITH series AS ({_SERIES_SOURCE[kind]}),
+        axis AS (SELECT MIN(month) AS first_month FROM series)
+        SELECT series_id, DATE_DIFF('month', axis.first_month, month) AS col_idx, quantity, axis.first_month
+        FROM series, axis
+    """).fetchnumpy()
+    if len(rows["series_id"]) == 0:
+        return np.array([], dtype=object), None, np.zeros((0, 0))
+
+    ids, row_idx = np.unique(rows["series_id"].astype(str), return_inverse=True)
+    col_idx = rows["col_idx"].astype(np.intp)
+    matrix = np.zeros((len(ids), col_idx.max() + 1))
+    matrix[row_idx, col_idx] = rows["quantity"]
+    return ids, pd.Timestamp(rows["first_month"][0]), matrix
+
+
+def _fit_chunk(chunk):
+    """Worker: STL components for each 1-d array in `chunk`."""
+    fitted = []
+    for values in chunk:
+        result = STL(values, period=PERIOD).fit()
+        fitted.append((result.trend, result.seasonal, result.resid))
+    return fitted
+
+
+def _strength(component, resid):
+    # Share of variation explained by a component (Hyndman & Athanasopoulos, FPP 6.7)
+    total = np.var(component + resid)
+    return float(max(0.0, 1 - np.var(resid) / total)) if total > 0 else 0.0
+
+
+def fit_all(series: list, workers: int = STL_WORKERS):
+    """Fit STL for every array in `series`, across `workers` processes for large batches."""
+    chunks = [series[i:i + CHUNK_SIZE] for i in range(0, len(series), CHUNK_SIZE)]
+    if workers <= 1 or len(series) < PARALLEL_MIN_SERIES:
+        return [fit for chunk in chunks for fit in _fit_chunk(chunk)]
+    return [fit for fitted in map_in_processes(_fit_chunk, chunks, workers) for fit in fitted]
+
+
+def decompose(cur, kind: str):
+    """Return (components, summary) DataFrames for every long-enough series of `kind`."""
+    ids, first_month, matrix = series_matrix(cur, kind)
+
+    selected, series = [], []
+    for series_id, values in zip(ids, matrix):
+        nonzero = np.flatnonzero(values)
+        if len(nonzero) and len(values) - nonzero[0] >= MIN_MONTHS:
+            selected.append((series_id, nonzero[0]))
+            series.append(values[nonzero[0]:])
+
+    components, summary = [], []
+    for (series_id, start), values, (trend, seasonal, resid) in zip(selected, series, fit_all(series)):
+        months = pd.date_range(first_month + pd.DateOffset(months=int(start)), periods=len(values), freq="MS")
+        components.append(pd.DataFrame({
+            "kind": kind, "series_id": series_id, "month": months,
+            "observed": values, "trend": trend, "seasonal": seasonal, "resid": resid,
+        }))
+        summary.append({
+            "kind": kind, "series_id": series_id, "first_month": months[0], "months": len(values),
+            "trend_strength": _strength(trend, resid),
+            "seasonal_strength": _strength(seasonal, resid),
+            "trend_change": float(trend[-1] - trend[-PERIOD - 1]),
+        })
+
+    components = pd.concat(components, ignore_index=True) if components else None
+    return components, pd.DataFrame(summary)
+
+
+def run_batch(kinds=KINDS):
+    """Refit and store the components of every kind. Returns {kind: series count}."""
+    counts = {}
+    with _running, db_cursor() as cur:
+        for kind in kinds:
+            version = rollups.data_version("sales", cur)[0]
+            components, summary = decompose(cur, kind)
+
+            cur.execute("BEGIN")
+            try:
+                cur.execute("DELETE FROM stl_components WHERE kind = ?", (kind,))
+                cur.execute("DELETE FROM stl_series WHERE kind = ?", (kind,))
+                if components is not None:
+                    cur.register("stl_component_rows", components)
+                    cur.register("stl_series_rows", summary)
+                    try:
+                        cur.execute("INSERT INTO stl_components SELECT * FROM stl_component_rows")
+                        cur.execute("INSERT INTO stl_series SELECT * FROM stl_series_rows")
+                    finally:
+                        cur.unregister("stl_component_rows")
+                        cur.unregister("stl_series_rows")
+                cur.execute("""
+                    INSERT INTO stl_batch_runs VALUES (?, ?, ?, ?)
+                    ON CONFLICT (kind) DO UPDATE SET
+                        sales_version = EXCLUDED.sales_version,
+                        fitted_at = EXCLUDED.fitted_at,
+                        series_count = EXCLUDED.series_count
+                """, (kind, version, datetime.now(), len(summary)))
+                cur.execute("COMMIT")
+            except Exception:
+                cur.execute("ROLLBACK")
+                raise
+            counts[kind] = len(summary)
+    return counts
+
+
+def is_stale(kind: str, cur=None) -> bool:
+    """True if `kind` was never fitted or orders changed since."""
+    if cur is None:
+        with db_cursor() as cur:
+            return is_stale(kind, cur)
+    row = cur.execute("SELECT sales_version FROM stl_batch_runs WHERE kind = ?", (kind,)).fetchone()
+    return row is None or row[0] != rollups.data_version("sales", cur)[0]
+
+
+def refresh_in_background() -> bool:
+    """Start a refit thread if any kind is stale and none is running. Returns True if started."""
+    if _running.locked() or not any(is_stale(kind) for kind in KINDS):
+        return False
+
+    def run():
+        try:
+            run_batch()
+        except Exception as e:
+            print(f"STL batch failed: {e}")
+
+    threading.Thread(target=run, name="stl-batch", daemon=True).start()
+    return True
+
+
+# Display name of each series
+_SERIES_NAMES = {
+    "product": "SELECT p.id, i.item_name FROM products p JOIN items i ON i.id = p.item_id",
+    "material": "SELECT m.id, i.item_name FROM materials m JOIN items i ON i.id = m.item_id",
+}
+
+
+def list_series(kind: str, cur=None):
+    """Summary rows of every decomposed series of `kind`, strongest seasonality first."""
+    if cur is None:
+        with db_cursor() as cur:
+            return list_series(kind, cur)
+    return cur.execute(f"""
+        SELECT s.series_id, n.item_name AS name, s.first_month, s.months,
+               ROUND(s.trend_strength, 3) AS trend_strength,
+               ROUND(s.seasonal_strength, 3) AS seasonal_strength,
+               ROUND(s.trend_change, 2) AS trend_change
+        FROM stl_series s
+        LEFT JOIN ({_SERIES_NAMES[kind]}) n(id, item_name) ON n.id = s.series_id
+        WHERE s.kind = ?
+        ORDER BY s.seasonal_strength DESC, s.series_id
+    """, (kind,)).fetchdf()
+
+
+def get_series(kind: str, series_id: str, cur=None):
+    """Monthly observed/trend/seasonal/resid of one series, or an empty frame."""
+    if cur is None:
+        with db_cursor() as cur:
+            return get_series(kind, series_id, cur)
+    return cur.execute("""
+        SELECT month, observed, trend, seasonal, resid
+        FROM stl_components
+        WHERE kind = ? AND series_id = ?
+        ORDER BY month
+    """, (kind, series_id)).fetchdf()
+
+
+def last_run(kind: str, cur=None):
+    """(fitted_at, series_count) of the last batch for `kind`, or None."""
+    if cur is None:
+        with db_cursor() as cur:
+            return last_run(kind, cur)
+    return cur.execute(
+        "SELECT fitted_at, series_count FROM stl_batch_runs WHERE kind = ?", (kind,)
+    ).fetchone()
+
+
+if __name__ == "__main__":
+    run_migrations()
+    for kind, count in run_batch().items():
+        print(f"{kind}: {count} series decomposed")
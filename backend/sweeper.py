@@ -0,0 +1,84 @@
+# sweeper.py
+# Periodic cleanup of generated files left on disk.
+#
+# Receipts, quotations, live reports and report archives are rendered in
+# memory and sent as the response body, so requests no longer leave files
+# behind. What remains is swept here, every SWEEP_SECONDS, by a background
+# thread started with the app:
+#
+#   pdf_container/*.pdf       receipts written by earlier builds
+#   reports/*.pdf, *.zip      report downloads written by earlier builds
+#   <report store>/*.tmp      half-written store files of an interrupted sync
+#   <logo store>/*.tmp        half-written logos of an interrupted upload
+#
+# Files younger than MAX_AGE_SECONDS are left alone. The report store's own
+# JSON/PDF files are managed by report_store.sync(), and registered logos
+# are kept; neither is touched here.
+#
+#   python -m backend.sweeper        # sweep once now
+import os
+import threading
+import time
+
+from . import report_store, logo_store
+
+SWEEP_SECONDS = float(os.environ.get("SWEEP_INTERVAL", 3600))
+MAX_AGE_SECONDS = float(os.environ.get("SWEEP_MAX_AGE", 600))
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# (directory, file name suffixes to remove)
+TARGETS = (
+    (os.path.join(BASE_DIR, "..", "pdf_container"), (".pdf",)),
+    ("reports", (".pdf", ".zip")),
+    (report_store.STORE_DIR, (".tmp",)),
+    (logo_store.LOGO_DIR, (".tmp",)),
+)
+
+_lock = threading.Lock()
+_started = False
+
+
+def sweep(now: float = None) -> int:
+    """Remove the expired files of every target. Returns how many were removed."""
+    now = time.time() if now is None else now
+    removed = 0
+    for directory, suffixes in TARGETS:
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if not entry.name.endswith(suffixes) or not entry.is_file():
+                    continue
+                try:
+                    if now - entry.stat().st_mtime > MAX_AGE_SECONDS:
+                        os.remove(entry.path)
+                        removed += 1
+                except OSError as e:
+                    print(f"Failed to remove old file: {entry.path}, error: {e}")
+    return removed
+
+
+def _run():
+    while True:
+        try:
+            removed = sweep()
+            if removed:
+                print(f"Sweeper: removed {removed} old files")
+        except Exception as e:
+            print(f"Sweep failed: {e}")
+        time.sleep(SWEEP_SECONDS)
+
+
+def start():
+    """Start the sweeper thread (once per process); it sweeps right away."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, name="sweeper", daemon=True).start()
+
+
+if __name__ == "__main__":
+    print(f"Removed {sweep()} files")
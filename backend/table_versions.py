@@ -0,0 +1,43 @@
+# table_versions.py
+# Per-table versions of the catalog tables, which http_cache.py derives the
+# ETags of the reference/catalog endpoints from.
+#
+# database.log_audit() records a change to the audited entity on the same
+# cursor as the write, so it commits or rolls back with it; the few writes
+# that can go unaudited record theirs explicitly. Changes are appended to
+# table_changes, which is insert-only so concurrent writers never conflict
+# on it (a shared counter row would make any two writes to the same table
+# conflict). A table's version is the seq of its latest change. Tables the
+# app never writes (unit_measurements, order_statuses, ...) have no changes
+# and keep version 0.
+from .connection import cursor as db_cursor
+
+# Audit entities that are versioned
+TABLES = (
+    "customers",
+    "suppliers",
+    "materials",
+    "material_categories",
+    "products",
+    "product_categories",
+    "product_materials",
+    "order_transactions",
+    "stock_transactions",
+)
+
+def bump(cur, table: str):
+    """Record a change to `table`. Call on the write's cursor, before COMMIT; unknown names are ignored."""
+    if table in TABLES:
+        cur.execute("INSERT INTO table_changes (table_name) VALUES (?)", (table,))
+
+
+def versions(tables, cur=None):
+    """Current version of each of `tables`, in order (0 for tables without changes)."""
+    if cur is None:
+        with db_cursor() as cur:
+            return versions(tables, cur)
+    found = dict(cur.execute(
+        "SELECT table_name, MAX(seq) FROM table_changes WHERE list_contains(?, table_name) GROUP BY table_name",
+        (list(tables),)
+    ).fetchall())
+    return tuple(found.get(table, 0) for table in tables)
@@ -0,0 +1,45 @@
+// charts.js
+// Draws the Plotly figure JSON produced by graphs.py. Pages embed it as
+//   <div class="plotly-chart"><script type="application/json">{...}</script></div>
+// (graphs.chart_embed), or fetch it from /api/charts/<name>.
+// Needs plotly.js loaded first; main.py serves it from /js/plotly.min.js.
+(function () {
+  const CONFIG = { responsive: true };
+
+  function plot(el, figure) {
+    const target = document.createElement('div');
+    el.appendChild(target);
+    return Plotly.newPlot(target, figure.data, figure.layout, CONFIG);
+  }
+
+  // Plot every embedded figure under `root` that has not been drawn yet
+  function render(root) {
+    (root || document).querySelectorAll('.plotly-chart:not([data-plotted])').forEach(el => {
+      const source = el.querySelector('script[type="application/json"]');
+      if (!source) return;
+      el.dataset.plotted = '1';
+      try {
+        plot(el, JSON.parse(source.textContent));
+      } catch (error) {
+        el.innerHTML = '<p class="chart-loading">Chart unavailable.</p>';
+        console.error('Error drawing chart:', error);
+      }
+    });
+  }
+
+  // Fetch /api/charts/<name> and plot it into `el`
+  function load(el, name) {
+    return fetch(`/api/charts/${name}`, { credentials: 'same-origin' })
+      .then(response => {
+        if (!response.ok) throw new Error(`HTTP ${response.status}`);
+        return response.json();
+      })
+      .then(figure => {
+        el.innerHTML = '';
+        return plot(el, figure);
+      });
+  }
+
+  window.TimestockCharts = { render, load };
+  document.addEventListener('DOMContentLoaded', () => render(document));
+})();